@@ -2,23 +2,11 @@
 # Licensed under GPLv3
 import datetime
 import argparse
-import calendar
 import os.path
-import decimal
-import string
-import json
 import sys
-import csv
 import os
 import glob
 
-try:
-    # python 2
-    from StringIO import StringIO
-except ImportError:
-    # python 3
-    from io import StringIO
-
 # Ensure that we look for any modules in our local lib dir.  This allows simple
 # testing and development use.  It also does not break the case where the lib
 # has been installed properly on the normal sys.path
@@ -30,6 +18,14 @@ sys.path.insert(0,
 # Stupid pyflake, neither of these imports can be before the sys.path
 from row import Row # noqa
 from rowset import RowSet # noqa
+from ledger import Ledger # noqa
+import render # noqa
+import timings # noqa
+
+# Anything only needed by some of the sub-commands or options is imported
+# where it is used.  A quick "party" or "sum" probe should spend its time
+# reading the ledger, not importing code it never runs.  Check with:
+#   ./benchmark.py --startup
 
 # TODO
 # - Implement a running balance check - perhaps using pragma lines in
@@ -42,233 +38,36 @@ from rowset import RowSet # noqa
 
 FILES_DIR = 'cash'
 
-# Ensure we do not invent more money
-decimal.getcontext().rounding = decimal.ROUND_DOWN
-
-
-class HKT(datetime.tzinfo):
-
-    def utcoffset(self, dt):
-        return datetime.timedelta(hours=8)
+# The reports themselves are made by the Ledger class in lib/ledger.py and
+# rendered as text by lib/render.py, this file is only the commandline shell
+# around them
 
-    def tzname(self, dt):
-        return "HKT"
 
-    def dst(self, dt):
-        return datetime.timedelta(hours=0)
-
-
-def _iso8601_str(dt):
-    """Why oh why is this so hard to do?
+def args_ledger(args):
+    """Return a Ledger over the rows already loaded for the sub-command
     """
-    # now = datetime.datetime.now()
-    # now_timestamp = now.timestamp()
-    # utc_horror = datetime.datetime.utcfromtimestamp( now_timestamp ).timestamp() # noqa
-    # delta_min = (now_timestamp - utc_horror) //60
-    # sign="+"
-    # if (delta_min<0):
-    #     sign="-"
-    #     delta_min = abs(delta_min)
-
-    # delta_hr = delta_min /60.0
-    # delta_min = (int(delta_hr) - delta_hr) * 60
-    # delta_hr = int(delta_hr)
-    # delta_str = sign+"{:02d}:{:02d}".format(delta_hr, delta_min)
-
-    # Ideally, this would work, but the HKT class needs ... something ...
-    # dt = dt.replace(tzinfo=HKT())
-    # return dt.replace(microsecond=0).isoformat()
-
-    dt = dt.replace(microsecond=0)
-    dt = dt + datetime.timedelta(hours=8)
-    timezone_str = "+08:00"
-    return dt.strftime('%FT%T') + timezone_str
-
-
-def parse_dir(dirname):   # pragma: no cover
-    '''Take all files in dirname and return a RowSet with their contents'''
-
-    result = RowSet()
-    for filename in glob.glob(os.path.join(dirname, "*.txt")):
-        this = RowSet()
-        this.load_file(filename)
-        # TODO - eventually, we should be able to simply deal with the
-        # rowset, but for now, we manually split it apart
-        for entry in this:
-            result.append(entry)
-
-    return result
-
-
-def render_month(date):
-    """Return a short string representation of the date as a month
-    """
-    if isinstance(date, datetime.date):
-        return date.strftime('%Y-%m')
-
-    # Awkwardly, if we want to have a "Total" month or a "Average"
-    # month, everything works except for this render_month function
-    # TODO - fix this in a cleaner way
-    return date
+    return Ledger.from_rows(args.rows, args.engine, args.stats_cache)
 
 
-def render_month_len():
-    """how much room to allow for each month column
+def args_report(args, report, **kwargs):
+    """Run the named Ledger report for the sub-command.  With --sqlite or
+       --load_binary (or in a server worker), the sub-commands that can have
+       the database or the binary columns add up the values have no rows
+       loaded, and their report is run on that ledger instead (see
+       load_rows() and ReportServer.run())
     """
-    # TODO - this should eventually move into some rendering code
-    return 9
-
-
-def grid_accumulate(rows):
-    """Accumulate the rows into month+tag buckets
-    """
-    grid = {}
-    totals = {}
-    months_present = set()
-
-    months = rows.group_by('month')
-    for month in months:
-        months_present.add(month)
-        totals[month] = months[month].value
-
-        tags = months[month].group_by('hashtag')
-
-        for tag in tags:
-            # I would prefer auto-vivification to all these if statements
-            if tag not in grid:
-                grid[tag] = {}
-
-            grid[tag][month] = {}
-            grid[tag][month]['sum'] = tags[tag].value
-
-    totals['total'] = rows.value
+    if args.ledger is not None:
+        return getattr(args.ledger, report)(args.split, args.filter, **kwargs)
+    return getattr(args_ledger(args), report)(**kwargs)
 
-    running_totals = {}
-    running_total = 0
-    for month in sorted(months_present):
-        running_total += totals[month]
 
-        # if we have only zeros after the decimal, change to an int
-        if int(running_total) == running_total:
-            running_total = running_total.to_integral_exact()
+def topay_render(rows, strings, engine='python'):
+    data = Ledger.from_rows(rows, engine).topay()
 
-        running_totals[month] = running_total
-
-    return months_present, grid, totals, running_totals
-
-
-def grid_render_onerow(prefix, prefix_len, rowdata, cell_len):
-    s = []
-
-    s += "{:<{width}}".format(prefix, width=prefix_len)
-
-    for cell in rowdata:
-        s += "{:>{}}".format(cell, cell_len)
-
-    s += "\n"
-
-    return s
-
-
-def grid_render_colheader(months, months_len, tags_len):
-    return grid_render_onerow(
-        ' ', tags_len,
-        [render_month(x) for x in months], months_len
-    )
-
-
-def grid_render_totals(months, totals, months_len, tags_len, running_totals):
-    """
-    months is a set of months (as datetime.date objects) that we want to render
-    totals is a dictionary of the isolated month total
-    months_len is the width needed to render one month column
-    tags_len is the width needed to show the longest tag
-    """
-    s = []
-
-    s += "\n"
-    s += grid_render_onerow(
-        'MONTH Sub Total', tags_len,
-        [totals[x] for x in months], months_len
-    )
-
-    s += grid_render_onerow(
-        'RUNNING Balance', tags_len,
-        [running_totals[x] for x in months], months_len
-    )
-
-    s += "TOTAL: {:>{}}".format(totals['total'], months_len)
-
-    return s
-
-
-def grid_render_rows(months, tags, grid, months_len, tags_len):
-    s = []
-
-    tags = sorted(tags)
-
-    # Output each tag on its own row
-    for tag in tags:
-        cells = []
-        for month in months:
-            if month in grid[tag]:
-                cells.append(grid[tag][month]['sum'])
-            else:
-                cells.append('')
-
-        s += grid_render_onerow(
-            tag, tags_len,
-            cells, months_len
-        )
-
-    return s
-
-
-def grid_render(months, tags, grid, totals, running_totals):
-    # Render the accumulated data
-
-    tags_len = max([len(i) for i in tags])+1
-    months_len = render_month_len()
-    months = sorted(months)
-
-    s = []
-    s += grid_render_colheader(months, months_len, tags_len)
-    s += grid_render_rows(months, tags, grid, months_len, tags_len)
-    s += grid_render_totals(
-            months, totals, months_len, tags_len, running_totals)
-
-    return ''.join(s)
-
-
-def topay_render(rows, strings):
-    rows = rows.filter(['direction==outgoing'])
-    alltags = sorted(rows.group_by('hashtag').keys())
-
-    months = rows.group_by('month')
-
-    s = []
-    for month in sorted(months):
-        s.append(strings['header'].format(date=render_month(month)))
-        s.append("\n")
-        s.append(strings['table_start'])
-        s.append("\n")
-
-        monthtags = months[month].group_by('hashtag')
-        for hashtag in alltags:
-            if hashtag in monthtags:
-                price = monthtags[hashtag].value
-                date = monthtags[hashtag].last().date
-            else:
-                price = "$0"
-                date = "Not Yet"
-
-            s.append(strings['table_row'].format(hashtag=hashtag.capitalize(),
-                                                 price=price, date=date))
-            s.append("\n")
-        s.append(strings['table_end'])
-        s.append("\n")
-
-    return ''.join(s)
+    with timings.phase('render') as t:
+        t['rows_out'] = len(data['months']) * len(data['tags'])
+        return render.topay_render(data['tags'], data['months'],
+                                   data['cells'], strings)
 
 
 #
@@ -280,7 +79,7 @@ def topay_render(rows, strings):
 
 
 def subp_sum(args):
-    result = args.rows.value
+    result = args_report(args, 'sum')
     # Only check the result for validity here and not in the class as
     # the RowSet could be storing a virtual account in other places
     if result < 0:
@@ -296,7 +95,7 @@ def subp_topay(args):
         'table_end': '',
         'table_row': "{hashtag:<23}\t{price}\t{date}",
     }
-    return topay_render(args.rows, strings)
+    return topay_render(args.rows, strings, args.engine)
 
 
 def subp_topay_html(args):
@@ -311,72 +110,68 @@ def subp_topay_html(args):
         <td>{hashtag}</td><td>{price}</td><td>{date}</td>
     </tr>''',
     }
-    return topay_render(args.rows, strings)
+    return topay_render(args.rows, strings, args.engine)
 
 
 def subp_party(args):
-    balance = args.rows.value
+    balance = args_ledger(args).sum()
     return "Success" if balance > 0 else "Fail"
 
 
 def subp_csv(args):
+    import csv
+    try:
+        # python 2
+        from StringIO import StringIO
+    except ImportError:
+        # python 3
+        from io import StringIO
+
     rows = RowSet()
     rows.append(sorted(args.rows, key=lambda x: x.date))
 
-    buf = StringIO()
-    writer = csv.writer(buf)
+    with timings.phase('render', len(rows)) as t:
+        buf = StringIO()
+        writer = csv.writer(buf)
 
-    # Write header
-    writer.writerow([row.capitalize() for row in Row._fields])
+        # Write header
+        writer.writerow(['Value', 'Date', 'Comment'])
 
-    writer.writerows(rows)
+        writer.writerows([(row.value, row.date, row.comment) for row in rows])
 
-    writer.writerow('')
-    writer.writerow(('Sum',))
-    writer.writerow((rows.value,))
+        writer.writerow('')
+        writer.writerow(('Sum',))
+        writer.writerow((rows.value,))
+        t['rows_out'] = len(rows)
     return buf.getvalue()
 
 
 def subp_grid(args):
-    # ensure that each category has a nice and clear prefix
-    for row in args.rows:
-        if row.hashtag is None:
-            row.hashtag = 'unknown'
-
-        # Most of the time, the in and out with either be
-        # one-way or balance each other out to zero.  So,
-        # we can avoid the extra lines to separate them.
-        #
-        # Occasionally, we might want to dig into the flow
-        # to see where some strange number comes from
-        if args.separate_inout:
-            if row.direction == 'outgoing':
-                row.hashtag = row.hashtag + ' out'
-            else:
-                row.hashtag = row.hashtag + ' in'
-
-    (months, grid, totals, running_totals) = grid_accumulate(args.rows)
-
-    # FIXME - tags contains entries that might be filtered
-    tags = args.rows.group_by('hashtag').keys()
+    data = args_report(args, 'grid', separate_inout=args.separate_inout,
+                       by_account=args.by_account)
 
+    months = data['months']
     if args.filter_hack:
         today = datetime.date.today()
         oldest = today - datetime.timedelta(args.filter_hack)
 
         months = [month for month in months if month > oldest]
 
-    return grid_render(months, tags, grid, totals, running_totals)
+    with timings.phase('render') as t:
+        t['rows_out'] = len(months) * len(data['tags'])
+        return render.grid_render(months, data['tags'], data['grid'],
+                                  data['totals'], data['running_totals'])
 
 
 def subp_json_payments(args):
+    import json
 
-    payments = args.rows.filter(['direction==incoming']).group_by('hashtag')
-
-    r = {}
-    for tag, payment in payments.items():
-        r[tag] = render_month(payment.last().date)
-    return json.dumps((r))
+    payments = args_ledger(args).payments()
+    with timings.phase('render', len(payments)):
+        r = {}
+        for tag, date in payments.items():
+            r[tag] = render.render_month(date)
+        return json.dumps((r))
 
 
 def subp_make_balance(args):
@@ -386,278 +181,452 @@ def subp_make_balance(args):
                            './docs/template.html')) as f:
         tpl = f.read()
 
-    # Filter out only the membership dues
-    grid_rows = args.rows.filter([
-        'direction==incoming',
-        'hashtag=~^dues:',
-        'rel_months>-5',
-        'rel_months<1',
-    ])
-
-    # Make the category look pretty
-    for row in grid_rows:
-        a = row.hashtag.split(':')
-        row.hashtag = ''.join(a[1:]).title()
-
-    (months, grid, totals, running_totals) = grid_accumulate(grid_rows)
-    tags = grid_rows.group_by('hashtag').keys()
-    months = sorted(months)
-
-    months_len = render_month_len()
-    tags_len = max([len(i) for i in tags])+1
-
-    header = ''.join(grid_render_colheader(months, months_len, tags_len))
-    grid = ''.join(grid_render_rows(months, tags, grid, months_len, tags_len))
-
-    def _get_next_rent_month():
-        last_payment = args.rows.group_by('hashtag')['bills:rent'].last()
-        date = last_payment.date
-
-        # The landlord states that "the monthly rental payment should
-        # be settled seven (7) days in advance prior to the 1st day of
-        # each and every rental month"
-        #
-        # Implement business logic to find this date
-        #
-        # assuming the rent transactions have been placed into the
-        # month that they are paying the rent for, we can find the date
-        # that the rent is next due by clamping the day to seven days
-        # before the end of the month
-
-        # set to the due date during at the end of the month
-        date = date.replace(
-            day=calendar.monthrange(date.year, date.month)[1] - 7
-        )
-
-        return date
-
-    macros = {
-        'balance_sum': args.rows.value,
-        'grid_header': header,
-        'grid':        grid,
-        'rent_due':    _get_next_rent_month(),
-        'time_now':    _iso8601_str(datetime.datetime.utcnow()),
-    }
-    return string.Template(tpl).substitute(macros)
-
+    return args_ledger(args).balance_html(tpl)
 
-def create_stats(args):
-    # stats are only likely to be valid for previous months
-    rows = args.rows.filter(['rel_months<0'])
-    current_month = args.rows.filter(['rel_months==0'])
 
-    def make_rowset(value):
-        r = RowSet()
-        r.append(Row(value, '1970-01-01', 'fake row'))
-        return r
+def stats_by_account(args, render_func):
+    """Render the stats of the rows of each account in turn, each one
+       after a line with the account name
+    """
+    output = []
+    accounts = args.rows.group_by('account')
+    for account in sorted(accounts):
+        result, months = Ledger.from_rows(accounts[account],
+                                          args.engine).stats()
+        with timings.phase('render', len(months)):
+            output.append('{}:\n{}'.format(
+                account, render_func(result, months)))
+    return '\n'.join(output)
 
-    def stats_rowset(rowset):
-        r = {}
-        r['incoming'] = rowset.filter(['value>0'])
-        r['outgoing'] = rowset.filter(['value<0'])
-        # TODO - values of zero?  we have one member as such, but it is a
-        # exceptional case
-        r['dues']     = rowset.filter(['hashtag=~^dues:']) # noqa
-        r['members']  = len(r['dues'].group_by('hashtag').keys()) # noqa
-        if r['members']:
-            r['ARPM'] = int(r['dues'].value / r['members']) # noqa
-        else:
-            r['ARPM'] = -1
 
-        r['other']    = rowset.filter(['value>0','hashtag!~^dues:']) # noqa
+def subp_statstsv(args):
+    if args.by_account:
+        return stats_by_account(args, render.statstsv_render)
+    result, months = args_ledger(args).stats()
+    with timings.phase('render', len(months)):
+        return render.statstsv_render(result, months)
 
-        return r
 
-    result = {}
-    months = rows.group_by('month')
-    for k, month in months.items():
-        result[k] = stats_rowset(month)
+def subp_stats(args):
+    if args.by_account:
+        return stats_by_account(args, render.stats_render)
+    result, months = args_ledger(args).stats()
+    with timings.phase('render', len(months)):
+        return render.stats_render(result, months)
+
+
+def subp_transfers(args):
+    # A transfer is only visible when each side is in a different account,
+    # so this needs the rows of several accounts (see --account)
+    import federation
+    pairs = federation.transfers(args.rows, args.days)
+    with timings.phase('render', len(args.rows)) as t:
+        t['rows_out'] = len(pairs)
+        return '\n'.join(
+            '{} {} {} -> {} {}: {} / {}'.format(
+                out.date, -out.value, out.account, into.account, into.date,
+                out.comment, into.comment)
+            for out, into in pairs)
+
+
+def subp_reconcile(args):
+    # The statement lists what actually happened, so it is matched against
+    # the original rows, not the split ones
+    import reconcile
+    with open(args.statement) as f:
+        lines = reconcile.load_statement(
+            f, args.date_column, args.amount_column, args.description_column,
+            args.date_format)
+
+    args.split = False
+    load_rows(args)
+    with timings.phase('aggregation', len(args.rows) + len(lines)) as t:
+        result = reconcile.reconcile(args.rows, lines, args.days)
+        t['rows_out'] = len(result['matched'])
+    with timings.phase('render'):
+        return reconcile.render(result)
+
+
+def subp_dupes(args):
+    # Duplicates are entered as original rows, so the split ones are not
+    # looked at.  The rows are listed with the file (or account) they are in
+    import dupes
+    if args.account:
+        import federation
+        rows, _ = federation.load(
+            federation.parse_accounts(args.account), False)
+        items = [(row.account, row) for row in rows]
+    else:
+        items = dupes.file_rows(Ledger(args.dir).files())
+
+    if args.filter:
+        items = [
+            (source, row) for source, row in items
+            if all(row.filter(x) for x in args.filter)
+        ]
+    groups = dupes.find(items, args.days)
+    if not groups:
+        return 'No duplicates found'
+    return dupes.render(groups)
+
+
+def check_dupes(items):
+    """Warn about any possible duplicates in the list of (source, row)
+    """
+    import dupes
+    with timings.phase('dupes', len(items)) as t:
+        groups = dupes.find(items)
+        t['rows_out'] = len(groups)
+    for group in groups:
+        sys.stderr.write('Warning: possible duplicate rows:\n{}\n'.format(
+            dupes.render([group])))
+
+
+def subp_lint(args):
+    # Exits with an error if there were any problems, so that it can be
+    # used as a pre-commit hook
+    import lint
+    with timings.phase('lint') as t:
+        count, errors = lint.lint(args.dir)
+        t['rows_out'] = len(errors)
+    if errors:
+        args.failed = True
+        return '\n'.join(errors)
+    return 'No problems found in {} files'.format(count)
+
+
+def subp_members(args):
+    # Not served or cached as a report, as it can read the door list from
+    # any local file
+    import csv
+    try:
+        # python 2
+        from StringIO import StringIO
+    except ImportError:
+        # python 3
+        from io import StringIO
+    import members
+
+    door = None
+    if args.door:
+        with open(args.door) as f:
+            door = members.load_door(
+                f, args.door_handle_column, args.door_activity_column)
+
+    load_rows(args)
+    with timings.phase('aggregation', len(args.rows)) as t:
+        header, lines = members.table(args.rows, datetime.date.today(), door)
+        t['rows_out'] = len(lines)
+
+    with timings.phase('render'):
+        buf = StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(header)
+        writer.writerows(lines)
+        return buf.getvalue()
+
+
+def subp_cohorts(args):
+    # Paying for several months at once keeps a member for each of those
+    # months, so the split rows are always used
+    import csv
+    try:
+        # python 2
+        from StringIO import StringIO
+    except ImportError:
+        # python 3
+        from io import StringIO
+    import cohorts
+
+    args.split = True
+    if args.state and not args.filter and not args.account and \
+            not args.load_binary and not args.sqlite:
+        # only the files changed since the state was saved are loaded
+        with timings.phase('index') as t:
+            state = cohorts.CohortState(args.state)
+            t['rows_out'] = len(state.refresh(args.dir))
+        with timings.phase('aggregation') as t:
+            members = state.members()
+            t['rows_out'] = len(members)
+    else:
+        load_rows(args)
+        with timings.phase('aggregation', len(args.rows)) as t:
+            members = cohorts.presence(args.rows)
+            t['rows_out'] = len(members)
+
+    with timings.phase('render'):
+        header, lines = cohorts.table(members)
+        buf = StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(header)
+        writer.writerows(lines)
+        return buf.getvalue()
+
+
+def subp_forecast(args):
+    # The bills are found in the nosplit rows, so that one paid for several
+    # months at once is seen to be paid that often.  The balance and the
+    # members use the split rows
+    import forecast
+    from cohorts import month_index
+
+    args.split = False
+    load_rows(args)
+    start = month_index(datetime.date.today())
+
+    with timings.phase('aggregation', len(args.rows)):
+        split = args.rows.autosplit()
+        balance = sum(
+            row.cents for row in split if month_index(row.date) < start)
+        bills = forecast.recurring_bills(args.rows, start, args.history)
+        members = forecast.membership(split, start, args.history)
+        costs = forecast.costs(bills, start, args.months)
+        runway, balances = forecast.simulate(
+            balance, costs, members, args.scenarios, args.seed,
+            args.engine == 'numpy')
+
+    with timings.phase('render'):
+        return forecast.render(start, balance, bills, members, runway,
+                               balances, args.scenarios)
+
+
+def subp_export_binary(args):
+    # The binary file holds the whole ledger - both the original rows and
+    # their split children - so it is built from the unfiltered input
+    import binledger
+    rows = Ledger(args.dir).rows(split=False)
+    binledger.write_file(args.file, rows)
+    return "Wrote {} rows to {}".format(len(rows), args.file)
+
+
+def subp_archive(args):
+    # The old months never change, so compress them.  The total and lint
+    # problems of each file loaded here are recorded, so that the next
+    # archive or lint run can skip any archived file that still has the
+    # same digest
+    import ledgerfiles
+    import lint
+
+    def load(filename):
+        rows = RowSet()
+        rows.load_file(filename)
+        return {
+            'total': rows.cents,
+            'opening_balance': rows.opening_balance,
+            'problems': lint.file_problems(filename),
+        }
+
+    today = datetime.date.today()
+    month = today.year * 12 + today.month - 1 - args.months
+    actions = ledgerfiles.archive(
+        args.dir,
+        (month // 12, month % 12 + 1),
+        '.' + args.format,
+        load,
+    )
+    if not actions:
+        return 'Nothing to archive'
+    return '\n'.join('{} {}'.format(*x) for x in actions)
 
-    months = sorted(result.keys())
 
-    result['Total'] = stats_rowset(rows)
+def subp_rollup(args):
+    # Only the years before this one are closed
+    import rollup
+    actions = rollup.update(args.dir, args.output, datetime.date.today().year)
+    if not actions:
+        return 'No closed years'
+    return '\n'.join('{} {}'.format(*x) for x in actions)
 
-    result['Average'] = {}
-    for tag in ('outgoing', 'incoming', 'dues', 'other'):
-        result['Average'][tag] = make_rowset(
-            result['Total'][tag].value / len(months))
-    result['Average']['members'] = int(sum(
-        [result[x]['members'] for x in months]
-    ) / len(months))
-    result['Average']['ARPM'] = int(
-        result['Total']['dues'].value /
-        result['Average']['members'] /
-        len(months)
-    )
 
-    result['MonthTD'] = stats_rowset(current_month)
+def subp_search(args):
+    # The index finds the comments and the files they are in, so only those
+    # files are loaded
+    import commentindex
+    from ledgerdir import load_files
 
-    months.append('Average')
-    months.append('MonthTD')
-    months.append('Total')
+    index = commentindex.CommentIndex(args.comment_index)
+    with timings.phase('index'):
+        index.refresh(args.dir)
+        names, comments = index.search(args.terms)
 
-    balance = 0
-    for month in months:
-        result[month]['subtotal'] = (
-            result[month]['incoming'].value
-            + result[month]['outgoing'].value
-        )
-        balance += result[month]['subtotal']
-        result[month]['balance'] = balance
+    rows = load_files(
+        [os.path.join(args.dir, x) for x in sorted(names)], args.split)
+    rows = rows.filter(args.filter)
+    return '\n'.join(str(row) for row in rows if row.comment in comments)
 
-    return result, months
 
+def subp_serve(args):  # pragma: no cover
+    from server import ReportServer
+    from ledgerdir import LedgerDir
 
-def subp_statstsv(args):
-    result, months = create_stats(args)
-
-    fields = (
-        'balance',
-        'subtotal',
-        'outgoing',
-        'incoming',
-        'dues',
-        'other',
-        'members',
-        'ARPM',
+    # Only the sub-commands that report on the loaded rows are served
+    commands = dict(
+        (k, v) for k, v in subp_cmds.items() if v.get('report', True)
+    )
+    ledger = LedgerDir(args.dir)
+    server = ReportServer(
+        (args.host, args.port),
+        ledger,
+        commands,
+        argparser_create().parse_args,
     )
-    s = []
-
-    s += "#column 1 timestamp\n"
-    column_nr = 3
-    for field in fields:
-        s += '#column '
-        s += str(column_nr)
-        s += ' '
-        s += field
-        column_nr += 1
-        s += "\n"
-
-    for month in months:
-        if isinstance(month, str):
-            # its one of our rollup fake months
-            s += "# x"
+
+    sys.stderr.write(
+        "Serving on http://{}:{}/\n".format(*server.server_address))
+    try:
+        if args.workers:
+            from server import serve_workers
+            serve_workers(server, ledger, args.workers)
         else:
-            s += month.strftime('%s')
+            server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return ''
 
-        s += ' '
-        s += render_month(month)
-        s += ' '
 
-        # TODO
-        # - the timestamp is for the 1st of the month, however
-        #   all the stats are "as of end of month" - thus the
-        #   timestamp should probably be incremented to make
-        #   clear to anyone spelunking in the stats
+# The output files kept up to date by the "watch" sub-command, and the
+# sub-command that generates each one
+watch_outputs = (
+    ('payments.json', 'json_payments'),
+    ('stats.tsv', 'statstsv'),
+    ('index.html', 'make_balance'),
+)
 
-        for field in fields:
-            val = result[month][field]
-            if isinstance(val, (int, decimal.Decimal)):
-                s += str(val)
-            else:
-                s += str(result[month][field].value)
-            s += ' '
 
-        s += "\n"
-    return ''.join(s)
+def watch_rebuild(args, ledger, months=None):
+    """Regenerate the output files affected by a change to the given months
+       of the ledger, or all of them if months is None.  Returns the names
+       of the files that were written
+    """
+    if months is None:
+        args.stats_cache = {}
+    for month in months or ():
+        args.stats_cache.pop(month, None)
 
+    rows = ledger.rows(args.split).filter(args.filter)
 
-def subp_stats(args):
-    result, months = create_stats(args)
-
-    months_len = render_month_len()+2
-    tags_len = 13
-
-    s = []
-    s += grid_render_colheader(months, months_len, tags_len)
-    for tag in ('outgoing', 'incoming'):
-        s += grid_render_onerow(
-            tag, tags_len,
-            [result[x][tag].value.to_integral_exact(
-                    rounding=decimal.ROUND_FLOOR
-                ) for x in months],
-            months_len
-        )
-    s += "\n"
-    for tag in ('dues', 'other'):
-        s += grid_render_onerow(
-            " {}:".format(tag), tags_len,
-            [result[x][tag].value.to_integral_exact(
-                    rounding=decimal.ROUND_FLOOR
-                ) for x in months],
-            months_len
-        )
-    s += "\n"
-    s += grid_render_onerow(
-        'nr members', tags_len,
-        [result[x]['members'] for x in months],
-        months_len
-    )
-    s += grid_render_onerow(
-        'ARPM', tags_len,
-        [result[x]['ARPM'] for x in months],
-        months_len
+    written = []
+    for name, cmd in watch_outputs:
+        # the stats only cover the months up until now
+        if cmd == 'statstsv' and months is not None and \
+                all(Row._rel_months(month) > 0 for month in months):
+            continue
+
+        args.rows = rows
+
+        data = subp_cmds[cmd]['func'](args) + "\n"
+
+        filename = os.path.join(args.output, name)
+        if os.path.exists(filename):
+            with open(filename) as f:
+                if f.read() == data:
+                    continue
+        with open(filename, 'w') as f:
+            f.write(data)
+        written.append(name)
+
+    return written
+
+
+def subp_watch(args):  # pragma: no cover
+    from ledgerdir import LedgerDir
+    import watch
+
+    if not os.path.exists(args.output):
+        os.makedirs(args.output)
+
+    ledger = LedgerDir(args.dir)
+    watch_rebuild(args, ledger)
+
+    watcher = watch.Watcher(
+        ledger,
+        lambda months: watch_rebuild(args, ledger, months),
+        args.interval,
     )
+    sys.stderr.write("Watching {}\n".format(args.dir))
+    try:
+        watcher.run_forever()
+    except KeyboardInterrupt:
+        pass
+    return ''
+
+
+def batch_argv(line):
+    """Split one line of a batch into commandline args.  The options that
+       select the rows (--filter, --split and --nosplit) are global options,
+       so they are moved in front of the sub-command
+    """
+    import shlex
+
+    words = shlex.split(line)
+    front = []
+    rest = []
+    while words:
+        word = words.pop(0)
+        if word in ('--split', '--nosplit') or word.startswith('--filter='):
+            front.append(word)
+        elif word == '--filter' and words:
+            front += [word, words.pop(0)]
+        else:
+            rest.append(word)
+    return front + rest
+
 
-    # The rows after this are identical in the Average and Total columns,
-    # so to make that easier to see, remove the Total column from display
-    # Also remove the MonthTD, since the calcualted numbers will be bogus
-    # until near the end of the month
-    months = months[:-2]
-
-    def members_given_dues_outgoing(dues, rowset):
-        months = len(rowset.group_by('month').keys())
-        total_dues = dues * months
-        return abs((rowset.value / total_dues).to_integral_exact(
-                rounding=decimal.ROUND_FLOOR
-        ))
-
-    def dues_given_members_outgoing(members, rowset):
-        if members == 0:
-            # no value possible!
-            return 0
-
-        months = len(rowset.group_by('month').keys())
-        return abs(rowset.value / members / months).to_integral_exact(
-                rounding=decimal.ROUND_FLOOR
-        )
-
-    s += "\n"
-    s += "members needed\n"
-
-    # Which fee rates do we want to see membership numbers for?
-    # Add in the recent official numbers
-    fees_rates = set([500, 700])
-    # Also add in some of the average revenue numbers
-    fees_rates.add(result['Average']['ARPM'])
-    fees_rates.add(result['MonthTD']['ARPM'])
-    for dues in sorted(fees_rates):
-        s += grid_render_onerow(
-            " dues {}".format(dues), tags_len,
-            [members_given_dues_outgoing(dues, result[x]['outgoing'])
-                for x in months],
-            months_len
-        )
-
-    s += "dues needed\n"
-
-    # Which membership numbers do we want to see needed fees for?
-    members_count = set([17, 30])
-    # add in some of the average member numbers
-    members_count.add(result['Average']['members'])
-    members_count.add(result['MonthTD']['members'])
-
-    for members in sorted(members_count):
-        s += grid_render_onerow(
-            " members {}".format(members), tags_len,
-            [dues_given_members_outgoing(members, result[x]['outgoing'])
-                for x in months],
-            months_len
-        )
-
-    s += "\nNote: Total column does not include MonthTD numbers\n"
-
-    return ''.join(s)
+def subp_batch(args):
+    """Run each sub-command listed in the batch file against one loaded
+       ledger, returning all their outputs with a delimiter line before
+       each one
+    """
+    if args.file == '-':
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(args.file) as f:
+            lines = f.read().splitlines()
+
+    argparser = argparser_create()
+
+    # The rows are loaded (and split) at most once for each of the split
+    # and nosplit views, and each command filters its own view of them
+    views = {}
+
+    def view(split):
+        if split not in views:
+            loader = argparse.Namespace(**vars(args))
+            loader.split = split
+            load_rows(loader)
+            views[split] = loader.rows
+        return views[split]
+
+    output = []
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+
+        output.append(args.delimiter.format(line=line, number=number))
+        try:
+            try:
+                cmd_args = argparser.parse_args(batch_argv(line))
+            except SystemExit:
+                raise ValueError('bad arguments')
+            cmd = subp_cmds[cmd_args.cmd]
+            if not cmd.get('report', True):
+                raise ValueError('cannot be run in a batch')
+
+            # the input and engine are the ones given for the whole batch
+            for key in ('dir', 'account', 'engine', 'load_binary', 'sqlite'):
+                setattr(cmd_args, key, getattr(args, key))
+
+            cmd_args.rows = view(cmd_args.split).filter(cmd_args.filter)
+
+            with timings.phase('command', len(cmd_args.rows)):
+                output.append(cmd_args.func(cmd_args))
+        except ValueError as e:
+            sys.stderr.write('{}:{}: {}: {}\n'.format(
+                args.file, number, line, e))
+            args.failed = True
+
+    return '\n'.join(output)
 
 
 # A list of all the sub-commands
@@ -665,59 +634,184 @@ subp_cmds = {
     'sum': {
         'func': subp_sum,
         'help': 'Sum all transactions',
+        'rollups': True,
+        'pushdown': True,
     },
     'make_balance': {
         'func': subp_make_balance,
         'help': 'Output sum HTML page',
+        'mime': 'text/html',
+        # the page shows the time it was generated
+        'cache': False,
+        'rollups': True,
     },
     'topay': {
         'func': subp_topay,
         'help': 'List all pending payments',
+        'rollups': True,
     },
     'topay_html': {
         'func': subp_topay_html,
         'help': 'List all pending payments as HTML table',
+        'mime': 'text/html',
+        'rollups': True,
     },
     'party': {
         'func': subp_party,
         'help': 'Is it party time or not?',
+        'rollups': True,
     },
     'csv': {
         'func': subp_csv,
         'help': 'Output transactions as csv',
+        'mime': 'text/csv',
     },
     'grid': {
         'func': subp_grid,
         'help': 'Output a grid of transaction tags vs months',
+        'rollups': True,
+        'pushdown': True,
     },
     'json_payments': {
         'func': subp_json_payments,
         'help': 'Output JSON of incoming payments',
+        'mime': 'application/json',
+        'rollups': True,
     },
     'stats': {
         'func': subp_stats,
         'help': 'Output finance stats report',
+        'rollups': True,
     },
     'statstsv': {
         'func': subp_statstsv,
         'help': 'Output finance stats report as TSV',
+        'mime': 'text/tab-separated-values',
+        'rollups': True,
+    },
+    'transfers': {
+        'func': subp_transfers,
+        'help': 'List the transfers between the accounts given by --account',
+    },
+    'reconcile': {
+        'func': subp_reconcile,
+        'help': 'Match the transactions against a CSV bank statement',
+        'report': False,
+        # the statement is not one of the inputs the cache knows about
+        'cache': False,
+    },
+    'dupes': {
+        'func': subp_dupes,
+        'help': 'List the transactions that look like they were entered '
+                'twice',
+        'report': False,
+    },
+    'lint': {
+        'func': subp_lint,
+        'help': 'Check every line of the ledger files for mistakes',
+        'report': False,
+        'cache': False,
+    },
+    'members': {
+        'func': subp_members,
+        'help': 'Output CSV of the dues paid by each member in each month',
+        'mime': 'text/csv',
+        'report': False,
+        'cache': False,
+    },
+    'cohorts': {
+        'func': subp_cohorts,
+        'help': 'Output CSV of how many members who joined each month were '
+                'still paying each month after',
+        'mime': 'text/csv',
+        'report': False,
+    },
+    'forecast': {
+        'func': subp_forecast,
+        'help': 'Estimate how many months the money will last',
+        'report': False,
+        # the scenarios are random unless given a seed
+        'cache': False,
+    },
+    'export_binary': {
+        'func': subp_export_binary,
+        'help': 'Write the whole ledger to a binary columnar file',
+        'report': False,
+        'cache': False,
+    },
+    'archive': {
+        'func': subp_archive,
+        'help': 'Compress the month files older than a number of months',
+        'report': False,
+        'cache': False,
+    },
+    'rollup': {
+        'func': subp_rollup,
+        'help': 'Write the per-year rollups used by --rollups',
+        'report': False,
+        'cache': False,
+    },
+    'search': {
+        'func': subp_search,
+        'help': 'List the transactions with comments containing the terms',
+        'report': False,
+    },
+    'serve': {
+        'func': subp_serve,
+        'help': 'Serve all the reports over HTTP from an in-memory ledger',
+        'report': False,
+        'cache': False,
+    },
+    'watch': {
+        'func': subp_watch,
+        'help': 'Regenerate the pages outputs whenever the ledger changes',
+        'report': False,
+        'cache': False,
+    },
+    'batch': {
+        'func': subp_batch,
+        'help': 'Run a list of sub-commands against one loaded ledger',
+        'report': False,
+        'cache': False,
     },
 }
 
+
 #
 # Most of this is boilerplate and stays the same even with addition of
 # features.  The only exception is if a sub-command needs to add a new
 # commandline option.
 #
-if __name__ == '__main__':  # pragma: no cover
-    argparser = argparse.ArgumentParser(
-        description='Run calculations and transformations on cash data')
+class HelpFormatter(argparse.HelpFormatter):
+    """argparse creates a formatter for every argument added, which asks
+       shutil for the terminal width - and importing shutil is a noticeable
+       part of the startup time.  Find the width without it
+    """
+
+    def __init__(self, prog, **kwargs):
+        if 'width' not in kwargs:
+            try:
+                columns = int(os.environ['COLUMNS'])
+            except (KeyError, ValueError):
+                try:
+                    fileno = sys.__stdout__.fileno()
+                    columns = os.get_terminal_size(fileno).columns
+                except (AttributeError, ValueError, OSError):
+                    columns = 0
+            kwargs['width'] = (columns or 80) - 2
+        argparse.HelpFormatter.__init__(self, prog, **kwargs)
+
+
+def argparser_add_global(argparser):
     argparser.add_argument('--dir',
                            action='store',
                            type=str,
                            default=os.path.join(os.path.join(
                                os.path.dirname(__file__), FILES_DIR)),
                            help='Input directory')
+    argparser.add_argument('--account', action='append',
+                           help='Add a name=dir ledger directory as one of '
+                                'several accounts, used in place of --dir')
     argparser.add_argument('--filter', action='append',
                            help='Add a key=value filter to the rows used')
     argparser.add_argument('--split', dest='split',
@@ -727,23 +821,259 @@ if __name__ == '__main__':  # pragma: no cover
                            action='store_false',
                            help='Do not split rows that cover multiple months')
     argparser.set_defaults(split=True)
+    argparser.set_defaults(stats_cache=None)
+    argparser.set_defaults(by_account=False)
+    argparser.set_defaults(failed=False)
+    argparser.set_defaults(ledger=None)
+    argparser.add_argument('--engine', choices=('python', 'numpy'),
+                           default='python',
+                           help='Use numpy to vectorise the grid, stats and '
+                                'topay aggregations and the forecast '
+                                'scenarios (falls back to plain python '
+                                'without numpy)')
+    argparser.add_argument('--load_binary', action='store', type=str,
+                           help='Load the rows from a file written by '
+                                'the export_binary subcommand')
+    argparser.add_argument('--sqlite', action='store', type=str,
+                           help='Mirror the input into this SQLite database '
+                                'and run the filters there')
+    argparser.add_argument('--rollups', action='store', type=str,
+                           help='Use the per-year rollups in this directory '
+                                '(written by the rollup subcommand) in place '
+                                'of the rows of any unchanged years')
+    argparser.add_argument('--comment_index', action='store', type=str,
+                           help='Keep an index of the comments in this file '
+                                'and use it to skip the files that cannot '
+                                'match a comment or hashtag filter')
+    argparser.add_argument('--check_dupes', action='store_true',
+                           default=False,
+                           help='Warn about any rows that look like they '
+                                'were entered twice (see the dupes '
+                                'subcommand)')
+    argparser.add_argument('--cache', action='store', type=str,
+                           help='Keep the sub-command results in this '
+                                'directory and reuse them while the input '
+                                'is unchanged')
+    argparser.add_argument('--cache_size', action='store', type=int,
+                           default=10 * 1024 * 1024,
+                           help='Maximum size in bytes of the result cache')
+    argparser.add_argument('--timings', action='store_true', default=False,
+                           help='Write the time, row counts and peak memory '
+                                'of each phase to stderr as JSON')
+    argparser.add_argument('--profile', action='store', type=str,
+                           help='Write cProfile stats for the run to this '
+                                'file')
+
+
+class ProbeError(Exception):
+    pass
+
+
+class ArgumentProbe(argparse.ArgumentParser):
+    """A parser that raises an exception instead of printing an error
+       and exiting
+    """
+    def error(self, message):
+        raise ProbeError(message)
+
+
+def argparser_find_cmd(argv):
+    """Return the name of the sub-command in the commandline args, found the
+       same way that argparse would, or None if there is not a valid one
+    """
+    probe = ArgumentProbe(add_help=False, formatter_class=HelpFormatter)
+    argparser_add_global(probe)
+    probe.add_argument('cmd', nargs=argparse.REMAINDER)
+    try:
+        args, _ = probe.parse_known_args(argv)
+    except ProbeError:
+        return None
+    if args.cmd and args.cmd[0] in subp_cmds:
+        return args.cmd[0]
+    return None
+
+
+def argparser_create(cmd=None):
+    """Create the commandline parser.  If the sub-command is already known,
+       the parsers for all the other sub-commands are not created
+    """
+    argparser = argparse.ArgumentParser(
+        description='Run calculations and transformations on cash data',
+        formatter_class=HelpFormatter)
+    argparser_add_global(argparser)
 
     subp = argparser.add_subparsers(help='Subcommand', dest='cmd')
     subp.required = True
     for key, value in subp_cmds.items():
-        value['parser'] = subp.add_parser(key, help=value['help'])
+        value.pop('parser', None)
+        if cmd is not None and key != cmd:
+            continue
+        value['parser'] = subp.add_parser(key, help=value['help'],
+                                          formatter_class=HelpFormatter)
         value['parser'].set_defaults(func=value['func'])
 
     # Add an additional commandline option for the "grid" subcommand
-    subp_cmds['grid']['parser'].add_argument('--separate_inout',        # noqa
-        action='store_const', const=True, default=False,                # noqa
-        help='Show incoming and outgoing on separate lines of the grid' # noqa
-    )                                                                   # noqa
-    subp_cmds['grid']['parser'].add_argument('--filter_hack',        # noqa
-        type=int ,                                # noqa
-        help='Quick hack specifying oldest entries to display - the arg is the number of days' # noqa
-    )                                                                   # noqa
-    subp_cmds['grid']['parser'].set_defaults(filter_hack=640)
+    if 'parser' in subp_cmds['grid']:
+        subp_cmds['grid']['parser'].add_argument('--separate_inout',    # noqa
+            action='store_const', const=True, default=False,            # noqa
+            help='Show incoming and outgoing on separate lines of the grid' # noqa
+        )                                                               # noqa
+        subp_cmds['grid']['parser'].add_argument('--filter_hack',    # noqa
+            type=int ,                            # noqa
+            help='Quick hack specifying oldest entries to display - the arg is the number of days' # noqa
+        )                                                               # noqa
+        subp_cmds['grid']['parser'].set_defaults(filter_hack=640)
+        subp_cmds['grid']['parser'].add_argument('--by_account',    # noqa
+            action='store_true', default=False,                        # noqa
+            help='Show a line for each account instead of each tag' # noqa
+        )                                                               # noqa
+
+    for cmd in ('stats', 'statstsv'):
+        if 'parser' in subp_cmds[cmd]:
+            subp_cmds[cmd]['parser'].add_argument('--by_account',
+                action='store_true', default=False,            # noqa
+                help='Show the stats of each account in turn'  # noqa
+            )                                                  # noqa
+
+    if 'parser' in subp_cmds['transfers']:
+        subp_cmds['transfers']['parser'].add_argument('--days',
+            type=int, default=3,                           # noqa
+            help='Most days between the two sides of a transfer' # noqa
+        )                                                  # noqa
+
+    if 'parser' in subp_cmds['reconcile']:
+        subp_cmds['reconcile']['parser'].add_argument('--statement',
+            required=True,                                 # noqa
+            help='CSV file with a header line, exported from the bank' # noqa
+        )                                                  # noqa
+        subp_cmds['reconcile']['parser'].add_argument('--days',
+            type=int, default=3,                           # noqa
+            help='Most days between a transaction and its statement line' # noqa
+        )                                                  # noqa
+        subp_cmds['reconcile']['parser'].add_argument('--date_column',
+            default='Date',                                # noqa
+            help='Name of the statement column with the date' # noqa
+        )                                                  # noqa
+        subp_cmds['reconcile']['parser'].add_argument('--date_format',
+            default='%Y-%m-%d',                             # noqa
+            help='strptime format of the statement dates'  # noqa
+        )                                                  # noqa
+        subp_cmds['reconcile']['parser'].add_argument('--amount_column',
+            default='Amount',                              # noqa
+            help='Name of the statement column with the amount' # noqa
+        )                                                  # noqa
+        subp_cmds['reconcile']['parser'].add_argument('--description_column',
+            default='Description',                         # noqa
+            help='Name of the statement column with the description' # noqa
+        )                                                  # noqa
+
+    if 'parser' in subp_cmds['dupes']:
+        subp_cmds['dupes']['parser'].add_argument('--days',
+            type=int, default=1,                           # noqa
+            help='Most days between two rows entered twice' # noqa
+        )                                                  # noqa
+
+    if 'parser' in subp_cmds['members']:
+        subp_cmds['members']['parser'].add_argument('--door',
+            help='CSV export of the door system users, to show when each ' # noqa
+                 'member was last seen'                    # noqa
+        )                                                  # noqa
+        subp_cmds['members']['parser'].add_argument('--door_handle_column',
+            default='hashtag',                             # noqa
+            help='Name of the door list column with the dues handle' # noqa
+        )                                                  # noqa
+        subp_cmds['members']['parser'].add_argument('--door_activity_column',
+            default='last_login',                          # noqa
+            help='Name of the door list column with the last activity' # noqa
+        )                                                  # noqa
+
+    if 'parser' in subp_cmds['cohorts']:
+        subp_cmds['cohorts']['parser'].add_argument('--state',
+            help='JSON file to keep the dues paid in each ledger file in, ' # noqa
+                 'so only changed files are loaded again'  # noqa
+        )                                                  # noqa
+
+    if 'parser' in subp_cmds['forecast']:
+        subp_cmds['forecast']['parser'].add_argument('--months',
+            type=int, default=24,                          # noqa
+            help='How many months ahead to forecast'       # noqa
+        )                                                  # noqa
+        subp_cmds['forecast']['parser'].add_argument('--history',
+            type=int, default=12,                          # noqa
+            help='How many past months the forecast is based on' # noqa
+        )                                                  # noqa
+        subp_cmds['forecast']['parser'].add_argument('--scenarios',
+            type=int, default=10000,                       # noqa
+            help='How many random scenarios to run'        # noqa
+        )                                                  # noqa
+        subp_cmds['forecast']['parser'].add_argument('--seed',
+            type=int,                                      # noqa
+            help='Seed for the random scenarios, to make them repeatable' # noqa
+        )                                                  # noqa
+
+    if 'parser' in subp_cmds['export_binary']:
+        subp_cmds['export_binary']['parser'].add_argument('file',
+            help='Name of the binary ledger file to write' # noqa
+        )                                                  # noqa
+
+    if 'parser' in subp_cmds['archive']:
+        subp_cmds['archive']['parser'].add_argument('--months',
+            type=int, default=12,                          # noqa
+            help='Archive the months older than this'      # noqa
+        )                                                  # noqa
+        subp_cmds['archive']['parser'].add_argument('--format',
+            choices=('gz', 'bz2', 'xz'), default='gz',     # noqa
+            help='Compression to use'                      # noqa
+        )                                                  # noqa
+
+    if 'parser' in subp_cmds['rollup']:
+        subp_cmds['rollup']['parser'].add_argument('output',
+            help='Directory to write the rollups to'       # noqa
+        )                                                  # noqa
+
+    if 'parser' in subp_cmds['search']:
+        subp_cmds['search']['parser'].add_argument('terms',
+            nargs='+',                                     # noqa
+            help='Words to look for, ignoring case.  All are needed unless ' # noqa
+                 'separated by OR, and NOT word (or -word, after a --) ' # noqa
+                 'excludes a word'                         # noqa
+        )                                                  # noqa
+
+    if 'parser' in subp_cmds['serve']:
+        subp_cmds['serve']['parser'].add_argument('--host',
+            default='127.0.0.1',                           # noqa
+            help='Address to listen on'                    # noqa
+        )                                                  # noqa
+        subp_cmds['serve']['parser'].add_argument('--port',
+            type=int, default=8000,                        # noqa
+            help='Port to listen on'                       # noqa
+        )                                                  # noqa
+        subp_cmds['serve']['parser'].add_argument('--workers',
+            type=int, default=0,                           # noqa
+            help='Answer the requests from this many worker processes, ' # noqa
+                 'sharing one copy of the ledger in shared memory' # noqa
+        )                                                  # noqa
+
+    if 'parser' in subp_cmds['batch']:
+        subp_cmds['batch']['parser'].add_argument('file',
+            nargs='?', default='-',                        # noqa
+            help='File with one sub-command per line, or - for stdin' # noqa
+        )                                                  # noqa
+        subp_cmds['batch']['parser'].add_argument('--delimiter',
+            default='==> {line} <==',                      # noqa
+            help='Line written before each output, {line} and {number} ' # noqa
+                 'are replaced with the batch line and its number' # noqa
+        )                                                  # noqa
+
+    if 'parser' in subp_cmds['watch']:
+        subp_cmds['watch']['parser'].add_argument('--output',
+            default='pages',                               # noqa
+            help='Directory to write the outputs to'       # noqa
+        )                                                  # noqa
+        subp_cmds['watch']['parser'].add_argument('--interval',
+            type=float, default=1.0,                       # noqa
+            help='Seconds between checks for changes'      # noqa
+        )                                                  # noqa
     #
     # Hello? is that flake8?  I'd like to talk to you about presentation
     # values.  I know you like to keep lines under 78 characters wide, and
@@ -762,20 +1092,165 @@ if __name__ == '__main__':  # pragma: no cover
     #
     # Now get off my lawn
 
+    return argparser
+
+
+# Changing this invalidates every existing result cache entry
+CACHE_VERSION = 1
+
+
+def cache_key(args):
+    """Return the result cache key for the sub-command described by args.
+
+       This covers the input files, the program itself, every commandline
+       option (including the sub-command and --split) and today's date, as
+       anything using rel_months depends on when it is run
+    """
+    import ledgerfiles
+    if args.load_binary:
+        inputs = [args.load_binary]
+    elif args.account:
+        import federation
+        inputs = []
+        for _, dirname in federation.parse_accounts(args.account):
+            inputs += ledgerfiles.find(dirname)
+    else:
+        inputs = ledgerfiles.find(args.dir)
+
+    topdir = os.path.dirname(os.path.abspath(__file__))
+    program = [os.path.abspath(__file__)]
+    program += sorted(glob.glob(os.path.join(topdir, 'lib', '*.py')))
+    program += glob.glob(os.path.join(topdir, 'docs', 'template.html'))
+
+    ignore = ('func', 'cache', 'cache_size', 'stats_cache', 'timings',
+              'profile', 'failed', 'comment_index', 'ledger')
+    options = sorted(
+        (k, v) for k, v in vars(args).items() if k not in ignore
+    )
+
+    import hashlib
+    import resultcache
+
+    h = hashlib.sha256()
+    for item in (
+            CACHE_VERSION,
+            resultcache.hash_stats(program),
+            resultcache.hash_files(inputs),
+            repr(options),
+            datetime.date.today().isoformat(),
+    ):
+        h.update('{}\n'.format(item).encode('utf-8'))
+    return h.hexdigest()
+
+
+def load_rows(args):   # pragma: no cover
+    """Load, split and filter the rows that the sub-command works on
+    """
+    if args.account:
+        import federation
+        with timings.phase('parse') as t:
+            accounts = federation.parse_accounts(args.account)
+            rows, gaps = federation.load(accounts, args.split)
+            t['rows_out'] = len(rows)
+        for gap in gaps:
+            sys.stderr.write('Warning: {}\n'.format(gap))
+        if args.check_dupes:
+            check_dupes([(row.account, row) for row in rows])
+        with timings.phase('filter', len(rows)) as t:
+            args.rows = rows.filter(args.filter)
+            t['rows_out'] = len(args.rows)
+        return
+
+    if args.rollups and not args.filter and not args.load_binary and \
+            not args.sqlite and subp_cmds[args.cmd].get('rollups'):
+        # the sub-command only adds up values by month and tag, which the
+        # rollups have already done for the closed years
+        import rollup
+        with timings.phase('rollup') as t:
+            args.rows = rollup.rows(args.dir, args.rollups, args.split)
+            t['rows_out'] = len(args.rows)
+        return
+
+    if args.comment_index and args.filter and not args.load_binary and \
+            not args.sqlite:
+        # only load the files that the index shows might match the filters
+        import commentindex
+        from ledgerdir import load_files
+        with timings.phase('index'):
+            index = commentindex.CommentIndex(args.comment_index)
+            index.refresh(args.dir)
+            names = index.prefilter(args.filter)
+        if names is not None:
+            with timings.phase('filter') as t:
+                rows = load_files(
+                    [os.path.join(args.dir, x) for x in sorted(names)],
+                    args.split)
+                args.rows = rows.filter(args.filter)
+                t['rows_out'] = len(args.rows)
+            return
+
+    ledger = Ledger(args.dir, args.engine, args.load_binary, args.sqlite)
+    if args.check_dupes:
+        files = ledger.files()
+        if files is not None:
+            import dupes
+            check_dupes(dupes.file_rows(files))
+        else:
+            check_dupes([(None, row) for row in ledger.rows(False)])
+    if (args.sqlite or args.load_binary) and \
+            subp_cmds[args.cmd].get('pushdown'):
+        # the database (or the binary columns) adds up the values, without
+        # loading any rows
+        args.ledger = ledger
+        return
+    args.rows = ledger.rows(args.split, args.filter)
+
+
+if __name__ == '__main__':  # pragma: no cover
+    argparser = argparser_create(argparser_find_cmd(sys.argv[1:]))
     args = argparser.parse_args()
 
     if not os.path.exists(args.dir):
         raise RuntimeError('Directory "{}" does not exist'.format(args.dir))
 
-    # first, load the data
-    args.rows = parse_dir(args.dir)
+    if args.timings:
+        timings.enable()
+
+    profiler = None
+    if args.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    with timings.phase('total'):
+        cache = None
+        result = None
+        if args.cache and subp_cmds[args.cmd].get('cache', True):
+            import resultcache
+            with timings.phase('cache'):
+                cache = resultcache.ResultCache(args.cache, args.cache_size)
+                key = cache_key(args)
+                result = cache.get(key)
 
-    # optionally split multi-month transactions into one per month
-    if args.split:
-        args.rows = args.rows.autosplit()
+        if result is None:
+            if subp_cmds[args.cmd].get('report', True):
+                load_rows(args)
 
-    # apply any filters requested
-    args.rows = args.rows.filter(args.filter)
+            with timings.phase('command'):
+                result = args.func(args)
+
+            if cache is not None:
+                cache.put(key, result)
+
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(args.profile)
 
-    result = args.func(args)
     print(result)
+
+    if args.timings:
+        sys.stderr.write(timings.report(cmd=args.cmd, argv=sys.argv[1:]))
+        sys.stderr.write("\n")
+
+    if args.failed:
+        sys.exit(1)
@@ -0,0 +1,318 @@
+#!/usr/bin/env python
+""" Time and memory profile each of the balance.py sub-commands against
+    generated ledgers of increasing size.  The results are written as JSON
+    so that the runs from two commits can be compared
+"""
+
+import subprocess
+import argparse
+import platform
+import tempfile
+import datetime
+import shutil
+import json
+import time
+import sys
+import os
+
+# Ensure that we look for any modules in our local lib dir.  This allows simple
+# testing and development use.  It also does not break the case where the lib
+# has been installed properly on the normal sys.path
+sys.path.insert(0,
+                os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             'lib'))
+# I would use site.addsitedir, but it does an append, not insert
+
+import ledgergen  # noqa
+
+TOPDIR = os.path.dirname(os.path.abspath(__file__))
+
+# The sub-commands to run, with any extra args they need.  The serve and
+# watch sub-commands never finish, reconcile and batch need an input file
+# written for them, and archive compresses the ledger files in place (which
+# would change the input of the sub-commands after it), so they are not
+# included
+COMMANDS = (
+    ('sum', []),
+    ('topay', []),
+    ('topay_html', []),
+    ('party', []),
+    ('csv', []),
+    ('grid', []),
+    ('json_payments', []),
+    ('stats', []),
+    ('statstsv', []),
+    ('make_balance', []),
+    ('transfers', []),
+    ('search', ['rent']),
+    ('lint', []),
+    ('dupes', []),
+    ('members', []),
+    ('cohorts', []),
+    ('forecast', ['--seed', '1']),
+    ('rollup', ['{tmpdir}/rollups']),
+    ('export_binary', ['{tmpdir}/ledger.bin']),
+)
+
+
+def git_describe():
+    try:
+        return subprocess.check_output(
+            ['git', 'describe', '--always', '--dirty'],
+            cwd=TOPDIR,
+        ).decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_one(argv):
+    """Run the command, returning the wall time in seconds, the peak
+       resident memory in KiB and the exit status
+    """
+    with open(os.devnull, 'w') as devnull:
+        start = time.time()
+        proc = subprocess.Popen(argv, stdout=devnull)
+        # Unlike proc.wait(), wait4() also returns the resource usage of
+        # just this one child
+        _, status, usage = os.wait4(proc.pid, 0)
+        elapsed = time.time() - start
+
+    if os.WIFEXITED(status):
+        proc.returncode = os.WEXITSTATUS(status)
+    else:
+        proc.returncode = -os.WTERMSIG(status)
+
+    maxrss = usage.ru_maxrss
+    if sys.platform == 'darwin':
+        # reported in bytes, not KiB
+        maxrss //= 1024
+    return elapsed, maxrss, proc.returncode
+
+
+def importtime(argv):
+    """Run the command with "python -X importtime" and return a dict of the
+       cumulative import time in microseconds of each top level import
+    """
+    with open(os.devnull, 'w') as devnull:
+        proc = subprocess.Popen(
+            [sys.executable, '-X', 'importtime'] + argv,
+            stdout=devnull, stderr=subprocess.PIPE,
+        )
+        _, err = proc.communicate()
+
+    modules = {}
+    for line in err.decode('utf-8').splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line.split('|')
+        if not cumulative.strip().isdigit():
+            # the column headings
+            continue
+        # nested imports are indented further
+        if name.startswith('  '):
+            continue
+        modules[name.strip()] = int(cumulative)
+    return modules
+
+
+def bench_startup(args):
+    """Measure the cold start of a quick sub-command against the real
+       ledger, compared to starting the bare interpreter
+    """
+    argv = [os.path.join(TOPDIR, 'balance.py'), '--dir',
+            os.path.join(TOPDIR, 'cash'), args.startup_cmd]
+
+    repeat = max(10, args.repeat)
+    bare = min(run_one([sys.executable, '-c', 'pass'])[0]
+               for _ in range(repeat))
+    runs = [run_one([sys.executable] + argv) for _ in range(repeat)]
+    imports = importtime(argv)
+
+    result = {
+        'cmd': args.startup_cmd,
+        'seconds': min(x[0] for x in runs),
+        'maxrss_kb': max(x[1] for x in runs),
+        'returncode': max([x[2] for x in runs], key=abs),
+        'interpreter_seconds': bare,
+        'import_us': sum(imports.values()),
+        'imports': imports,
+    }
+    sys.stderr.write(
+        'startup {cmd:<14} {seconds:8.3f}s (interpreter {interpreter_seconds:'
+        '.3f}s, imports {import_us}us)\n'.format(**result)
+    )
+    slowest = sorted(imports.items(), key=lambda x: -x[1])[:5]
+    for name, usec in slowest:
+        sys.stderr.write('    {:<20} {:>8}us\n'.format(name, usec))
+    return result
+
+
+def generator(args, nrows):
+    return ledgergen.LedgerGenerator(
+        years=args.years,
+        rows_per_month=max(2, nrows // (args.years * 12)),
+        tags=args.tags,
+        months_fraction=args.months_fraction,
+        seed=args.seed,
+        end=args.end,
+    )
+
+
+def bench_size(args, nrows, tmpdir):
+    gen = generator(args, nrows)
+    cashdir = os.path.join(tmpdir, 'cash')
+    shutil.rmtree(cashdir, ignore_errors=True)
+    nrows = gen.write(cashdir)
+
+    results = []
+    for cmd, extra in COMMANDS:
+        if args.cmd and cmd not in args.cmd:
+            continue
+
+        argv = [sys.executable, os.path.join(TOPDIR, 'balance.py'),
+                '--dir', cashdir] + args.option + [cmd]
+        argv += [x.format(tmpdir=tmpdir) for x in extra]
+
+        runs = [run_one(argv) for _ in range(args.repeat)]
+        result = {
+            'rows': nrows,
+            'cmd': cmd,
+            'seconds': min(x[0] for x in runs),
+            'maxrss_kb': max(x[1] for x in runs),
+            'returncode': max([x[2] for x in runs], key=abs),
+        }
+        sys.stderr.write(
+            '{rows:>8} {cmd:<14} {seconds:8.3f}s {maxrss_kb:>8}KiB'
+            '{status}\n'.format(
+                status='' if not result['returncode'] else ' FAILED',
+                **result
+            )
+        )
+        results.append(result)
+
+    return results
+
+
+def compare(old, new):
+    """Return a text table comparing two sets of results
+    """
+    def index(data):
+        result = dict(((x['rows'], x['cmd']), x) for x in data['results'])
+        if 'startup' in data:
+            result[('startup', data['startup']['cmd'])] = data['startup']
+        return result
+
+    old = index(old)
+    new = index(new)
+
+    fmt = '{:>8} {:<14} {:>8.3f}s {:>8.3f}s {:>6.2f} {:>9.2f}'
+    lines = ['{:>8} {:<14} {:>9} {:>9} {:>6} {:>9}'.format(
+        'rows', 'cmd', 'old', 'new', 'ratio', 'mem ratio')]
+    for key in sorted(set(old) & set(new), key=str):
+        a = old[key]
+        b = new[key]
+        lines.append(fmt.format(
+            key[0], key[1], a['seconds'], b['seconds'],
+            b['seconds'] / a['seconds'],
+            float(b['maxrss_kb']) / a['maxrss_kb'],
+        ))
+    return '\n'.join(lines)
+
+
+def parse_date(string):
+    return datetime.datetime.strptime(string, '%Y-%m-%d').date()
+
+
+def argparser_create():
+    argparser = argparse.ArgumentParser(description=__doc__)
+    argparser.add_argument('--sizes', default='10000,100000,1000000',
+                           help='Comma separated list of ledger row counts')
+    argparser.add_argument('--years', type=int, default=5,
+                           help='Number of years in each generated ledger')
+    argparser.add_argument('--tags', type=int, default=200,
+                           help='Number of different hashtags to generate')
+    argparser.add_argument('--months_fraction', type=float, default=0.05,
+                           help='Fraction of rows with a !months tag')
+    argparser.add_argument('--seed', type=int, default=1,
+                           help='Random seed for the generated ledger')
+    # make_balance (and any other report of the recent months) only has
+    # something to show with a ledger reaching up to today
+    argparser.add_argument('--end', type=parse_date,
+                           default=datetime.date.today(),
+                           help='Date of the last month of the generated '
+                                'ledger (default today), recorded in the '
+                                'results')
+    argparser.add_argument('--repeat', type=int, default=1,
+                           help='Run each command this many times and keep '
+                                'the best time')
+    argparser.add_argument('--cmd', action='append',
+                           help='Only run this sub-command (can be repeated)')
+    argparser.add_argument('--option', action='append', default=[],
+                           help='Pass this global option to balance.py '
+                                '(eg: --option=--engine=numpy)')
+    argparser.add_argument('--output',
+                           help='Write the JSON results to this file')
+    argparser.add_argument('--compare',
+                           help='Compare the results with this earlier '
+                                'JSON results file')
+    argparser.add_argument('--startup', action='store_true',
+                           help='Only run the startup time benchmark')
+    argparser.add_argument('--startup_cmd', default='party',
+                           help='The sub-command to time the startup of')
+    argparser.add_argument('--generate',
+                           help='Only write a ledger with the first size to '
+                                'this directory')
+    return argparser
+
+
+def main():
+    args = argparser_create().parse_args()
+    sizes = [int(x) for x in args.sizes.split(',')]
+
+    if args.generate:
+        gen = generator(args, sizes[0])
+        print('Wrote {} rows'.format(gen.write(args.generate)))
+        return
+
+    startup = bench_startup(args)
+
+    results = []
+    if not args.startup:
+        tmpdir = tempfile.mkdtemp()
+        try:
+            for nrows in sizes:
+                results += bench_size(args, nrows, tmpdir)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    data = {
+        'version': 1,
+        'describe': git_describe(),
+        'python': platform.python_version(),
+        'date': datetime.date.today().isoformat(),
+        'params': {
+            'years': args.years,
+            'tags': args.tags,
+            'months_fraction': args.months_fraction,
+            'seed': args.seed,
+            'end': args.end.isoformat(),
+            'repeat': args.repeat,
+            'option': args.option,
+        },
+        'startup': startup,
+        'results': results,
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+    else:
+        print(json.dumps(data, indent=1, sort_keys=True))
+
+    if args.compare:
+        with open(args.compare) as f:
+            print(compare(json.load(f), data))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,378 @@
+# Licensed under GPLv3
+import datetime
+import struct
+import mmap
+import sys
+
+from row import Row, from_cents, parse_filter, filter_match
+from rowset import RowSet, value_of
+
+
+# A compact columnar file format for a parsed and autosplit ledger.
+#
+# The file is a fixed header followed by a number of sections, each one
+# starting on an 8 byte boundary.  All numbers are little-endian.
+#
+#   header      magic, version, and the counts of rows, tags and strings
+#   cents       int64  per row - the value of the row in cents
+#   dates       int32  per row - the date of the row as a proleptic ordinal
+#   parents     int32  per row - index of the row this was split from, or -1
+#   comments    uint32 per row - string table index of the row comment
+#   tags        uint16 per row - tag table index of the hashtag, or NO_TAG
+#   flags       uint8  per row - FLAG_* bits
+#   exponents   int8   per row - the decimal exponent of the original value
+#   tagnames    uint32 per tag - string table index of the tag name
+#   offsets     uint32 per string, plus one - start of each string in blob
+#   blob        the utf-8 encoded strings, one after the other
+#
+# Both the original rows and any split children are stored, the children
+# immediately following their parent, so either view can be produced.
+
+MAGIC = b'DSLB'
+VERSION = 1
+HEADER = struct.Struct('<4sHHIII')
+
+NO_TAG = 0xffff
+FLAG_HAS_CHILDREN = 1
+
+# The name, struct format character and per-row/per-item size of each section
+SECTIONS = (
+    ('cents', 'q', 8),
+    ('dates', 'i', 4),
+    ('parents', 'i', 4),
+    ('comments', 'I', 4),
+    ('tags', 'H', 2),
+    ('flags', 'B', 1),
+    ('exponents', 'b', 1),
+    ('tagnames', 'I', 4),
+    ('offsets', 'I', 4),
+    ('blob', 'B', 1),
+)
+
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+
+def _layout(counts):
+    """Given the number of items in each section, return a dict of the
+       section offsets and the total file size
+    """
+    offsets = {}
+    offset = _align(HEADER.size)
+    for name, fmt, size in SECTIONS:
+        offsets[name] = offset
+        offset = _align(offset + counts[name] * size)
+    return offsets, offset
+
+
+class StringTable(object):
+    """Collect unique strings, handing out an index for each
+    """
+
+    def __init__(self):
+        self.strings = []
+        self.index = {}
+
+    def add(self, string):
+        if string not in self.index:
+            self.index[string] = len(self.strings)
+            self.strings.append(string)
+        return self.index[string]
+
+
+def encode(rows):
+    """Given an unsplit RowSet, return a bytearray with it and all its
+       autosplit children in the binary ledger format
+    """
+    strings = StringTable()
+    tags = StringTable()
+
+    columns = dict((name, []) for name, fmt, size in SECTIONS)
+
+    def _add(row, parent, flags):
+        if row.hashtag is None:
+            tag = NO_TAG
+        else:
+            tag = tags.add(row.hashtag)
+            if tag >= NO_TAG:
+                raise ValueError('too many different hashtags')
+
+        columns['cents'].append(row.cents)
+        columns['dates'].append(row.date.toordinal())
+        columns['parents'].append(parent)
+        columns['comments'].append(strings.add(row.comment))
+        columns['tags'].append(tag)
+        columns['flags'].append(flags)
+        columns['exponents'].append(row.exponent)
+
+    for row in rows:
+        children = row.autosplit()
+        if len(children) == 1 and children[0] is row:
+            children = []
+
+        parent = len(columns['cents'])
+        _add(row, -1, FLAG_HAS_CHILDREN if children else 0)
+        for child in children:
+            _add(child, parent, 0)
+
+    columns['tagnames'] = [strings.add(tag) for tag in tags.strings]
+
+    encoded = [s.encode('utf-8') for s in strings.strings]
+    offsets = [0]
+    for s in encoded:
+        offsets.append(offsets[-1] + len(s))
+    columns['offsets'] = offsets
+    blob = b''.join(encoded)
+
+    counts = dict((name, len(columns[name])) for name in columns)
+    counts['blob'] = len(blob)
+    offsets, size = _layout(counts)
+
+    buf = bytearray(size)
+    HEADER.pack_into(buf, 0, MAGIC, VERSION, 0, counts['cents'],
+                     counts['tagnames'], len(encoded))
+    for name, fmt, item_size in SECTIONS:
+        if name == 'blob':
+            buf[offsets[name]:offsets[name] + len(blob)] = blob
+            continue
+        struct.pack_into('<{}{}'.format(counts[name], fmt), buf,
+                         offsets[name], *columns[name])
+
+    return buf
+
+
+def write_file(filename, rows):
+    """Given an unsplit RowSet, write it and all its autosplit children to
+       the named file
+    """
+    buf = encode(rows)
+    with open(filename, 'wb') as f:
+        f.write(buf)
+
+
+class BinLedger(object):
+    """A read-only view of a binary ledger file.  The file is mapped into
+       memory and each column is available as a typed memoryview, so the
+       data can be scanned without first building any Row objects
+    """
+
+    def __init__(self, filename):
+        with open(filename, 'rb') as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._attach(self.mmap, filename)
+
+    @classmethod
+    def from_buffer(cls, buf, name='<buffer>'):
+        """Return a view of a binary ledger already in memory, such as a
+           shared memory segment.  The buffer may be longer than the ledger
+        """
+        self = cls.__new__(cls)
+        self.mmap = None
+        self._attach(buf, name)
+        return self
+
+    def _attach(self, buf, filename):
+        if sys.byteorder != 'little':
+            raise ValueError('binary ledgers need a little-endian machine')
+
+        self.buf = memoryview(buf)
+
+        if len(self.buf) < HEADER.size:
+            raise ValueError('{}: not a binary ledger'.format(filename))
+        magic, version, _, nrows, ntags, nstrings = \
+            HEADER.unpack_from(self.buf, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('{}: not a binary ledger'.format(filename))
+
+        counts = {
+            'cents': nrows,
+            'dates': nrows,
+            'parents': nrows,
+            'comments': nrows,
+            'tags': nrows,
+            'flags': nrows,
+            'exponents': nrows,
+            'tagnames': ntags,
+            'offsets': nstrings + 1,
+        }
+        # the blob is the last section, so its length is not needed to
+        # find the offsets - it is the last entry in the offsets section
+        counts['blob'] = 0
+        offsets, _ = _layout(counts)
+        counts['blob'] = struct.unpack_from(
+            '<I', self.buf, offsets['offsets'] + nstrings * 4)[0]
+        if len(self.buf) < offsets['blob'] + counts['blob']:
+            raise ValueError('{}: truncated binary ledger'.format(filename))
+
+        for name, fmt, item_size in SECTIONS:
+            start = offsets[name]
+            end = start + counts[name] * item_size
+            setattr(self, name, self.buf[start:end].cast(fmt))
+
+    def close(self):
+        for name, fmt, size in SECTIONS:
+            getattr(self, name).release()
+        self.buf.release()
+        if self.mmap is not None:
+            self.mmap.close()
+
+    def __len__(self):
+        return len(self.cents)
+
+    def string(self, i):
+        return self.blob[self.offsets[i]:self.offsets[i+1]].tobytes() \
+            .decode('utf-8')
+
+    def tag(self, i):
+        """Return the hashtag for row i
+        """
+        tag = self.tags[i]
+        if tag == NO_TAG:
+            return None
+        return self.string(self.tagnames[tag])
+
+    def indexes(self, split=True, filters=None):
+        """Return the indexes of all the rows making up the given view, that
+           match the list of filter strings
+        """
+        parents = self.parents
+        if not split:
+            result = [i for i in range(len(self)) if parents[i] == -1]
+        else:
+            flags = self.flags
+            result = [i for i in range(len(self))
+                      if parents[i] != -1 or not flags[i] & FLAG_HAS_CHILDREN]
+
+        for string in filters or []:
+            result = self._filter(result, string)
+        return result
+
+    def _field_key(self, field):
+        """For the fields that the filters usually look at, return a function
+           giving a cheap key for row i and a function turning that key into
+           the value that Row._getvalue_simple() would give.  The rows of a
+           ledger share only a few different tags, dates and comments, so
+           each filter needs checking only once for each key
+        """
+        fromordinal = datetime.date.fromordinal
+
+        if field == 'hashtag':
+            def value(k):
+                # str() is how Row compares a missing hashtag
+                if k == NO_TAG:
+                    return 'None'
+                return self.string(self.tagnames[k])
+            return self.tags.__getitem__, value
+
+        if field == 'comment':
+            return self.comments.__getitem__, self.string
+
+        if field in ('month', 'date', 'rel_months'):
+            def value(k):
+                date = fromordinal(k)
+                if field == 'month':
+                    return date.strftime('%Y-%m')
+                if field == 'date':
+                    return str(date)
+                return Row._rel_months(date)
+            return self.dates.__getitem__, value
+
+        if field == 'direction':
+            def key(i):
+                return self.cents[i] < 0
+
+            def value(k):
+                return 'outgoing' if k else 'incoming'
+            return key, value
+
+        if field == 'value':
+            # the exponent makes no difference to the comparisons
+            return self.cents.__getitem__, from_cents
+
+        return None, None
+
+    def _filter(self, indexes, string):
+        """Return the indexes of the rows matching the filter string, taking
+           the values straight from the columns where possible
+        """
+        field, op, value_match = parse_filter(string)
+        key, value = self._field_key(field)
+        if key is None:
+            # anything unusual is checked on a real Row
+            return [i for i in indexes if self.row(i).filter(string)]
+
+        matches = {}
+        result = []
+        for i in indexes:
+            k = key(i)
+            match = matches.get(k)
+            if match is None:
+                match = matches[k] = filter_match(value(k), op, value_match)
+            if match:
+                result.append(i)
+        return result
+
+    def row(self, i):
+        # keep the exponent from the text file, so that a value like "7.20"
+        # is still rendered as such
+        date = datetime.date.fromordinal(self.dates[i])
+        return Row.from_cents(self.cents[i], date,
+                              self.string(self.comments[i]),
+                              self.exponents[i])
+
+    def rowset(self, split=True, filters=None):
+        """Build a normal RowSet from the given view, with only the rows
+           matching the list of filter strings
+        """
+        result = RowSet()
+        result.append([self.row(i) for i in self.indexes(split, filters)])
+        return result
+
+    def value(self, split=True, filters=None):
+        """Sum the value of the view directly from the cents column
+        """
+        cents = self.cents
+        exponents = self.exponents
+        total = 0
+        exponent = 0
+        for i in self.indexes(split, filters):
+            total += cents[i]
+            exponent = min(exponent, exponents[i])
+        return value_of(total, exponent)
+
+    def _group_key(self, field):
+        if field == 'month':
+            def key(i):
+                date = datetime.date.fromordinal(self.dates[i])
+                return date.replace(day=1)
+        elif field == 'hashtag':
+            def key(i):
+                return self.tag(i) or 'unknown'
+        else:
+            raise ValueError('cannot group by "{}"'.format(field))
+        return key
+
+    def group_value(self, field, split=True, filters=None):
+        """Return a dict of the summed value of the view grouped by the
+           given field, using the same keys as RowSet.group_by().  Given a
+           tuple of fields, the rows are grouped by all of them and each key
+           is a tuple
+        """
+        if isinstance(field, tuple):
+            keys = [self._group_key(x) for x in field]
+
+            def key(i):
+                return tuple(k(i) for k in keys)
+        else:
+            key = self._group_key(field)
+
+        cents = self.cents
+        exponents = self.exponents
+        result = {}
+        for i in self.indexes(split, filters):
+            k = key(i)
+            total, exponent = result.get(k, (0, 0))
+            result[k] = (total + cents[i], min(exponent, exponents[i]))
+
+        return dict((k, value_of(*v)) for k, v in result.items())
@@ -0,0 +1,140 @@
+# Licensed under GPLv3
+from ledgerdir import LedgerFile, FileIndex
+
+
+# How many of the members who first paid their dues in a given month (their
+# cohort) were still paying some number of months later.
+#
+# The dues rows (split, so that paying for several months at once counts for
+# each of them) are boiled down to the months that each member paid for, as
+# the month they first paid and a bitset of the months since then.  The last
+# month they paid is the highest bit set.  The retention matrix then only
+# needs one pass over the set bits of each member.
+#
+# That presence data is small, and can be worked out for each file on its
+# own and then joined with an OR of the bitsets.  So the presence for each
+# file can be kept in a JSON file, and when only the current month has
+# changed, just that one file is loaded again.
+
+VERSION = 1
+
+
+def month_index(date):
+    """Return the number of the month of the date, counting from year zero
+    """
+    return date.year * 12 + date.month - 1
+
+
+def month_str(index):
+    return '{:04}-{:02}'.format(index // 12, index % 12 + 1)
+
+
+def presence(rows):
+    """Return a dict of the handle of each member who paid dues and a pair
+       of the first month they paid for and a bitset of the months they
+       paid for, with bit 0 being that first month
+    """
+    months = {}
+    for row in rows:
+        tag = row.hashtag
+        if row.cents < 0 or tag is None or not tag.startswith('dues:'):
+            continue
+        months.setdefault(tag[5:], set()).add(month_index(row.date))
+
+    result = {}
+    for handle, paid in months.items():
+        first = min(paid)
+        bits = 0
+        for month in paid:
+            bits |= 1 << (month - first)
+        result[handle] = (first, bits)
+    return result
+
+
+def merge(result, other):
+    """Add the months paid in the other presence dict to the result dict
+    """
+    for handle, (first, bits) in other.items():
+        if handle in result:
+            prev_first, prev_bits = result[handle]
+            low = min(first, prev_first)
+            bits = (bits << (first - low)) | (prev_bits << (prev_first - low))
+            first = low
+        result[handle] = (first, bits)
+    return result
+
+
+def last_month(first, bits):
+    return first + bits.bit_length() - 1
+
+
+def matrix(members):
+    """Return the retention matrix of the presence dict, as a sorted list of
+       (cohort, counts) where counts[n] is the number of members of that
+       cohort who paid for the month n months after it (so counts[0] is the
+       size of the cohort).  The counts go up to the last month anyone paid
+       for
+    """
+    if not members:
+        return []
+    end = max(last_month(*x) for x in members.values())
+
+    cohorts = {}
+    for first, bits in members.values():
+        counts = cohorts.get(first)
+        if counts is None:
+            counts = cohorts[first] = [0] * (end - first + 1)
+        while bits:
+            low = bits & -bits
+            counts[low.bit_length() - 1] += 1
+            bits ^= low
+    return [(x, cohorts[x]) for x in sorted(cohorts)]
+
+
+def table(members):
+    """Return the header and the lines of the retention table, with one line
+       for each cohort
+    """
+    cohorts = matrix(members)
+    width = max([len(x[1]) for x in cohorts] or [1])
+    header = ['cohort', 'members'] + [str(x) for x in range(1, width)]
+    lines = []
+    for cohort, counts in cohorts:
+        padding = [''] * (width - len(counts))
+        lines.append([month_str(cohort)] + counts + padding)
+    return header, lines
+
+
+def file_entry(filename):
+    """Return the state kept for one ledger file: its digest and presence
+    """
+    entry = LedgerFile(filename)
+    return {
+        'digest': entry.digest,
+        # json only has floats for big numbers, so bitsets are in hex
+        'members': dict(
+            (handle, [first, '{:x}'.format(bits)])
+            for handle, (first, bits) in presence(entry.split).items()
+        ),
+    }
+
+
+class CohortState(FileIndex):
+    """The presence of the members in each file of a ledger directory, kept
+       in the named JSON file.  Without a filename it is only kept in memory
+    """
+
+    def __init__(self, filename=None):
+        FileIndex.__init__(self, file_entry, VERSION, filename)
+
+    def members(self):
+        """Return the presence dict for all the files
+        """
+        result = {}
+        for name in sorted(self.files):
+            merge(result, dict(
+                (handle, (first, int(bits, 16)))
+                for handle, (first, bits) in
+                self.files[name]['members'].items()
+            ))
+        return result
@@ -0,0 +1,217 @@
+# Licensed under GPLv3
+import re
+
+try:
+    # python 3.11
+    from re import _parser as sre_parse
+    from re import _constants as sre_constants
+except ImportError:
+    import sre_parse
+    import sre_constants
+
+from row import parse_filter
+from ledgerdir import LedgerFile, FileIndex
+
+
+# An inverted index of the comments in a ledger directory, for finding the
+# few rows mentioning a name (or "PayPal", or a workshop title) without
+# parsing every file and running a regex against every row.
+#
+# For each file, the index keeps its digest, the list of its different
+# comments (including those of the split rows) and, for every trigram of
+# the lowercased comments, the list of comments containing it.  Only the
+# files whose digest has changed are indexed again.
+#
+# A regex filter on the comment (or hashtag, which is a part of the comment)
+# can only match a comment containing every literal string that the regex
+# requires, and such a comment must contain every trigram of those strings.
+# So the index narrows down the files that need loading, and the exact
+# filter is then run on just the rows of those files.  Comments with any
+# non-ascii characters might match a case insensitive regex in ways that
+# lowercasing does not show, so those are always kept as candidates.
+
+VERSION = 1
+
+
+def trigrams(string):
+    return set(string[i:i + 3] for i in range(len(string) - 2))
+
+
+def _runs(parsed):
+    """Return the literal strings that any match of the parsed regex must
+       contain, lowercased
+    """
+    runs = []
+    current = []
+
+    def end_run():
+        if current:
+            runs.append(''.join(current))
+            del current[:]
+
+    for op, av in parsed:
+        if op is sre_constants.LITERAL and av < 128:
+            current.append(chr(av).lower())
+            continue
+
+        end_run()
+        if op is sre_constants.SUBPATTERN:
+            runs += _runs(av[-1])
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+            low, high, sub = av
+            if low >= 1:
+                runs += _runs(sub)
+        # anything else might match many different strings
+
+    end_run()
+    return runs
+
+
+def literals(pattern):
+    """Return a list of alternatives, each a list of the lowercased strings
+       that a comment must all contain for the pattern to match it with a
+       case insensitive re.search().  Returns None if the pattern does not
+       require any strings long enough to look up in the index
+    """
+    parsed = list(sre_parse.parse(pattern))
+    if len(parsed) == 1 and parsed[0][0] is sre_constants.BRANCH:
+        branches = parsed[0][1][1]
+    else:
+        branches = [parsed]
+
+    result = []
+    for branch in branches:
+        required = [x for x in _runs(branch) if len(x) >= 3]
+        if not required:
+            return None
+        result.append(required)
+    return result
+
+
+def file_entry(filename):
+    """Return the index entry for one ledger file
+    """
+    entry = LedgerFile(filename)
+    comments = []
+    seen = set()
+    for row in list(entry.rows) + list(entry.split):
+        if row.comment not in seen:
+            seen.add(row.comment)
+            comments.append(row.comment)
+
+    postings = {}
+    other = []
+    for i, comment in enumerate(comments):
+        try:
+            comment.encode('ascii')
+        except UnicodeError:
+            other.append(i)
+        for trigram in trigrams(comment.lower()):
+            postings.setdefault(trigram, []).append(i)
+
+    return {
+        'digest': entry.digest,
+        'comments': comments,
+        'trigrams': postings,
+        'other': other,
+    }
+
+
+class CommentIndex(FileIndex):
+    """The comment index of a ledger directory, kept in the named JSON file.
+       Without a filename the index is only kept in memory
+    """
+
+    def __init__(self, filename=None):
+        FileIndex.__init__(self, file_entry, VERSION, filename)
+
+    @staticmethod
+    def _containing(entry, string):
+        """Return the set of comment ids in the file entry whose lowercased
+           comment contains the lowercased string
+        """
+        string = string.lower()
+        comments = entry['comments']
+        if len(string) < 3:
+            ids = range(len(comments))
+        else:
+            ids = None
+            for trigram in trigrams(string):
+                posting = set(entry['trigrams'].get(trigram, ()))
+                ids = posting if ids is None else ids & posting
+                if not ids:
+                    return set()
+        return set(i for i in ids if string in comments[i].lower())
+
+    def _may_match(self, entry, alternatives):
+        if entry['other']:
+            return True
+        for required in alternatives:
+            ids = None
+            for string in required:
+                found = self._containing(entry, string)
+                ids = found if ids is None else ids & found
+            if ids:
+                return True
+        return False
+
+    def prefilter(self, filter_strings):
+        """Return the set of names of the only files that might have rows
+           matching all of the filters, or None if the index cannot tell
+        """
+        names = None
+        for string in filter_strings or []:
+            field, op, value_match = parse_filter(string)
+            if op != '=~' or field not in ('comment', 'hashtag') or \
+                    not isinstance(value_match, str):
+                continue
+            if field == 'hashtag' and re.search(value_match, 'None', re.I):
+                # a row without a hashtag might match
+                continue
+            alternatives = literals(value_match)
+            if alternatives is None:
+                continue
+
+            found = set(
+                name for name, entry in self.files.items()
+                if self._may_match(entry, alternatives)
+            )
+            names = found if names is None else names & found
+        return names
+
+    def search(self, terms):
+        """Search for the comments containing the terms, ignoring case.  The
+           terms are all required, unless separated by "OR", and a term
+           starting with "-" (or following "NOT") must not be present.
+           Returns the set of file names and the set of matching comments
+        """
+        groups = [[]]
+        negate = False
+        for term in terms:
+            if term == 'OR':
+                groups.append([])
+            elif term == 'NOT':
+                negate = True
+            elif term.startswith('-') and len(term) > 1:
+                groups[-1].append((True, term[1:]))
+            else:
+                groups[-1].append((negate, term))
+                negate = False
+        groups = [x for x in groups if x]
+
+        names = set()
+        comments = set()
+        for name, entry in self.files.items():
+            ids = set()
+            for group in groups:
+                matched = set(range(len(entry['comments'])))
+                for negated, term in group:
+                    if negated:
+                        matched -= self._containing(entry, term)
+                    else:
+                        matched &= self._containing(entry, term)
+                ids |= matched
+            if ids:
+                names.add(name)
+                comments.update(entry['comments'][i] for i in ids)
+        return names, comments
@@ -0,0 +1,75 @@
+# Licensed under GPLv3
+import re
+
+
+# Finding the rows that were entered twice.
+#
+# The usual mistakes are typing in the same transaction twice (perhaps with
+# the date off by a day, or the words of the comment in another order) and
+# pasting a row into the files of two months.  Either way, both rows have
+# the same value, the same tag and the same words in their comment, so each
+# row gets a fingerprint of those.  Rows are put into hash buckets by their
+# fingerprint, and only the rows within a bucket are compared by date - so
+# the whole ledger is checked in close to linear time.
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+
+def fingerprint(row):
+    """Return the value, tag and sorted set of lowercased comment words of
+       the row
+    """
+    tokens = sorted(set(TOKEN_RE.findall(row.comment.lower())))
+    return (row.cents, (row.hashtag or '').lower(), tuple(tokens))
+
+
+def file_rows(files):
+    """Given a dict of the LedgerFile of each file name, return a list of
+       (name, row) for all of their original (not split) rows
+    """
+    result = []
+    for name in sorted(files):
+        result += [(name, row) for row in files[name].rows]
+    return result
+
+
+def find(items, days=1):
+    """Return the groups of possible duplicates in the list of (source, row)
+       items.  The rows of a group have the same fingerprint and each is
+       dated no more than the given number of days after the one before.
+       Each group is a list of (source, row), and the groups are in the
+       order of their first date
+    """
+    buckets = {}
+    for source, row in items:
+        buckets.setdefault(fingerprint(row), []).append((source, row))
+
+    groups = []
+    for bucket in buckets.values():
+        if len(bucket) < 2:
+            continue
+        bucket.sort(key=lambda x: x[1].date)
+        group = [bucket[0]]
+        for item in bucket[1:]:
+            if (item[1].date - group[-1][1].date).days <= days:
+                group.append(item)
+                continue
+            if len(group) > 1:
+                groups.append(group)
+            group = [item]
+        if len(group) > 1:
+            groups.append(group)
+
+    groups.sort(key=lambda x: x[0][1].date)
+    return groups
+
+
+def render(groups):
+    """Return the groups as text, with a blank line between each group
+    """
+    output = []
+    for group in groups:
+        output.append('\n'.join(
+            '{}: {}'.format(source, row) if source else str(row)
+            for source, row in group))
+    return '\n\n'.join(output)
@@ -0,0 +1,150 @@
+# Licensed under GPLv3
+import datetime
+import heapq
+import operator
+import os
+
+from rowset import RowSet
+from row import Row, from_cents
+import ledgerfiles
+
+
+# Several ledger directories - one for each cash box or account (eg: petty
+# cash, PayPal and the bank) - loaded together as one set of rows.
+#
+# Each account is loaded on its own (in parallel, one process each) and its
+# rows are labelled with the account name, which the filters, grid and stats
+# can then use like any other field.  The "#balance" pragmas already check
+# the running balance within each file, and loading an account also checks
+# that each file opens with the balance that the files before it closed
+# with.  A gap between two files is reported rather than refused, as the
+# rows themselves are still fine.  The rows of each account are sorted by
+# date, and the accounts are then joined with a k-way merge, so the result
+# is in date order.
+#
+# Money moved from one account to another shows up as an outgoing row in one
+# and an incoming row of the same value in the other, and transfers() pairs
+# those up.
+
+
+def parse_accounts(specs):
+    """Turn a list of "name=dirname" strings into a list of (name, dirname)
+    """
+    result = []
+    names = set()
+    for spec in specs:
+        name, sep, dirname = spec.partition('=')
+        if not sep or not name or not dirname:
+            raise ValueError(
+                'accounts must be given as name=dirname, not "{}"'.format(
+                    spec))
+        if name in names:
+            raise ValueError('account "{}" given twice'.format(name))
+        names.add(name)
+        result.append((name, dirname))
+    return result
+
+
+def load_account(name, dirname, split=True):
+    """Load the files of one account, checking the balance carries on from
+       one file to the next.  Returns the list of its rows, labelled with
+       the account name and sorted by date, and a list describing any gaps
+       in the balance
+    """
+    rows = []
+    gaps = []
+    balance = None
+    for filename in ledgerfiles.find(dirname):
+        entry = RowSet()
+        entry.load_file(filename)
+
+        opening = entry.opening_balance
+        if opening is not None:
+            if balance is not None and opening != balance:
+                gaps.append(
+                    '{}: {} opens with balance {} but the files before it '
+                    'close with {}'.format(
+                        name, filename, from_cents(opening),
+                        from_cents(balance)))
+            balance = opening
+        if balance is not None:
+            balance += entry.cents
+
+        for row in entry:
+            row = row._replace(account=name)
+            if split:
+                rows += row.autosplit()
+            else:
+                rows.append(row)
+
+    # sorted() is stable, so rows of the same date keep their file order
+    return sorted(rows, key=operator.attrgetter('date')), gaps
+
+
+def _load_worker(name, dirname, split):
+    # plain tuples are much quicker to pass back from the worker than rows,
+    # which pickle as a call to Row.from_cents() each
+    rows, gaps = load_account(name, dirname, split)
+    return [tuple(x) for x in rows], gaps
+
+
+def load(accounts, split=True, jobs=None):
+    """Load the list of (name, dirname) accounts, using up to jobs processes
+       (by default, one for each cpu), and return a RowSet with all their
+       rows in date order, and the list of balance gaps found.  Rows of the
+       same date are in the order the accounts were given
+    """
+    names = [x[0] for x in accounts]
+    dirnames = [x[1] for x in accounts]
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    jobs = min(jobs, len(accounts))
+
+    if jobs > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(jobs) as pool:
+            loaded = [
+                ([Row._make(x) for x in rows], gaps)
+                for rows, gaps in pool.map(
+                    _load_worker, names, dirnames, [split] * len(accounts))
+            ]
+    else:
+        loaded = [load_account(*x, split=split) for x in accounts]
+
+    result = RowSet()
+    result.append(list(heapq.merge(*[x[0] for x in loaded],
+                                   key=operator.attrgetter('date'))))
+    return result, sum([x[1] for x in loaded], [])
+
+
+def transfers(rows, days=3):
+    """Pair up the outgoing rows of one account with incoming rows of the
+       same value in another account, dated no more than the given number
+       of days later or earlier (the nearest date is preferred).  Each row
+       is used in at most one pair.  Returns the list of (outgoing, incoming)
+       rows in the order of the outgoing rows
+    """
+    # the incoming rows are the build side of a hash join on value and date
+    incoming = {}
+    for row in rows:
+        if row.cents > 0 and row.account is not None:
+            incoming.setdefault((row.cents, row.date), []).append(row)
+
+    offsets = [0]
+    for i in range(1, days + 1):
+        offsets += [i, -i]
+
+    pairs = []
+    for row in rows:
+        if row.cents >= 0 or row.account is None:
+            continue
+        for offset in offsets:
+            date = row.date + datetime.timedelta(offset)
+            bucket = incoming.get((-row.cents, date), ())
+            match = next(
+                (x for x in bucket if x.account != row.account), None)
+            if match is not None:
+                bucket.remove(match)
+                pairs.append((row, match))
+                break
+    return pairs
@@ -0,0 +1,260 @@
+# Licensed under GPLv3
+from collections import namedtuple, Counter
+import math
+import random
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from row import from_cents
+from cohorts import presence, month_index, month_str
+
+
+# How long the money lasts, if the members keep coming and going as they
+# have lately.
+#
+# The recent months of the ledger show which "#bills:" tags are paid
+# regularly, how often and how much, and so what they will cost in each of
+# the months ahead.  The bills are taken from the nosplit rows, as that is
+# when the money goes - a bill paid for three months at once with
+# "!months:3" is a quarterly bill, not a monthly one.  The split rows (so
+# that paying for several months at once counts for each of them) show how
+# many members pay each month, how many of them stop paying the next month,
+# how many new members join and what each paying member brings in.
+#
+# None of those are certain, so many scenarios are run: each one picks its
+# own rate of members leaving (from what has been seen so far), and for
+# each month how many leave and join and the dues brought in per member (one
+# of the recent months, picked at random).  The runway of a scenario is the
+# number of whole months before its balance goes below zero.  The balance
+# starts from the running balance of the split rows (as the grid shows it).
+#
+# With numpy, all the scenarios are worked out together, one month at a
+# time.  Without it, each scenario is worked out in turn.
+
+Bill = namedtuple('Bill', ('tag', 'cents', 'cadence', 'last'))
+
+
+def recurring_bills(rows, end, history=12):
+    """Return the list of Bill for the "#bills:" tags paid regularly in the
+       history months before the end month (a month_index()), given the
+       nosplit rows.  The cadence is the usual number of months between
+       payments - or for a bill paid only once, the number of months its
+       "!months" bangtag says it paid for - and the cents the usual (median)
+       payment.  Bills with a payment missed by the end month are taken to
+       have stopped
+    """
+    start = end - history
+    paid = {}
+    covers = {}
+    for row in rows:
+        tag = row.hashtag
+        if row.cents >= 0 or tag is None or not tag.startswith('bills:'):
+            continue
+        month = month_index(row.date)
+        if start <= month < end:
+            months = paid.setdefault(tag, {})
+            months[month] = months.get(month, 0) + row.cents
+            # the number of months the payment is for
+            covers[tag] = max(covers.get(tag, 1), len(row._split_dates()))
+
+    result = []
+    for tag in sorted(paid):
+        months = sorted(paid[tag])
+        if len(months) > 1:
+            gaps = Counter(b - a for a, b in zip(months, months[1:]))
+            cadence = min(gaps, key=lambda x: (-gaps[x], x))
+        elif covers[tag] > 1:
+            cadence = covers[tag]
+        else:
+            continue
+        if months[-1] + cadence < end:
+            continue
+        payments = sorted(paid[tag].values())
+        result.append(Bill(tag, payments[len(payments) // 2], cadence,
+                           months[-1]))
+    return result
+
+
+def costs(bills, end, months):
+    """Return a list of the cents the bills will cost in each of the months
+       starting at the end month
+    """
+    result = [0] * months
+    for bill in bills:
+        first = bill.last + bill.cadence
+        for month in range(first, end + months, bill.cadence):
+            if month >= end:
+                result[month - end] += bill.cents
+    return result
+
+
+def membership(rows, end, history=12):
+    """Return a dict describing the members paying dues in the history
+       months before the end month: the number of 'members' paying in the
+       last of them, the number of times a paying member 'left' or 'stayed'
+       the month after, the average number of members joining each month
+       ('joins') and the list of dues per paying member ('arpm') for each
+       month with any
+    """
+    start = end - history
+    members = presence(rows)
+
+    dues = {}
+    for row in rows:
+        tag = row.hashtag
+        if row.cents < 0 or tag is None or not tag.startswith('dues:'):
+            continue
+        month = month_index(row.date)
+        if start <= month < end:
+            dues[month] = dues.get(month, 0) + row.cents
+
+    paying = dict((month, 0) for month in range(start, end))
+    joins = 0
+    left = 0
+    stayed = 0
+    for first, bits in members.values():
+        if start < first < end:
+            joins += 1
+        for month in range(max(start, first), end):
+            if not (bits >> (month - first)) & 1:
+                continue
+            paying[month] += 1
+            if month + 1 < end:
+                if (bits >> (month + 1 - first)) & 1:
+                    stayed += 1
+                else:
+                    left += 1
+
+    return {
+        'members': paying[end - 1] if history else 0,
+        'left': left,
+        'stayed': stayed,
+        'joins': joins / float(max(history - 1, 1)),
+        'arpm': [
+            dues.get(month, 0) // paying[month]
+            for month in range(start, end) if paying[month]
+        ],
+    }
+
+
+def _binomial(rng, n, p):
+    # skip from one success to the next, rather than trying each in turn,
+    # which is quick when (as for members leaving) p is small
+    if p <= 0:
+        return 0
+    if p >= 1:
+        return n
+    log_q = math.log(1 - p)
+    count = 0
+    trial = 0
+    while True:
+        trial += int(math.log(1 - rng.random()) / log_q) + 1
+        if trial > n:
+            return count
+        count += 1
+
+
+def _poisson(rng, mean):
+    # Knuth's method, fine for the few members joining in a month
+    limit = math.exp(-mean)
+    count = 0
+    product = rng.random()
+    while product > limit:
+        count += 1
+        product *= rng.random()
+    return count
+
+
+def simulate(balance, costs, members, scenarios=10000, seed=None,
+             use_numpy=True):
+    """Run the scenarios forward from the balance (in cents) through the
+       months of costs, starting with the membership dict.  Returns the
+       list of the runway of each scenario (len(costs) if the money never
+       ran out) and, for each month, the list of the balance of each
+       scenario at the end of it
+    """
+    months = len(costs)
+    alpha = members['left'] + 1
+    beta = members['stayed'] + 1
+    arpm = members['arpm'] or [0]
+
+    if use_numpy and numpy is not None:
+        rng = numpy.random.default_rng(seed)
+        churn = rng.beta(alpha, beta, scenarios)
+        arpm = numpy.array(arpm, dtype=numpy.int64)
+        count = numpy.full(scenarios, members['members'], dtype=numpy.int64)
+        balances = numpy.full(scenarios, balance, dtype=numpy.int64)
+        runway = numpy.full(scenarios, months, dtype=numpy.int64)
+        result = []
+        for month in range(months):
+            count = rng.binomial(count, 1 - churn) + \
+                rng.poisson(members['joins'], scenarios)
+            balances = balances + count * rng.choice(arpm, scenarios) + \
+                costs[month]
+            runway[(balances < 0) & (runway == months)] = month
+            result.append(balances.tolist())
+        return runway.tolist(), result
+
+    rng = random.Random(seed)
+    runway = []
+    result = [[] for _ in range(months)]
+    for _ in range(scenarios):
+        churn = rng.betavariate(alpha, beta)
+        count = members['members']
+        money = balance
+        out = months
+        for month in range(months):
+            count += _poisson(rng, members['joins']) - \
+                _binomial(rng, count, churn)
+            money += count * rng.choice(arpm) + costs[month]
+            if money < 0 and out == months:
+                out = month
+            result[month].append(money)
+        runway.append(out)
+    return runway, result
+
+
+def percentile(values, percent):
+    """Return the value that the given percentage of the values are below
+    """
+    values = sorted(values)
+    return values[min(len(values) - 1, len(values) * percent // 100)]
+
+
+def render(start, balance, bills, members, runway, balances, scenarios,
+           percents=(10, 50, 90)):
+    """Return the forecast as text
+    """
+    months = len(balances)
+    output = ['running balance {} at the start of {}'.format(
+        from_cents(balance), month_str(start))]
+
+    output.append('recurring bills')
+    for bill in bills:
+        output.append('  {:<24} {:>10} every {} months, next {}'.format(
+            bill.tag, from_cents(bill.cents), bill.cadence,
+            month_str(bill.last + bill.cadence)))
+
+    changes = members['left'] + members['stayed']
+    output.append(
+        'members {}, joining {:.1f} and leaving {:.1f}% a month'.format(
+            members['members'], members['joins'],
+            100.0 * members['left'] / changes if changes else 0))
+
+    output.append('runway in months, over {} scenarios'.format(scenarios))
+    for percent in percents:
+        value = percentile(runway, percent)
+        output.append('  {:>3}% {}'.format(
+            percent, '{}+'.format(months) if value == months else value))
+
+    output.append('balance')
+    output.append('  {:<7} '.format('month') + ' '.join(
+        '{:>10}'.format('{}%'.format(x)) for x in percents))
+    for month in range(months):
+        output.append('  {:<7} '.format(month_str(start + month)) + ' '.join(
+            '{:>10}'.format(from_cents(percentile(balances[month], x)))
+            for x in percents))
+    return '\n'.join(output)
@@ -0,0 +1,597 @@
+# Licensed under GPLv3
+import functools
+import datetime
+import decimal
+
+import render
+import timings
+
+
+# A ledger, and the reports that can be made from it as plain data.
+#
+# balance.py is only a commandline shell around this: it parses the options,
+# asks a Ledger for a report and renders the result as text.  Anything else
+# wanting the reports - for example a web service keeping one ledger in
+# memory between requests - can use a Ledger directly without going through
+# argparse.
+
+# Ensure we do not invent more money.  Each thread has its own decimal
+# context, copied from the DefaultContext when the thread first uses one, so
+# set both for any report run in another thread
+decimal.DefaultContext.rounding = decimal.ROUND_DOWN
+decimal.getcontext().rounding = decimal.ROUND_DOWN
+
+
+def label_inout(row):
+    """Label a row with its hashtag and its direction, eg: "bills:rent out"
+    """
+    tag = row.hashtag
+    if tag is None:
+        tag = 'unknown'
+    if row.direction == 'outgoing':
+        return tag + ' out'
+    return tag + ' in'
+
+
+def label_account(row):
+    """Label a row with the account it was loaded from, eg: "bank"
+    """
+    if row.account is None:
+        return 'unknown'
+    return row.account
+
+
+def label_account_inout(row):
+    """Label a row with its account and its direction, eg: "bank out"
+    """
+    if row.direction == 'outgoing':
+        return label_account(row) + ' out'
+    return label_account(row) + ' in'
+
+
+def label_member(row):
+    """Label a dues row with the name of the member, eg: "Test1"
+    """
+    a = row.hashtag.split(':')
+    return ''.join(a[1:]).title()
+
+
+def grid_accumulate(rows, engine='python', label=None):
+    """Accumulate the rows into month+tag buckets.  If a label function is
+       given, it is used in place of the hashtag of each row
+    """
+    if engine == 'numpy':
+        import vectorized
+        return vectorized.grid_accumulate(rows, label=label)
+
+    grid = {}
+    totals = {}
+    months_present = set()
+
+    months = rows.group_by('month')
+    for month in months:
+        months_present.add(month)
+        totals[month] = months[month].value
+
+        tags = months[month].group_by(label or 'hashtag')
+
+        for tag in tags:
+            # I would prefer auto-vivification to all these if statements
+            if tag not in grid:
+                grid[tag] = {}
+
+            grid[tag][month] = {}
+            grid[tag][month]['sum'] = tags[tag].value
+
+    totals['total'] = rows.value
+
+    return months_present, grid, totals, \
+        grid_running_totals(months_present, totals)
+
+
+def grid_running_totals(months, totals):
+    """Return the running total at the end of each month, given the total
+       of each month
+    """
+    running_totals = {}
+    running_total = 0
+    for month in sorted(months):
+        running_total += totals[month]
+
+        # if we have only zeros after the decimal, change to an int
+        if int(running_total) == running_total:
+            running_total = running_total.to_integral_exact()
+
+        running_totals[month] = running_total
+
+    return running_totals
+
+
+def topay_accumulate(rows):
+    """Accumulate the outgoing rows into month+tag buckets, returning the
+       list of tags, the list of months and a dict of the price and the
+       last pay date for each bucket
+    """
+    rows = rows.filter(['direction==outgoing'])
+    alltags = sorted(rows.group_by('hashtag').keys())
+
+    months = rows.group_by('month')
+
+    cells = {}
+    for month in months:
+        cells[month] = {}
+        monthtags = months[month].group_by('hashtag')
+        for hashtag in monthtags:
+            cells[month][hashtag] = (
+                monthtags[hashtag].value,
+                monthtags[hashtag].last().date,
+            )
+
+    return alltags, sorted(months), cells
+
+
+def stats_accumulate(rows, cache=None):
+    """Calculate the stats for each previous month, the total of those and
+       the current month to date.  Returns the stats and the list of months
+
+       If a cache dict is given, the stats for each month are kept in it and
+       reused the next time - it is up to the caller to remove any months
+       whose rows have changed
+    """
+    # stats are only likely to be valid for previous months
+    current_month = rows.filter(['rel_months==0'])
+    rows = rows.filter(['rel_months<0'])
+
+    def stats_rowset(rowset):
+        r = {}
+        r['incoming'] = rowset.filter(['value>0'])
+        r['outgoing'] = rowset.filter(['value<0'])
+        # TODO - values of zero?  we have one member as such, but it is a
+        # exceptional case
+        r['dues']     = rowset.filter(['hashtag=~^dues:']) # noqa
+        r['members']  = len(r['dues'].group_by('hashtag').keys()) # noqa
+        if r['members']:
+            r['ARPM'] = int(r['dues'].value / r['members']) # noqa
+        else:
+            r['ARPM'] = -1
+
+        r['other']    = rowset.filter(['value>0','hashtag!~^dues:']) # noqa
+
+        return r
+
+    result = {}
+    months = rows.group_by('month')
+    for k, month in months.items():
+        if cache is not None and k in cache:
+            result[k] = cache[k]
+            continue
+        result[k] = stats_rowset(month)
+        if cache is not None:
+            cache[k] = result[k]
+
+    months = sorted(result.keys())
+
+    result['Total'] = stats_rowset(rows)
+    result['MonthTD'] = stats_rowset(current_month)
+
+    return result, months
+
+
+class StatValue(object):
+    """Stands in for a RowSet in the stats results, holding a single value
+       that is not necessarily a whole number of cents (eg: an average)
+    """
+
+    def __init__(self, value):
+        self.value = value
+
+    def group_by(self, field):
+        # behave like a RowSet containing a single fake row
+        return {'fake': self}
+
+
+def pinned(report):
+    """Run a report method of a directory Ledger on a snapshot of it, so
+       that the whole report sees one version of the ledger even if it is
+       refreshed by another thread in the meantime
+    """
+    @functools.wraps(report)
+    def wrapper(self, *args, **kwargs):
+        return report(self.snapshot(), *args, **kwargs)
+    return wrapper
+
+
+class Ledger(object):
+    """A ledger loaded from one of:
+
+       dirname      a directory of text files, kept in memory and only
+                    reloaded as the files change (see refresh())
+       load_binary  a file written by the export_binary sub-command
+       sqlite       a SQLite mirror of the dirname, which also runs the
+                    filters
+
+       Each report works on one view of the rows - split or nosplit, and
+       filtered by a list of filter strings - and returns plain data.  The
+       engine is 'python' or 'numpy' (see vectorized.py)
+
+       A directory ledger can be shared by threads, with one of them
+       calling refresh() while the others run reports (see LedgerDir)
+    """
+
+    def __init__(self, dirname=None, engine='python', load_binary=None,
+                 sqlite=None):
+        self.engine = engine
+        self._rows = None
+        self._stats_caches = {}
+
+        with timings.phase('parse'):
+            if load_binary:
+                import binledger
+                self._source = binledger.BinLedger(load_binary)
+                self._kind = 'binary'
+            elif sqlite:
+                from sqlstore import SqlStore
+                self._source = SqlStore(sqlite)
+                self._source.refresh(dirname)
+                self._kind = 'sqlite'
+            else:
+                from ledgerdir import LedgerDir
+                self._source = LedgerDir(dirname)
+                self._kind = 'dir'
+        self.dirname = dirname
+
+    @classmethod
+    def from_rows(cls, rows, engine='python', stats_cache=None):
+        """Return a Ledger over an already loaded RowSet, which is used as it
+           is for both the split and nosplit views.  If a stats_cache dict
+           is given, the stats of each month are kept in it (see
+           stats_accumulate())
+        """
+        self = cls.__new__(cls)
+        self.engine = engine
+        self.dirname = None
+        self._source = None
+        self._kind = 'rows'
+        self._rows = rows
+        self._stats_caches = {True: stats_cache, False: stats_cache}
+        return self
+
+    @classmethod
+    def from_columns(cls, columns, engine='python'):
+        """Return a Ledger over an already open BinLedger, such as the one of
+           a shared ledger snapshot (see sharedledger.py).  The sum and grid
+           reports add up its columns, without building any rows
+        """
+        self = cls.from_rows(None, engine)
+        self._kind = 'binary'
+        self._source = columns
+        return self
+
+    def snapshot(self):
+        """Return a Ledger for the current version of a directory ledger,
+           which is not changed by any later refresh().  Any other Ledger
+           is returned as it is
+        """
+        if self._kind != 'dir':
+            return self
+        pinned = Ledger.from_rows(None, self.engine)
+        pinned._kind = 'snapshot'
+        pinned._source = self._source.snapshot
+        return pinned
+
+    def files(self):
+        """Return a dict of the LedgerFile of each file name in a directory
+           ledger, or None for any other kind of ledger
+        """
+        if self._kind != 'dir':
+            return None
+        return self._source.files
+
+    @property
+    def digest(self):
+        """A hash of the contents of all the files in a directory ledger
+        """
+        return self._source.digest
+
+    def refresh(self):
+        """Reload any changed files of a directory or sqlite ledger.
+           Returns the list of changed file names
+        """
+        if self._kind == 'sqlite':
+            changed = self._source.refresh(self.dirname)
+            if changed:
+                # the months of the old rows are no longer known
+                self._stats_caches = {}
+            return changed
+        if self._kind != 'dir':
+            return []
+
+        # the directory ledger keeps the stats cache in its snapshots, and
+        # leaves out the changed months when it makes a new one
+        return self._source.refresh()
+
+    def rows(self, split=True, filters=None):
+        """Return a RowSet with the split (or nosplit) rows that match the
+           list of filter strings
+        """
+        if self._kind in ('sqlite', 'binary'):
+            # the database (or the binary columns) runs the filters itself
+            with timings.phase('filter') as t:
+                rows = self._source.rowset(split, filters)
+                t['rows_out'] = len(rows)
+            return rows
+
+        if self._kind == 'rows':
+            rows = self._rows
+        else:
+            with timings.phase('autosplit' if split else 'join') as t:
+                rows = self._source.rows(split)
+                t['rows_out'] = len(rows)
+
+        if not filters:
+            return rows
+        with timings.phase('filter', len(rows)) as t:
+            rows = rows.filter(filters)
+            t['rows_out'] = len(rows)
+        return rows
+
+    def _stats_cache(self, split, filters):
+        # the cached months are only valid for the unfiltered rows
+        if filters:
+            return None
+        if self._kind == 'snapshot':
+            return self._source.month_cache('stats', split)
+        if split not in self._stats_caches:
+            self._stats_caches[split] = {}
+        return self._stats_caches[split]
+
+    @pinned
+    def sum(self, split=True, filters=None):
+        """Return the total value of the rows
+        """
+        if self._kind in ('sqlite', 'binary'):
+            # the database (or the binary columns) adds up the values itself
+            with timings.phase('aggregation'):
+                return self._source.value(split, filters)
+        return self.rows(split, filters).value
+
+    @pinned
+    def grid(self, split=True, filters=None, separate_inout=False,
+             by_account=False):
+        """Return the sum of the rows for each hashtag (or account) and
+           month, as a dict with the sorted months and tags, the grid of
+           cells (each cell is a dict with its 'sum'), the totals and the
+           running_totals of each month
+        """
+        if self._kind in ('sqlite', 'binary') and not separate_inout and \
+                not by_account:
+            return self._source_grid(split, filters)
+
+        rows = self.rows(split, filters)
+
+        # Most of the time, the in and out with either be
+        # one-way or balance each other out to zero.  So,
+        # we can avoid the extra lines to separate them.
+        #
+        # Occasionally, we might want to dig into the flow
+        # to see where some strange number comes from
+        label = label_inout if separate_inout else None
+        if by_account:
+            label = label_account_inout if separate_inout else label_account
+
+        with timings.phase('aggregation', len(rows)) as t:
+            (months, grid, totals, running_totals) = grid_accumulate(
+                rows, self.engine, label)
+
+            # FIXME - tags contains entries that might be filtered
+            tags = rows.group_by(label or 'hashtag').keys()
+            t['rows_out'] = len(months) * len(tags)
+
+        return {
+            'months': sorted(months),
+            'tags': sorted(tags),
+            'grid': grid,
+            'totals': totals,
+            'running_totals': running_totals,
+        }
+
+    def _source_grid(self, split, filters):
+        # the same as grid(), but added up by the database (or the binary
+        # columns)
+        with timings.phase('aggregation') as t:
+            cells = self._source.group_value(('hashtag', 'month'), split,
+                                             filters)
+            totals = self._source.group_value('month', split, filters)
+            months = set(totals)
+            totals['total'] = self._source.value(split, filters)
+
+            grid = {}
+            for (tag, month), value in cells.items():
+                grid.setdefault(tag, {})[month] = {'sum': value}
+            t['rows_out'] = len(cells)
+
+        return {
+            'months': sorted(months),
+            'tags': sorted(grid),
+            'grid': grid,
+            'totals': totals,
+            'running_totals': grid_running_totals(months, totals),
+        }
+
+    @pinned
+    def topay(self, split=True, filters=None):
+        """Return the outgoing payments for each month, as a dict with the
+           sorted tags and months, and the cells of (price, last pay date)
+           for each month and tag
+        """
+        rows = self.rows(split, filters)
+        with timings.phase('aggregation', len(rows)) as t:
+            if self.engine == 'numpy':
+                import vectorized
+                tags, months, cells = vectorized.topay_accumulate(rows)
+            else:
+                tags, months, cells = topay_accumulate(rows)
+            t['rows_out'] = len(months) * len(tags)
+
+        return {'tags': tags, 'months': months, 'cells': cells}
+
+    @pinned
+    def payments(self, split=True, filters=None):
+        """Return a dict of the date of the last incoming payment for each
+           hashtag
+        """
+        rows = self.rows(split, filters)
+        with timings.phase('aggregation', len(rows)) as t:
+            payments = rows.filter(['direction==incoming']) \
+                .group_by('hashtag')
+            result = {}
+            for tag, payment in payments.items():
+                result[tag] = payment.last().date
+            t['rows_out'] = len(result)
+        return result
+
+    @pinned
+    def balance(self, split=True, filters=None):
+        """Return the data shown on the balance page: the balance_sum, the
+           grid of the membership dues paid over the last few months (as
+           returned by grid()), when the rent is next due and the time_now
+        """
+        import calendar
+
+        rows = self.rows(split, filters)
+
+        # Filter out only the membership dues
+        with timings.phase('filter', len(rows)) as t:
+            grid_rows = rows.filter([
+                'direction==incoming',
+                'hashtag=~^dues:',
+                'rel_months>-5',
+                'rel_months<1',
+            ])
+            t['rows_out'] = len(grid_rows)
+
+        # Make the category look pretty
+        with timings.phase('aggregation', len(grid_rows)) as t:
+            (months, grid, totals, running_totals) = grid_accumulate(
+                grid_rows, self.engine, label_member)
+            tags = grid_rows.group_by(label_member).keys()
+            t['rows_out'] = len(months) * len(tags)
+
+        def _get_next_rent_month():
+            last_payment = rows.group_by('hashtag')['bills:rent'].last()
+            date = last_payment.date
+
+            # The landlord states that "the monthly rental payment should
+            # be settled seven (7) days in advance prior to the 1st day of
+            # each and every rental month"
+            #
+            # Implement business logic to find this date
+            #
+            # assuming the rent transactions have been placed into the
+            # month that they are paying the rent for, we can find the date
+            # that the rent is next due by clamping the day to seven days
+            # before the end of the month
+
+            # set to the due date during at the end of the month
+            date = date.replace(
+                day=calendar.monthrange(date.year, date.month)[1] - 7
+            )
+
+            return date
+
+        return {
+            'balance_sum': rows.value,
+            'grid': {
+                'months': sorted(months),
+                'tags': sorted(tags),
+                'grid': grid,
+                'totals': totals,
+                'running_totals': running_totals,
+            },
+            'rent_due': _get_next_rent_month(),
+            'time_now': datetime.datetime.utcnow(),
+        }
+
+    @pinned
+    def balance_html(self, template, split=True, filters=None):
+        """Return the balance page, by filling in the macros of the given
+           template text with the balance() data
+        """
+        import string
+
+        data = self.balance(split, filters)
+
+        with timings.phase('render'):
+            grid = data['grid']
+            months_len = render.render_month_len()
+            tags_len = max([len(i) for i in grid['tags']])+1
+
+            header = ''.join(render.grid_render_colheader(
+                grid['months'], months_len, tags_len))
+            cells = ''.join(render.grid_render_rows(
+                grid['months'], grid['tags'], grid['grid'], months_len,
+                tags_len))
+
+            macros = {
+                'balance_sum': data['balance_sum'],
+                'grid_header': header,
+                'grid':        cells,
+                'rent_due':    data['rent_due'],
+                'time_now':    render.iso8601_str(data['time_now']),
+            }
+            return string.Template(template).substitute(macros)
+
+    @pinned
+    def stats(self, split=True, filters=None):
+        """Return the stats for each previous month, their Average and Total
+           and the current month to date, along with the list of the columns
+           to show (the months followed by 'Average', 'MonthTD' and 'Total')
+        """
+        rows = self.rows(split, filters)
+        with timings.phase('aggregation', len(rows)) as t:
+            if self.engine == 'numpy':
+                import vectorized
+                result, months = vectorized.stats_accumulate(rows)
+            else:
+                result, months = stats_accumulate(
+                    rows, self._stats_cache(split, filters))
+            t['rows_out'] = len(months)
+
+        def make_rowset(value):
+            return StatValue(value)
+
+        # the per month results may be cached, so only ever add to copies
+        for month in months:
+            result[month] = dict(result[month])
+
+        result['Average'] = {}
+        for tag in ('outgoing', 'incoming', 'dues', 'other'):
+            result['Average'][tag] = make_rowset(
+                result['Total'][tag].value / len(months))
+        result['Average']['members'] = int(sum(
+            [result[x]['members'] for x in months]
+        ) / len(months))
+        if result['Average']['members']:
+            result['Average']['ARPM'] = int(
+                result['Total']['dues'].value /
+                result['Average']['members'] /
+                len(months)
+            )
+        else:
+            # eg: the stats of an account that never takes any dues
+            result['Average']['ARPM'] = 0
+
+        months.append('Average')
+        months.append('MonthTD')
+        months.append('Total')
+
+        balance = 0
+        for month in months:
+            result[month]['subtotal'] = (
+                result[month]['incoming'].value
+                + result[month]['outgoing'].value
+            )
+            balance += result[month]['subtotal']
+            result[month]['balance'] = balance
+
+        return result, months
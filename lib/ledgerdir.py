@@ -0,0 +1,287 @@
+# Licensed under GPLv3
+import threading
+import hashlib
+import json
+import os
+
+from rowset import RowSet
+import ledgerfiles
+
+
+class LedgerFile(object):
+    """The loaded contents of one ledger file
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.stat = self._stat(filename)
+
+        with open(filename, 'rb') as f:
+            self.digest = hashlib.sha256(f.read()).hexdigest()
+
+        self.rows = RowSet()
+        self.rows.load_file(filename)
+        self.rows.freeze()
+        self._split = None
+
+    @staticmethod
+    def _stat(filename):
+        st = os.stat(filename)
+        return (st.st_mtime, st.st_size)
+
+    def changed(self, stat=None):
+        """Return True if the mtime or size of the file is not the given
+           stat (by default, the one it had when it was loaded)
+        """
+        return self._stat(self.filename) != (stat or self.stat)
+
+    @property
+    def split(self):
+        """The autosplit rows, only calculated when first needed
+        """
+        if self._split is None:
+            self._split = self.rows.autosplit().freeze()
+        return self._split
+
+    def split_months(self, split=True):
+        """The set of months touched by the split (or nosplit) rows of this
+           file
+        """
+        rows = self.split if split else self.rows
+        return set(row.date.replace(day=1) for row in rows)
+
+    @property
+    def months(self):
+        """The set of months touched by the rows of this file, either split
+           or not.  A row split with "!months" might not be in any of the
+           months of its split rows
+        """
+        return self.split_months(True) | self.split_months(False)
+
+
+def load_files(filenames, split=True):
+    """Return a RowSet with the rows of each of the ledger files in turn
+    """
+    rows = RowSet()
+    for filename in filenames:
+        entry = LedgerFile(filename)
+        rows.append(list(entry.split if split else entry.rows))
+    return rows
+
+
+class FileIndex(object):
+    """Something worked out from each file of a ledger directory, kept in
+       the named JSON file so that only the new or changed files need
+       looking at the next time.  Without a filename it is only kept in
+       memory.
+
+       entry is the function that is given a file name and returns the dict
+       kept for that file, including its 'digest'.  The version is bumped
+       whenever that dict changes, so that older JSON files are rebuilt
+    """
+
+    def __init__(self, entry, version, filename=None):
+        self._entry = entry
+        self.version = version
+        self.filename = filename
+        self.files = {}
+        if filename is None or not os.path.exists(filename):
+            return
+        try:
+            with open(filename) as f:
+                data = json.load(f)
+        except ValueError:
+            # rebuilt by the next refresh()
+            return
+        if data.get('version') == self.version:
+            self.files = data['files']
+
+    def refresh(self, dirname):
+        """Look again at any new or changed files in the directory, and
+           forget any that have gone away.  Returns the list of changed
+           file names
+        """
+        changed = []
+        found = set()
+        for filename in ledgerfiles.find(dirname):
+            name = os.path.basename(filename)
+            found.add(name)
+            prev = self.files.get(name)
+            if prev is not None and \
+                    prev['digest'] == ledgerfiles.digest(filename):
+                continue
+            self.files[name] = self._entry(filename)
+            changed.append(name)
+
+        for name in sorted(set(self.files) - found):
+            del self.files[name]
+            changed.append(name)
+
+        if changed and self.filename is not None:
+            self.save()
+        return changed
+
+    def save(self):
+        tmpname = self.filename + '.tmp'
+        with open(tmpname, 'w') as f:
+            json.dump({'version': self.version, 'files': self.files}, f,
+                      sort_keys=True)
+        os.rename(tmpname, self.filename)
+
+
+class Snapshot(object):
+    """One version of the contents of a LedgerDir.  A snapshot is never
+       changed once it has been made - refreshing the LedgerDir makes a new
+       snapshot instead - so a reader holding one always sees a consistent
+       ledger, no matter what is reloaded in the meantime.
+
+       Anything derived from the files (the joined rows, and any per month
+       caches that reports keep) is built on first use and stored in the
+       snapshot.  If two threads race to build the same thing, they build
+       identical results and the first one stored wins
+    """
+
+    def __init__(self, version, files, month_caches=None):
+        self.version = version
+        self.files = files
+        self._rows = {}
+        self._month_caches = month_caches or {}
+
+    @property
+    def digest(self):
+        """A hash of the contents of all the files in the ledger
+        """
+        h = hashlib.sha256()
+        for name in sorted(self.files):
+            h.update('{} {}\n'.format(name, self.files[name].digest)
+                     .encode('utf-8'))
+        return h.hexdigest()
+
+    def rows(self, split=True, filters=None):
+        """Return a frozen RowSet with the rows from every file in name
+           order, the same as loading each file in turn would produce.  If
+           a list of filter strings is given, only the matching rows
+        """
+        rows = self._rows.get(split)
+        if rows is None:
+            rows = RowSet()
+            for name in sorted(self.files):
+                entry = self.files[name]
+                rows.append(list(entry.split if split else entry.rows))
+            rows = self._rows.setdefault(split, rows.freeze())
+        if filters:
+            return rows.filter(filters)
+        return rows
+
+    def month_cache(self, name, split=True):
+        """Return a dict for a report to keep its results for each month in.
+           It is carried over to the next snapshot, without the months that
+           were touched by the changed files
+        """
+        return self._month_caches.setdefault((name, split), {})
+
+    def next(self, files, touched):
+        """Return the snapshot following this one, with the given files.
+           The months of the touched LedgerFile entries (both the old and
+           new versions of any changed file) are left out of its caches
+        """
+        caches = {}
+        if self._month_caches:
+            months = {}
+            for split in (True, False):
+                months[split] = set()
+                for entry in touched:
+                    months[split] |= entry.split_months(split)
+            for key, cache in list(self._month_caches.items()):
+                # the caches are kept for the split or the nosplit rows
+                changed = months[key[1]]
+                caches[key] = dict(
+                    (k, v) for k, v in list(cache.items()) if k not in changed
+                )
+        return Snapshot(self.version + 1, files, caches)
+
+
+class LedgerDir(object):
+    """Keep the contents of a directory of ledger files in memory, only
+       reloading the files that have changed since they were last looked at.
+
+       The current contents are held in an immutable Snapshot, which
+       refresh() replaces with a single assignment.  Any number of threads
+       can read the ledger while one of them refreshes it: a reader wanting
+       several things from the same version should take the snapshot once
+       and use that
+    """
+
+    def __init__(self, dirname):
+        self.dirname = dirname
+        self.snapshot = Snapshot(0, {})
+        # the stat of each file that was touched without changing it, kept
+        # here as the LedgerFile entries are shared with the snapshots
+        self._touched = {}
+        self._lock = threading.Lock()
+        self.refresh()
+
+    @property
+    def files(self):
+        return self.snapshot.files
+
+    @property
+    def version(self):
+        return self.snapshot.version
+
+    def refresh(self):
+        """Reload any files whose mtime or size has changed, and forget any
+           that have gone away.  Returns the list of changed file names
+        """
+        with self._lock:
+            return self._refresh()
+
+    def _refresh(self):
+        old = self.snapshot
+        files = dict(old.files)
+        found = ledgerfiles.find(self.dirname)
+
+        changed = []
+        touched = []
+        for filename in found:
+            name = os.path.basename(filename)
+            prev = files.get(name)
+            if prev is not None and \
+                    not prev.changed(self._touched.get(name)):
+                continue
+
+            entry = LedgerFile(filename)
+            if prev is not None and prev.digest == entry.digest:
+                # only touched, so just remember the new mtime to avoid
+                # reading it again next time
+                self._touched[name] = entry.stat
+                continue
+
+            self._touched.pop(name, None)
+            files[name] = entry
+            changed.append(name)
+            touched.append(entry)
+            if prev is not None:
+                touched.append(prev)
+
+        found = set(os.path.basename(x) for x in found)
+        for name in sorted(set(files) - found):
+            self._touched.pop(name, None)
+            touched.append(files.pop(name))
+            changed.append(name)
+
+        if changed:
+            # readers of the old snapshot carry on undisturbed
+            self.snapshot = old.next(files, touched)
+        return changed
+
+    @property
+    def digest(self):
+        """A hash of the contents of all the files in the ledger
+        """
+        return self.snapshot.digest
+
+    def rows(self, split=True, filters=None):
+        """Return the rows of the current snapshot (see Snapshot.rows())
+        """
+        return self.snapshot.rows(split, filters)
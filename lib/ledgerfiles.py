@@ -0,0 +1,210 @@
+# Licensed under GPLv3
+import hashlib
+import glob
+import json
+import os
+import re
+
+
+# The files that make up a ledger directory.
+#
+# Each file is normally plain text, named after the month it holds (eg:
+# "2016-08.txt").  Old months never change, so they can be archived as a
+# compressed file instead ("2016-08.txt.gz", ".txt.bz2" or ".txt.xz"), which
+# is decompressed as it is read.
+#
+# Archiving also records the digest, total, opening and closing balance (in
+# cents) and the problems that lint finds of each compressed file in the
+# ARCHIVE_INDEX file of the directory.  Archiving again, and linting, only
+# need to hash the compressed files, they are only decompressed if their
+# digest no longer matches.  Loading the rows still decompresses them.
+
+# The suffix of each kind of compressed file and the module to read it with
+COMPRESSORS = {
+    '.gz': 'gzip',
+    '.bz2': 'bz2',
+    '.xz': 'lzma',
+}
+ARCHIVE_INDEX = 'archive.json'
+
+# The fields of an archive index entry given by the load function of
+# archive(): the total value of the rows, the opening balance given by a
+# "#balance" before the first row (or None) and the list of [line number,
+# description] of each problem found by lint.file_problems()
+FIELDS = ('total', 'opening_balance', 'problems')
+
+MONTH_RE = re.compile(r'(\d{4})-(\d{2})\b')
+
+
+def _suffix(filename):
+    """Return the compression suffix of a ledger file, '' for a plain text
+       file, or None if it is not a ledger file at all
+    """
+    if filename.endswith('.txt'):
+        return ''
+    base, suffix = os.path.splitext(filename)
+    if suffix in COMPRESSORS and base.endswith('.txt'):
+        return suffix
+    return None
+
+
+def plain_name(filename):
+    """Return the name of the ledger file without any compression suffix
+    """
+    suffix = _suffix(filename)
+    if suffix:
+        return filename[:-len(suffix)]
+    return filename
+
+
+def find(dirname):
+    """Return the sorted list of ledger files in the directory.  If a month
+       has both a plain and a compressed file (eg: while it is being
+       archived) only the plain one is used
+    """
+    found = {}
+    for filename in glob.glob(os.path.join(dirname, '*.txt*')):
+        suffix = _suffix(filename)
+        if suffix is None:
+            continue
+        plain = plain_name(filename)
+        if plain not in found or not suffix:
+            found[plain] = filename
+    return sorted(found.values())
+
+
+def open_text(filename):
+    """Open a ledger file for reading as text, decompressing it on the fly
+       if it is compressed
+    """
+    suffix = _suffix(filename)
+    if not suffix:
+        return open(filename, 'r')
+
+    # only imported when needed, as most runs have no compressed files
+    import importlib
+    module = importlib.import_module(COMPRESSORS[suffix])
+    return module.open(filename, 'rt')
+
+
+def digest(filename):
+    """Return the sha256 of the file as it is stored (ie: still compressed)
+    """
+    with open(filename, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def file_month(filename):
+    """Return the (year, month) that a ledger file is named after, or None
+    """
+    m = MONTH_RE.match(os.path.basename(filename))
+    if not m:
+        return None
+    return int(m.group(1)), int(m.group(2))
+
+
+def load_index(dirname):
+    """Return the dict of archived file entries recorded in the directory
+    """
+    try:
+        with open(os.path.join(dirname, ARCHIVE_INDEX)) as f:
+            return json.load(f)
+    except (IOError, OSError):
+        return {}
+
+
+def save_index(dirname, index):
+    filename = os.path.join(dirname, ARCHIVE_INDEX)
+    tmpname = filename + '.tmp'
+    with open(tmpname, 'w') as f:
+        json.dump(index, f, indent=1, sort_keys=True)
+        f.write('\n')
+    os.rename(tmpname, filename)
+
+
+def compress(filename, suffix='.gz'):
+    """Write a compressed copy of the plain ledger file and remove the
+       original.  Returns the name of the compressed file
+    """
+    import importlib
+    import shutil
+
+    module = importlib.import_module(COMPRESSORS[suffix])
+    target = filename + suffix
+    tmpname = target + '.tmp'
+    with open(filename, 'rb') as src:
+        with module.open(tmpname, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+
+    # keep the mtime, as nothing has changed in the ledger itself
+    st = os.stat(filename)
+    os.utime(tmpname, (st.st_atime, st.st_mtime))
+
+    # while both files exist, find() only uses the plain one
+    os.rename(tmpname, target)
+    os.unlink(filename)
+    return target
+
+
+def recorded(index, filename):
+    """Return the entry of the archive index for the compressed ledger file,
+       or None if it has none or has changed since it was recorded
+    """
+    if not _suffix(filename):
+        return None
+    entry = index.get(os.path.basename(filename))
+    if entry is None or entry['digest'] != digest(filename):
+        return None
+    # an entry without all of the fields is from before they were recorded
+    if not all(x in entry for x in FIELDS):
+        return None
+    return entry
+
+
+def archive(dirname, before, suffix='.gz', load=None):
+    """Compress the plain ledger files named after a month earlier than the
+       given (year, month), and bring the archive index up to date.
+
+       load is a function returning a dict of the FIELDS of a file, used for
+       any file that is being archived or whose entry is not up to date.
+       The closing balance of each file starts from its opening balance, if
+       it has one.  Returns a list of (action, name) with the action one of
+       'archived', 'changed' or 'new'
+    """
+    index = load_index(dirname)
+    actions = []
+    result = {}
+    balance = 0
+
+    for filename in find(dirname):
+        name = os.path.basename(filename)
+        month = file_month(filename)
+
+        if _suffix(filename):
+            loaded = recorded(index, filename)
+            if loaded is None:
+                loaded = load(filename)
+                entry = index.get(name)
+                # quietly bring an older entry of the same file up to date
+                if entry is None or entry['digest'] != digest(filename):
+                    actions.append(('changed' if entry else 'new', name))
+        else:
+            loaded = load(filename)
+            if month is not None and month < before:
+                filename = compress(filename, suffix)
+                name = os.path.basename(filename)
+                actions.append(('archived', name))
+
+        if loaded['opening_balance'] is not None:
+            balance = loaded['opening_balance']
+        balance += int(loaded['total'])
+        if not _suffix(filename):
+            # still a plain file, only its total counts
+            continue
+        result[name] = dict((x, loaded[x]) for x in FIELDS)
+        result[name]['digest'] = digest(filename)
+        result[name]['closing_balance'] = balance
+
+    if result != index:
+        save_index(dirname, result)
+    return actions
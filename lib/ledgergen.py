@@ -0,0 +1,164 @@
+# Licensed under GPLv3
+import datetime
+import random
+import os
+
+
+# Generate synthetic ledgers in the same format as the files in cash/, for
+# benchmarking.  The output only depends on the parameters and the seed, so
+# the same ledger can be regenerated on another machine or for another
+# commit.
+#
+# Every month gets a rent payment and at least one dues payment, so that
+# each of the reports (which expect both) can run over the result.
+
+WORDS = (
+    'fridge', 'workshop', 'donation', 'stickers', 'paypal', 'cash', 'box',
+    'market', 'refund', 'tools', 'soldering', 'printer', 'filament', 'tea',
+    'cleaning', 'supplies', 'visit', 'network', 'cable', 'snacks',
+)
+
+BILLS = ('bills:rent', 'bills:electricity', 'bills:water', 'bills:internet')
+
+# The default last month, which is fixed (rather than the current month) so
+# that the output stays the same from one day to the next
+END = datetime.date(2024, 12, 31)
+
+
+def render_cents(cents):
+    """Return the cents as a value string, in the same style as the humans
+       write them - no decimal places for whole dollars
+    """
+    sign = '-' if cents < 0 else ''
+    dollars, cents = divmod(abs(cents), 100)
+    if cents == 0:
+        return '{}{}'.format(sign, dollars)
+    return '{}{}.{:02d}'.format(sign, dollars, cents)
+
+
+def month_range(end, count):
+    """Return the first day of each of the count months up to and including
+       the month of the end date
+    """
+    index = end.year * 12 + end.month - 1
+    return [
+        datetime.date(i // 12, i % 12 + 1, 1)
+        for i in range(index - count + 1, index + 1)
+    ]
+
+
+class LedgerGenerator(object):
+    """Generate the lines of a synthetic ledger, one month at a time.
+
+       years            how many years of months, ending in the end month
+       rows_per_month   number of transactions in each month
+       tags             roughly how many different hashtags to use
+       months_fraction  the fraction of rows with a "!months" tag
+       balance          add "#balance" pragmas at the start and end of
+                        each month, which all agree with the rows
+       seed             the random seed
+       end              the date of the last month to generate
+    """
+
+    def __init__(self, years=2, rows_per_month=100, tags=50,
+                 months_fraction=0.05, balance=True, seed=1, end=END):
+        self.years = years
+        self.rows_per_month = max(2, rows_per_month)
+        self.months_fraction = months_fraction
+        self.balance = balance
+        self.seed = seed
+        self.end = end
+
+        tags = max(len(BILLS) + 2, tags)
+        nmembers = tags // 2
+        self.members = ['dues:member{}'.format(i) for i in range(nmembers)]
+        self.others = list(BILLS[1:])
+        self.others += [
+            'misc:{}'.format(WORDS[i % len(WORDS)] + str(i))
+            for i in range(tags - nmembers - len(BILLS))
+        ]
+
+    def _value(self, rng, tag):
+        if tag is not None and tag.startswith('dues:'):
+            return rng.choice((500, 700, 1000)) * 100
+        if tag is not None and tag.startswith('bills:'):
+            return -rng.randint(100, 200000)
+        cents = rng.randint(1, 200000)
+        if rng.random() < 0.5:
+            cents -= cents % 100
+        if rng.random() < 0.4:
+            cents = -cents
+        return cents
+
+    def _bangtag(self, rng, earlier):
+        count = rng.randint(2, 6)
+        if rng.random() < 0.5 or not earlier:
+            return '!months:{}'.format(count)
+        # do not split into months before the start of the ledger, the
+        # stats report cannot cope with a month that has no outgoing rows
+        return '!months:{}:{}'.format(-rng.randint(1, earlier), count)
+
+    def month(self, rng, month, earlier=0):
+        """Return a list of (cents, date, comment) for one month, which has
+           the given number of earlier months before it in the ledger
+        """
+        days = (month.replace(day=28) + datetime.timedelta(4)).replace(day=1)
+        days = (days - month).days
+
+        rows = []
+        for i in range(self.rows_per_month):
+            if i == 0:
+                tag = BILLS[0]
+            elif i == 1:
+                tag = rng.choice(self.members)
+            elif rng.random() < 0.1:
+                tag = None
+            elif rng.random() < 0.5:
+                tag = rng.choice(self.members)
+            else:
+                tag = rng.choice(self.others)
+
+            words = rng.sample(WORDS, rng.randint(tag is None, 3))
+            if tag is not None:
+                words.insert(0, '#' + tag)
+            if rng.random() < self.months_fraction:
+                words.append(self._bangtag(rng, min(3, earlier)))
+
+            date = month.replace(day=rng.randint(1, days))
+            rows.append((self._value(rng, tag), date, ' '.join(words)))
+
+        rows.sort(key=lambda x: x[1])
+        return rows
+
+    def files(self):
+        """Yield a (filename, text) for each month of the ledger
+        """
+        rng = random.Random(self.seed)
+        balance = 0
+        for i, month in enumerate(month_range(self.end, self.years * 12)):
+            lines = []
+            if self.balance:
+                lines.append('#balance {} opening balance'.format(
+                    render_cents(balance)))
+            for cents, date, comment in self.month(rng, month, i):
+                balance += cents
+                lines.append('{} {} {}'.format(
+                    render_cents(cents), date.isoformat(), comment).rstrip())
+            if self.balance:
+                lines.append('#balance {}'.format(render_cents(balance)))
+
+            filename = '{:04d}-{:02d}.txt'.format(month.year, month.month)
+            yield filename, '\n'.join(lines) + '\n'
+
+    def write(self, dirname):
+        """Write the ledger files into the directory and return the number of
+           rows written
+        """
+        if not os.path.exists(dirname):
+            os.makedirs(dirname)
+        nrows = 0
+        for filename, text in self.files():
+            with open(os.path.join(dirname, filename), 'w') as f:
+                f.write(text)
+            nrows += self.rows_per_month
+        return nrows
@@ -0,0 +1,169 @@
+# Licensed under GPLv3
+import datetime
+import os
+import re
+
+from row import parse_value, DATE_RE
+import ledgerfiles
+
+
+# Checking the ledger files for mistakes, without loading them.
+#
+# Loading stops at the first bad line, and a few mistakes (two hashtags on
+# a row, a broken !months bangtag) only show up later when the row is used.
+# Linting instead looks at each line on its own - the same way that loading
+# splits it up, but without making a Row - and reports every mistake in
+# every file, along with where it is.  The "#balance" pragmas are checked
+# against the running total of each file, just as loading does.
+#
+# The files are checked in parallel, one process for each cpu.  An archived
+# file is not decompressed again while it is unchanged, the problems found
+# in it when it was archived are recorded in the archive index (see
+# ledgerfiles.py).
+
+HASHTAG_RE = re.compile(r'#([a-zA-Z]\S*)')
+BANGTAG_RE = re.compile(r'!([a-zA-Z]\S*)')
+BALANCE_RE = re.compile(r'^#balance ([-0-9.]+)')
+MONTHS_RE = re.compile(r'months(?::(-?\d+))?:(\d+)$')
+
+
+def check_date(date):
+    """Raise a ValueError if the date is not one that a Row would accept
+    """
+    if DATE_RE.match(date):
+        datetime.date(int(date[0:4]), int(date[5:7]), int(date[8:10]))
+    else:
+        datetime.datetime.strptime(date, '%Y-%m-%d')
+
+
+def check_bangtag(tag):
+    """Raise a ValueError if the bangtag is not one that splitting the row
+       understands
+    """
+    if not tag.startswith('months'):
+        raise ValueError('unknown bangtag "!{}"'.format(tag))
+    m = MONTHS_RE.match(tag)
+    if not m:
+        raise ValueError(
+            'bangtag "!{}" should be !months:count or '
+            '!months:start:count'.format(tag))
+    if int(m.group(2)) < 1:
+        raise ValueError('bangtag "!{}" splits into no months'.format(tag))
+
+
+def check_row(line):
+    """Check one transaction line, returning its cents.  Raises a ValueError
+       describing the first problem found
+    """
+    fields = re.split(r'\s+', line, maxsplit=2)
+    if len(fields) < 3:
+        raise ValueError('expected a value, a date and a comment')
+    value, date, comment = fields
+
+    try:
+        cents = parse_value(value)[0]
+    except (ValueError, ArithmeticError):
+        raise ValueError('bad value "{}"'.format(value))
+
+    try:
+        check_date(date)
+    except ValueError:
+        raise ValueError('bad date "{}"'.format(date))
+
+    hashtags = HASHTAG_RE.findall(comment)
+    if len(hashtags) > 1:
+        raise ValueError('more than one hashtag: {}'.format(
+            ' '.join('#' + x for x in hashtags)))
+
+    bangtags = BANGTAG_RE.findall(comment)
+    if len(bangtags) > 1:
+        raise ValueError('more than one bangtag: {}'.format(
+            ' '.join('!' + x for x in bangtags)))
+    if bangtags:
+        check_bangtag(bangtags[0])
+
+    return cents
+
+
+def file_problems(filename):
+    """Check every line of the ledger file.  Returns a list of the problems
+       found, each as [line number, description]
+    """
+    errors = []
+    opening = 0
+    cents = 0
+    rows = 0
+
+    with ledgerfiles.open_text(filename) as f:
+        for number, line in enumerate(f, 1):
+            line = line.rstrip('\n')
+            if not line:
+                continue
+
+            try:
+                if line.split(None, 1)[:1] == ['#balance']:
+                    m = BALANCE_RE.match(line)
+                    if not m:
+                        raise ValueError('bad #balance pragma')
+                    try:
+                        given = parse_value(m.group(1))[0]
+                    except (ValueError, ArithmeticError):
+                        raise ValueError('bad #balance value "{}"'.format(
+                            m.group(1)))
+                    if rows == 0:
+                        opening = given
+                    elif given != opening + cents:
+                        raise ValueError(
+                            'failed to balance, the rows add up to '
+                            '{}'.format(opening + cents))
+                elif not line.startswith('#'):
+                    # a bad row still stops a later "#balance" from being
+                    # taken as the opening balance
+                    rows += 1
+                    cents += check_row(line)
+            except ValueError as e:
+                errors.append([number, str(e)])
+    return errors
+
+
+def lint_file(filename):
+    """Check every line of the ledger file.  Returns a list of the problems
+       found, each as "filename:line: description"
+    """
+    return [
+        '{}:{}: {}'.format(filename, number, description)
+        for number, description in file_problems(filename)
+    ]
+
+
+def lint(dirname, jobs=None):
+    """Check all the ledger files in the directory, using up to jobs
+       processes (by default, one for each cpu).  Returns the number of
+       files and the list of problems found
+    """
+    filenames = ledgerfiles.find(dirname)
+
+    index = ledgerfiles.load_index(dirname)
+    found = {}
+    todo = []
+    for filename in filenames:
+        entry = ledgerfiles.recorded(index, filename)
+        if entry is None:
+            todo.append(filename)
+        else:
+            found[filename] = [
+                '{}:{}: {}'.format(filename, number, description)
+                for number, description in entry['problems']
+            ]
+
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    jobs = min(jobs, len(todo))
+
+    if jobs > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(jobs) as pool:
+            found.update(zip(todo, pool.map(lint_file, todo)))
+    else:
+        found.update((x, lint_file(x)) for x in todo)
+    return len(filenames), sum([found[x] for x in filenames], [])
@@ -0,0 +1,143 @@
+# Licensed under GPLv3
+import csv
+
+from row import from_cents
+
+
+# The membership dues paid by each member, month by month.
+#
+# Every incoming row tagged "#dues:<handle>" is a payment by that member
+# (even one of zero, which is dues waived for something else), and
+# one pass over the rows adds them up into a matrix of member and month.
+# From the matrix comes the last month each member paid for, how many months
+# in a row they had paid up to then (their streak) and whether they are
+# still paid up.
+#
+# The door system keeps its own list of members, with the same handle as
+# the dues tag.  A CSV export of it can be joined on, through a dict keyed
+# by the handle, to show when each member was last seen at the door.
+
+
+def handle_key(handle):
+    """Return the handle in the form used to join the door list, which
+       might have it with or without the "#dues:" in front
+    """
+    handle = handle.strip().lstrip('#').lower()
+    if handle.startswith('dues:'):
+        handle = handle[5:]
+    return handle
+
+
+def _month_str(month):
+    return month.strftime('%Y-%m')
+
+
+def _next_month(month):
+    if month.month == 12:
+        return month.replace(year=month.year + 1, month=1)
+    return month.replace(month=month.month + 1)
+
+
+def matrix(rows):
+    """Return a dict of the handle of each member and a dict of the cents
+       they paid for each month (the first day of the month)
+    """
+    result = {}
+    for row in rows:
+        tag = row.hashtag
+        if row.cents < 0 or tag is None or not tag.startswith('dues:'):
+            continue
+        month = row.date.replace(day=1)
+        paid = result.setdefault(tag[5:], {})
+        paid[month] = paid.get(month, 0) + row.cents
+    return result
+
+
+def streak(paid, last):
+    """Return the number of months in a row that were paid for, up to and
+       including the last one
+    """
+    count = 0
+    month = last
+    while month in paid:
+        count += 1
+        if month.month == 1:
+            month = month.replace(year=month.year - 1, month=12)
+        else:
+            month = month.replace(month=month.month - 1)
+    return count
+
+
+def load_door(stream, handle_column='hashtag', activity_column='last_login'):
+    """Read the door system export and return a dict of the handle key and
+       the latest month that handle was seen.  Rows with no handle are left
+       out
+    """
+    reader = csv.DictReader(stream)
+    columns = reader.fieldnames or []
+    for column in (handle_column, activity_column):
+        if column not in columns:
+            raise ValueError('door list has no "{}" column, only: {}'.format(
+                column, ', '.join(columns)))
+
+    result = {}
+    for row in reader:
+        handle = handle_key(row[handle_column] or '')
+        if not handle:
+            continue
+        # eg: "2018-11-10 12:34:56" is just kept as "2018-11"
+        seen = (row[activity_column] or '')[:7]
+        result[handle] = max(seen, result.get(handle, ''))
+    return result
+
+
+def table(rows, today, door=None):
+    """Return the header and the lines of the membership table, with one
+       line for each member sorted by handle.  If a door dict (from
+       load_door()) is given, each line also has the month the member was
+       last seen, and any handles only known to the door are added
+    """
+    paid = matrix(rows)
+    months = set()
+    for member in paid.values():
+        months.update(member)
+
+    all_months = []
+    if months:
+        month = min(months)
+        while month <= max(months):
+            all_months.append(month)
+            month = _next_month(month)
+
+    header = ['handle', 'month_last_paid', 'streak', 'status']
+    if door is not None:
+        header.append('last_seen')
+    header += [_month_str(x) for x in all_months]
+
+    handles = set(paid)
+    if door is not None:
+        known = set(handle_key(x) for x in paid)
+        handles.update(x for x in door if x not in known)
+
+    this_month = today.replace(day=1)
+    lines = []
+    for handle in sorted(handles):
+        member = paid.get(handle, {})
+        if member:
+            last = max(member)
+            line = [
+                handle,
+                _month_str(last),
+                streak(member, last),
+                'paid' if last >= this_month else 'lapsed',
+            ]
+        else:
+            line = [handle, '', 0, 'unpaid']
+        if door is not None:
+            line.append(door.get(handle_key(handle), ''))
+        line += [
+            from_cents(member[x]) if x in member else ''
+            for x in all_months
+        ]
+        lines.append(line)
+    return header, lines
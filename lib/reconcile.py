@@ -0,0 +1,193 @@
+# Licensed under GPLv3
+from collections import namedtuple
+import bisect
+import csv
+import datetime
+import re
+
+from row import parse_value, from_cents, DATE_RE, VALUE_RE
+
+
+# Reconciling the ledger against a statement exported by the bank or PayPal.
+#
+# A ledger row and a statement line can only be the same transaction if they
+# have the same value and are dated no more than a few days apart.  So both
+# sides are put into hash buckets by their value in cents, and within each
+# bucket the dates are sorted, which finds the lines in reach of each row by
+# bisection rather than by comparing every row with every line.
+#
+# Inside a bucket, the rows and lines in reach of each other form groups (a
+# row in reach of two lines joins them into one group, and so on).  A group
+# with the same number of rows and lines, where pairing them up in date
+# order keeps each pair in reach, is matched.  A group with only one side
+# is unmatched.  Anything else is ambiguous - some of it is unmatched, but
+# there is no telling which.
+
+StatementLine = namedtuple('StatementLine',
+                           ('cents', 'date', 'description', 'line'))
+
+
+def parse_amount(amount):
+    """Return the cents of an amount as written in a statement, which can
+       have a currency symbol, thousands separators or (for a negative
+       amount) brackets
+    """
+    amount = amount.strip()
+    if VALUE_RE.match(amount):
+        return parse_value(amount)[0]
+
+    negative = amount.startswith('(') and amount.endswith(')')
+    amount = re.sub(r'[^-+0-9.]', '', amount)
+    cents = parse_value(amount)[0]
+    if negative:
+        cents = -abs(cents)
+    return cents
+
+
+def load_statement(stream, date_column='Date', amount_column='Amount',
+                   description_column='Description', date_format='%Y-%m-%d'):
+    """Read the lines of a CSV statement, which has a header line naming its
+       columns.  Returns a list of StatementLine
+    """
+    reader = csv.DictReader(stream)
+    columns = reader.fieldnames or []
+    for column in (date_column, amount_column):
+        if column not in columns:
+            raise ValueError('statement has no "{}" column, only: {}'.format(
+                column, ', '.join(columns)))
+
+    # much quicker than strptime, for the common case
+    iso = date_format == '%Y-%m-%d'
+
+    result = []
+    for row in reader:
+        try:
+            date = row[date_column].strip()
+            if iso and DATE_RE.match(date):
+                date = datetime.date(int(date[0:4]), int(date[5:7]),
+                                     int(date[8:10]))
+            else:
+                date = datetime.datetime.strptime(date, date_format).date()
+            cents = parse_amount(row[amount_column])
+        except (ValueError, ArithmeticError):
+            raise ValueError('statement line {}: cannot read {}'.format(
+                reader.line_num, row))
+        result.append(StatementLine(
+            cents, date, row.get(description_column) or '', reader.line_num))
+    return result
+
+
+def _groups(rows, lines, days):
+    """Return the groups of the rows and lines (all of one value) that are
+       in reach of each other, each as a pair of lists sorted by date
+    """
+    rows = sorted(rows, key=lambda x: x.date)
+    lines = sorted(lines, key=lambda x: x.date)
+    line_dates = [x.date for x in lines]
+    window = datetime.timedelta(days)
+
+    # union-find over the rows (0..n-1) and the lines (n..n+m-1)
+    parent = list(range(len(rows) + len(lines)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(a, b):
+        parent[find(a)] = find(b)
+
+    # each row joins the run of lines in its reach into its group.  Rather
+    # than joining every line to the row, count how many runs cover each
+    # pair of neighbouring lines, and join the pairs covered by any run
+    covered = [0] * (len(lines) + 1)
+    for i, row in enumerate(rows):
+        first = bisect.bisect_left(line_dates, row.date - window)
+        last = bisect.bisect_right(line_dates, row.date + window)
+        if first == last:
+            continue
+        union(i, len(rows) + first)
+        covered[first] += 1
+        covered[last - 1] -= 1
+
+    count = 0
+    for j in range(len(lines) - 1):
+        count += covered[j]
+        if count > 0:
+            union(len(rows) + j, len(rows) + j + 1)
+
+    groups = {}
+    for i, row in enumerate(rows):
+        groups.setdefault(find(i), ([], []))[0].append(row)
+    for j, line in enumerate(lines):
+        groups.setdefault(find(len(rows) + j), ([], []))[1].append(line)
+    return list(groups.values())
+
+
+def reconcile(rows, lines, days=3):
+    """Match the ledger rows against the statement lines.  Returns a dict
+       with the list of 'matched' (row, line) pairs, and the lists of the
+       'unmatched_rows', 'unmatched_lines', 'ambiguous_rows' and
+       'ambiguous_lines'
+    """
+    window = datetime.timedelta(days)
+
+    buckets = {}
+    for row in rows:
+        buckets.setdefault(row.cents, ([], []))[0].append(row)
+    for line in lines:
+        buckets.setdefault(line.cents, ([], []))[1].append(line)
+
+    result = {
+        'matched': [],
+        'unmatched_rows': [],
+        'unmatched_lines': [],
+        'ambiguous_rows': [],
+        'ambiguous_lines': [],
+    }
+    for bucket_rows, bucket_lines in buckets.values():
+        for group_rows, group_lines in _groups(bucket_rows, bucket_lines,
+                                               days):
+            if not group_lines:
+                result['unmatched_rows'] += group_rows
+                continue
+            if not group_rows:
+                result['unmatched_lines'] += group_lines
+                continue
+
+            pairs = list(zip(group_rows, group_lines))
+            if len(group_rows) == len(group_lines) and all(
+                    abs(row.date - line.date) <= window
+                    for row, line in pairs):
+                result['matched'] += pairs
+            else:
+                result['ambiguous_rows'] += group_rows
+                result['ambiguous_lines'] += group_lines
+
+    for key in ('unmatched_rows', 'ambiguous_rows'):
+        result[key].sort(key=lambda x: x.date)
+    for key in ('unmatched_lines', 'ambiguous_lines'):
+        result[key].sort(key=lambda x: x.line)
+    result['matched'].sort(key=lambda x: x[1].line)
+    return result
+
+
+def render(result):
+    """Return the reconciliation as text, listing everything that did not
+       match
+    """
+    def line_str(line):
+        return 'line {}: {} {} {}'.format(
+            line.line, from_cents(line.cents), line.date, line.description)
+
+    output = ['matched {}'.format(len(result['matched']))]
+    for key, title, to_str in (
+            ('unmatched_rows', 'unmatched in ledger', str),
+            ('unmatched_lines', 'unmatched in statement', line_str),
+            ('ambiguous_rows', 'ambiguous in ledger', str),
+            ('ambiguous_lines', 'ambiguous in statement', line_str)):
+        if result[key]:
+            output.append('{} {}'.format(title, len(result[key])))
+            output += ['  ' + to_str(x) for x in result[key]]
+    return '\n'.join(output)
@@ -0,0 +1,328 @@
+# Licensed under GPLv3
+import datetime
+import decimal
+
+
+# Turn the data returned by the Ledger reports into text.  Nothing in here
+# looks at rows, only at the already accumulated results
+
+
+class HKT(datetime.tzinfo):
+
+    def utcoffset(self, dt):
+        return datetime.timedelta(hours=8)
+
+    def tzname(self, dt):
+        return "HKT"
+
+    def dst(self, dt):
+        return datetime.timedelta(hours=0)
+
+
+def iso8601_str(dt):
+    """Why oh why is this so hard to do?
+    """
+    # now = datetime.datetime.now()
+    # now_timestamp = now.timestamp()
+    # utc_horror = datetime.datetime.utcfromtimestamp( now_timestamp ).timestamp() # noqa
+    # delta_min = (now_timestamp - utc_horror) //60
+    # sign="+"
+    # if (delta_min<0):
+    #     sign="-"
+    #     delta_min = abs(delta_min)
+
+    # delta_hr = delta_min /60.0
+    # delta_min = (int(delta_hr) - delta_hr) * 60
+    # delta_hr = int(delta_hr)
+    # delta_str = sign+"{:02d}:{:02d}".format(delta_hr, delta_min)
+
+    # Ideally, this would work, but the HKT class needs ... something ...
+    # dt = dt.replace(tzinfo=HKT())
+    # return dt.replace(microsecond=0).isoformat()
+
+    dt = dt.replace(microsecond=0)
+    dt = dt + datetime.timedelta(hours=8)
+    timezone_str = "+08:00"
+    return dt.strftime('%FT%T') + timezone_str
+
+
+def render_month(date):
+    """Return a short string representation of the date as a month
+    """
+    if isinstance(date, datetime.date):
+        return date.strftime('%Y-%m')
+
+    # Awkwardly, if we want to have a "Total" month or a "Average"
+    # month, everything works except for this render_month function
+    # TODO - fix this in a cleaner way
+    return date
+
+
+def render_month_len():
+    """how much room to allow for each month column
+    """
+    # TODO - this should eventually move into some rendering code
+    return 9
+
+
+def grid_render_onerow(prefix, prefix_len, rowdata, cell_len):
+    s = []
+
+    s += "{:<{width}}".format(prefix, width=prefix_len)
+
+    for cell in rowdata:
+        s += "{:>{}}".format(cell, cell_len)
+
+    s += "\n"
+
+    return s
+
+
+def grid_render_colheader(months, months_len, tags_len):
+    return grid_render_onerow(
+        ' ', tags_len,
+        [render_month(x) for x in months], months_len
+    )
+
+
+def grid_render_totals(months, totals, months_len, tags_len, running_totals):
+    """
+    months is a set of months (as datetime.date objects) that we want to render
+    totals is a dictionary of the isolated month total
+    months_len is the width needed to render one month column
+    tags_len is the width needed to show the longest tag
+    """
+    s = []
+
+    s += "\n"
+    s += grid_render_onerow(
+        'MONTH Sub Total', tags_len,
+        [totals[x] for x in months], months_len
+    )
+
+    s += grid_render_onerow(
+        'RUNNING Balance', tags_len,
+        [running_totals[x] for x in months], months_len
+    )
+
+    s += "TOTAL: {:>{}}".format(totals['total'], months_len)
+
+    return s
+
+
+def grid_render_rows(months, tags, grid, months_len, tags_len):
+    s = []
+
+    tags = sorted(tags)
+
+    # Output each tag on its own row
+    for tag in tags:
+        cells = []
+        for month in months:
+            if month in grid[tag]:
+                cells.append(grid[tag][month]['sum'])
+            else:
+                cells.append('')
+
+        s += grid_render_onerow(
+            tag, tags_len,
+            cells, months_len
+        )
+
+    return s
+
+
+def grid_render(months, tags, grid, totals, running_totals):
+    # Render the accumulated data
+
+    tags_len = max([len(i) for i in tags])+1
+    months_len = render_month_len()
+    months = sorted(months)
+
+    s = []
+    s += grid_render_colheader(months, months_len, tags_len)
+    s += grid_render_rows(months, tags, grid, months_len, tags_len)
+    s += grid_render_totals(
+            months, totals, months_len, tags_len, running_totals)
+
+    return ''.join(s)
+
+
+def topay_render(tags, months, cells, strings):
+    """Render the outgoing payments of each month, given the tags, months and
+       cells from Ledger.topay() and a dict of the format strings to use
+    """
+    s = []
+    for month in months:
+        s.append(strings['header'].format(date=render_month(month)))
+        s.append("\n")
+        s.append(strings['table_start'])
+        s.append("\n")
+
+        monthtags = cells[month]
+        for hashtag in tags:
+            if hashtag in monthtags:
+                price, date = monthtags[hashtag]
+            else:
+                price = "$0"
+                date = "Not Yet"
+
+            s.append(strings['table_row'].format(
+                hashtag=hashtag.capitalize(), price=price, date=date))
+            s.append("\n")
+        s.append(strings['table_end'])
+        s.append("\n")
+
+    return ''.join(s)
+
+
+def statstsv_render(result, months):
+    fields = (
+        'balance',
+        'subtotal',
+        'outgoing',
+        'incoming',
+        'dues',
+        'other',
+        'members',
+        'ARPM',
+    )
+    s = []
+
+    s += "#column 1 timestamp\n"
+    column_nr = 3
+    for field in fields:
+        s += '#column '
+        s += str(column_nr)
+        s += ' '
+        s += field
+        column_nr += 1
+        s += "\n"
+
+    for month in months:
+        if isinstance(month, str):
+            # its one of our rollup fake months
+            s += "# x"
+        else:
+            s += month.strftime('%s')
+
+        s += ' '
+        s += render_month(month)
+        s += ' '
+
+        # TODO
+        # - the timestamp is for the 1st of the month, however
+        #   all the stats are "as of end of month" - thus the
+        #   timestamp should probably be incremented to make
+        #   clear to anyone spelunking in the stats
+
+        for field in fields:
+            val = result[month][field]
+            if isinstance(val, (int, decimal.Decimal)):
+                s += str(val)
+            else:
+                s += str(result[month][field].value)
+            s += ' '
+
+        s += "\n"
+    return ''.join(s)
+
+
+def stats_render(result, months):
+    months_len = render_month_len()+2
+    tags_len = 13
+
+    s = []
+    s += grid_render_colheader(months, months_len, tags_len)
+    for tag in ('outgoing', 'incoming'):
+        s += grid_render_onerow(
+            tag, tags_len,
+            [result[x][tag].value.to_integral_exact(
+                    rounding=decimal.ROUND_FLOOR
+                ) for x in months],
+            months_len
+        )
+    s += "\n"
+    for tag in ('dues', 'other'):
+        s += grid_render_onerow(
+            " {}:".format(tag), tags_len,
+            [result[x][tag].value.to_integral_exact(
+                    rounding=decimal.ROUND_FLOOR
+                ) for x in months],
+            months_len
+        )
+    s += "\n"
+    s += grid_render_onerow(
+        'nr members', tags_len,
+        [result[x]['members'] for x in months],
+        months_len
+    )
+    s += grid_render_onerow(
+        'ARPM', tags_len,
+        [result[x]['ARPM'] for x in months],
+        months_len
+    )
+
+    # The rows after this are identical in the Average and Total columns,
+    # so to make that easier to see, remove the Total column from display
+    # Also remove the MonthTD, since the calcualted numbers will be bogus
+    # until near the end of the month
+    months = months[:-2]
+
+    def members_given_dues_outgoing(dues, rowset):
+        if dues == 0:
+            # no value possible!
+            return 0
+
+        months = len(rowset.group_by('month').keys())
+        total_dues = dues * months
+        return abs((rowset.value / total_dues).to_integral_exact(
+                rounding=decimal.ROUND_FLOOR
+        ))
+
+    def dues_given_members_outgoing(members, rowset):
+        if members == 0:
+            # no value possible!
+            return 0
+
+        months = len(rowset.group_by('month').keys())
+        return abs(rowset.value / members / months).to_integral_exact(
+                rounding=decimal.ROUND_FLOOR
+        )
+
+    s += "\n"
+    s += "members needed\n"
+
+    # Which fee rates do we want to see membership numbers for?
+    # Add in the recent official numbers
+    fees_rates = set([500, 700])
+    # Also add in some of the average revenue numbers
+    fees_rates.add(result['Average']['ARPM'])
+    fees_rates.add(result['MonthTD']['ARPM'])
+    for dues in sorted(fees_rates):
+        s += grid_render_onerow(
+            " dues {}".format(dues), tags_len,
+            [members_given_dues_outgoing(dues, result[x]['outgoing'])
+                for x in months],
+            months_len
+        )
+
+    s += "dues needed\n"
+
+    # Which membership numbers do we want to see needed fees for?
+    members_count = set([17, 30])
+    # add in some of the average member numbers
+    members_count.add(result['Average']['members'])
+    members_count.add(result['MonthTD']['members'])
+
+    for members in sorted(members_count):
+        s += grid_render_onerow(
+            " members {}".format(members), tags_len,
+            [dues_given_members_outgoing(members, result[x]['outgoing'])
+                for x in months],
+            months_len
+        )
+
+    s += "\nNote: Total column does not include MonthTD numbers\n"
+
+    return ''.join(s)
@@ -0,0 +1,107 @@
+# Licensed under GPLv3
+import hashlib
+import os
+
+
+# A directory of saved sub-command outputs, one file per key.  The mtime of
+# each file records when it was last used, so the least recently used
+# entries can be removed when the directory grows past its size limit.
+
+
+def hash_files(filenames):
+    """Return a hash of the names and contents of the given files
+    """
+    h = hashlib.sha256()
+    for filename in filenames:
+        h.update(os.path.basename(filename).encode('utf-8') + b'\0')
+        with open(filename, 'rb') as f:
+            h.update(hashlib.sha256(f.read()).digest())
+    return h.hexdigest()
+
+
+def hash_stats(filenames):
+    """Return a hash of the names, sizes and mtimes of the given files.
+       This is cheaper than hash_files() and good enough for spotting a
+       changed program
+    """
+    h = hashlib.sha256()
+    for filename in filenames:
+        st = os.stat(filename)
+        h.update('{} {} {}\n'.format(filename, st.st_size, st.st_mtime)
+                 .encode('utf-8'))
+    return h.hexdigest()
+
+
+class ResultCache(object):
+    """Store strings in a directory, keyed by a hex string
+    """
+
+    def __init__(self, dirname, max_size=10 * 1024 * 1024):
+        self.dirname = dirname
+        self.max_size = max_size
+        if not os.path.exists(dirname):
+            os.makedirs(dirname)
+
+    def _filename(self, key):
+        return os.path.join(self.dirname, key + '.out')
+
+    def get(self, key):
+        """Return the saved string, or None if there is no entry for the key
+        """
+        filename = self._filename(key)
+        try:
+            with open(filename, 'rb') as f:
+                data = f.read()
+            # mark the entry as recently used
+            os.utime(filename, None)
+        except (IOError, OSError):
+            return None
+        return data.decode('utf-8')
+
+    def put(self, key, data):
+        """Save the string for the key, and then evict the least recently
+           used entries until the cache fits in its maximum size
+        """
+        data = data.encode('utf-8')
+        if len(data) > self.max_size:
+            return
+
+        import tempfile
+
+        # write to a temporary file first, so that a concurrent reader
+        # never sees a partial entry
+        fd, tmpname = tempfile.mkstemp(dir=self.dirname, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.rename(tmpname, self._filename(key))
+
+        self.evict()
+
+    def entries(self):
+        """Return a list of (mtime, size, filename) for every entry, oldest
+           first
+        """
+        entries = []
+        for name in os.listdir(self.dirname):
+            if not name.endswith('.out'):
+                continue
+            filename = os.path.join(self.dirname, name)
+            try:
+                st = os.stat(filename)
+            except OSError:
+                # removed by someone else
+                continue
+            entries.append((st.st_mtime, st.st_size, filename))
+        return sorted(entries)
+
+    def evict(self):
+        entries = self.entries()
+        size = sum(x[1] for x in entries)
+        for mtime, entry_size, filename in entries:
+            if size <= self.max_size:
+                break
+            try:
+                os.unlink(filename)
+            except OSError:
+                pass
+            size -= entry_size
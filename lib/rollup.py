@@ -0,0 +1,222 @@
+# Licensed under GPLv3
+import datetime
+import json
+import os
+
+from row import Row
+from rowset import RowSet
+from ledgerdir import LedgerFile
+import ledgerfiles
+
+
+# Per year summaries of a ledger directory, so that the aggregation reports
+# do not need to parse the years that are closed and never change.
+#
+# A rollup holds the rows of all the files named after the months of one
+# year, boiled down to one cell for each month, tag and sign of the value:
+# the sum of the cents, the count of rows, the smallest exponent and the
+# latest date.  Turned back into a single Row, a cell has the same month,
+# tag, direction, value and last date as all of the rows it replaces - so
+# it can stand in for them in any report that only adds up values by month
+# and tag (sum, grid, stats, topay, payments and the balance page).  Both
+# the split and nosplit views are kept.
+#
+# The rollup records the digest of each file it was made from, and is only
+# used while all the files of its year are still the same.  Otherwise that
+# year is parsed from its files as usual.
+#
+# The closing balance of a year follows on from the one of the year before,
+# unless one of its files starts with a "#balance" pragma giving its opening
+# balance - then it is counted from the last such pragma instead.
+
+VERSION = 2
+
+
+def _sign(cents):
+    return (cents > 0) - (cents < 0)
+
+
+def cells(rows):
+    """Boil the rows down to a list of [tag, cents, count, exponent, last
+       date] cells, in the order that the first row of each cell appeared.
+       Keeping that order means that grouping the cell rows finds the tags
+       in the same order as grouping the original rows
+    """
+    index = {}
+    result = []
+    for row in rows:
+        date = row.date
+        key = (date.year, date.month, row.hashtag, _sign(row.cents))
+        cell = index.get(key)
+        if cell is None:
+            cell = index[key] = [row.hashtag, 0, 0, 0, date]
+            result.append(cell)
+        cell[1] += row.cents
+        cell[2] += 1
+        cell[3] = min(cell[3], row.exponent)
+        cell[4] = max(cell[4], date)
+
+    for cell in result:
+        cell[4] = cell[4].isoformat()
+    return result
+
+
+def cell_rows(cells):
+    """Return a list with one Row standing in for each cell
+    """
+    result = []
+    for tag, cents, count, exponent, date in cells:
+        date = datetime.date(int(date[0:4]), int(date[5:7]), int(date[8:10]))
+        comment = 'rollup of {} rows'.format(count)
+        result.append(Row.from_cents(cents, date, comment, exponent, tag))
+    return result
+
+
+def files_by_year(dirname):
+    """Return a dict of the year and the list of ledger files named after a
+       month of that year, and the list of all the other ledger files
+    """
+    years = {}
+    other = []
+    for filename in ledgerfiles.find(dirname):
+        month = ledgerfiles.file_month(filename)
+        if month is None:
+            other.append(filename)
+        else:
+            years.setdefault(month[0], []).append(filename)
+    return years, other
+
+
+def _filename(rollup_dir, year):
+    return os.path.join(rollup_dir, '{}.json'.format(year))
+
+
+def load(rollup_dir, year):
+    """Return the rollup of the year, or None if there is not one
+    """
+    try:
+        with open(_filename(rollup_dir, year)) as f:
+            rollup = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+    if rollup.get('version') != VERSION:
+        return None
+    return rollup
+
+
+def valid(rollup, filenames):
+    """Return True if the rollup was made from exactly the given files
+    """
+    if rollup is None:
+        return False
+    digests = dict(
+        (os.path.basename(x), ledgerfiles.digest(x)) for x in filenames
+    )
+    return rollup['files'] == digests
+
+
+def closing_balance(rollup, balance):
+    """Return the closing balance of the year of the rollup, given the
+       closing balance of the year before
+    """
+    if rollup['seeded_balance'] is not None:
+        return rollup['seeded_balance']
+    return balance + rollup['total']
+
+
+def build(year, filenames, opening_balance=0):
+    """Load the files of the year and return their rollup
+    """
+    files = {}
+    split = []
+    nosplit = []
+    seeded = None
+    for filename in filenames:
+        entry = LedgerFile(filename)
+        files[os.path.basename(filename)] = entry.digest
+        split += entry.split
+        nosplit += entry.rows
+
+        # the balance counted from the last opening "#balance" pragma
+        if entry.rows.opening_balance is not None:
+            seeded = entry.rows.opening_balance
+        if seeded is not None:
+            seeded += sum(row.cents for row in entry.rows)
+
+    rollup = {
+        'version': VERSION,
+        'year': year,
+        'files': files,
+        'total': sum(row.cents for row in nosplit),
+        'seeded_balance': seeded,
+        'split': cells(split),
+        'nosplit': cells(nosplit),
+    }
+    rollup['closing_balance'] = closing_balance(rollup, opening_balance)
+    return rollup
+
+
+def write(rollup_dir, rollup):
+    if not os.path.exists(rollup_dir):
+        os.makedirs(rollup_dir)
+    filename = _filename(rollup_dir, rollup['year'])
+    tmpname = filename + '.tmp'
+    with open(tmpname, 'w') as f:
+        json.dump(rollup, f, sort_keys=True)
+        f.write('\n')
+    os.rename(tmpname, filename)
+
+
+def update(dirname, rollup_dir, before):
+    """Bring the rollups of every year before the given one up to date.
+       Returns a list of (action, year) with the action one of 'wrote' or
+       'unchanged'
+    """
+    years, _ = files_by_year(dirname)
+    actions = []
+    balance = 0
+    for year in sorted(years):
+        if year >= before:
+            break
+        rollup = load(rollup_dir, year)
+        if not valid(rollup, years[year]):
+            rollup = build(year, years[year], balance)
+        elif rollup['closing_balance'] == closing_balance(rollup, balance):
+            actions.append(('unchanged', year))
+            balance = rollup['closing_balance']
+            continue
+        else:
+            # only an earlier year has changed
+            rollup['closing_balance'] = closing_balance(rollup, balance)
+        write(rollup_dir, rollup)
+        actions.append(('wrote', year))
+        balance = rollup['closing_balance']
+    return actions
+
+
+def rows(dirname, rollup_dir, split=True):
+    """Return a RowSet for the ledger directory, with the cells of the valid
+       rollups standing in for the rows of their years, and the rows of the
+       other files loaded as usual.  The order is the same as loading every
+       file in turn would give
+    """
+    years, other = files_by_year(dirname)
+
+    loaded = {}
+    for year, filenames in years.items():
+        rollup = load(rollup_dir, year)
+        if valid(rollup, filenames):
+            loaded[filenames[0]] = cell_rows(
+                rollup['split' if split else 'nosplit'])
+            continue
+        for filename in filenames:
+            entry = LedgerFile(filename)
+            loaded[filename] = entry.split if split else entry.rows
+    for filename in other:
+        entry = LedgerFile(filename)
+        loaded[filename] = entry.split if split else entry.rows
+
+    result = RowSet()
+    for filename in sorted(loaded):
+        result.append(list(loaded[filename]))
+    return result
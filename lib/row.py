@@ -7,29 +7,157 @@ import re
 
 
 # TODO
-# - make Row take Date objects and not strings with dates, removing a string
-#   handling fart from Row.autosplit() and removing external formatting
-#   knowledge from Row
 # - The "!months:[offset:]count" tag is perhaps a little awkward, find a
 #   more obvious format (perhaps "!months=month[,month]+" - which is clearly
 #   a more discoverable format, but would get quite verbose with yearly
 #   transactions (or even just one with more than 3 months...)
 
 
-class Row(namedtuple('Row', ('value', 'date', 'comment'))):
+def to_cents(value):
+    """Convert a Decimal value into an integer number of cents, refusing to
+       silently lose any fractions of a cent
+    """
+    cents = value * 100
+    if cents != int(cents):
+        raise ValueError('value {} is not a whole number of cents'.format(
+            value))
+    return int(cents)
+
+
+def from_cents(cents, exponent=None):
+    """Convert a number of cents back into a Decimal.  If the exponent is
+       given, the Decimal has that many decimal places (eg: "7.20") just as
+       if it had been written that way, otherwise as few as are needed
+    """
+    if cents % 100 == 0 and (exponent is None or exponent >= 0):
+        return decimal.Decimal(cents // 100)
+
+    value = decimal.Decimal(cents).scaleb(-2)
+    if exponent is None:
+        return value.normalize()
+    return value.quantize(decimal.Decimal(1).scaleb(min(exponent, -1)))
+
+
+# The fast path for parsing the values found in the text files
+VALUE_RE = re.compile(r'([-+]?)(\d*)(?:\.(\d*))?$')
+DATE_RE = re.compile(r'\d{4}-\d{2}-\d{2}$')
+
+
+def parse_value(value):
+    """Convert a value into an integer number of cents and the decimal
+       exponent it was written with (used to render it the same way again)
+    """
+    if isinstance(value, int):
+        return value * 100, 0
+
+    if isinstance(value, str):
+        m = VALUE_RE.match(value)
+        if m and (m.group(2) or m.group(3)):
+            sign, whole, fraction = m.groups()
+            fraction = fraction or ''
+            if fraction[2:].strip('0'):
+                raise ValueError(
+                    'value {} is not a whole number of cents'.format(value))
+            cents = int(whole or 0) * 100 + int(fraction[:2].ljust(2, '0'))
+            if sign == '-':
+                cents = -cents
+            return cents, -len(fraction)
+
+    # anything unusual gets the full Decimal treatment
+    value = decimal.Decimal(value)
+    return to_cents(value), min(value.as_tuple().exponent, 0)
+
+
+def parse_filter(string):
+    """Split a human readable filter into its field, operation and the value
+       to match - which is a number, if that looks possible
+    """
+    # its not a real tokeniser, its just a RE. so, now I have two problems
+    m = re.match("([a-z0-9_]+)([=!<>~]{1,2})(.*)", string, re.I)
+    if not m:
+        raise ValueError('filters must be <key><op><value>')
+
+    field = m.group(1)
+    op = m.group(2)
+    value_match = m.group(3)
+
+    # coerce our value to match into a number, if that looks possible
+    try:
+        value_match = float(value_match)
+    except ValueError:
+        pass
+
+    return field, op, value_match
+
+
+def filter_match(value_now, op, value_match):
+    """Return True if the simple value of a field matches the parsed filter
+    """
+    if op == '==':
+        return value_now == value_match
+    elif op == '!=':
+        return value_now != value_match
+    elif op == '>':
+        return value_now > value_match
+    elif op == '<':
+        return value_now < value_match
+    elif op == '=~':
+        return bool(re.search(value_match, value_now, re.I))
+    elif op == '!~':
+        return not re.search(value_match, value_now, re.I)
+    raise ValueError('Unknown filter operation "{}"'.format(op))
+
+
+class Row(namedtuple('Row', ('cents', 'date', 'comment', 'exponent',
+                             'hashtag', 'account'))):
+    """One transaction.  The value is held as an integer number of cents,
+       and only turned into a Decimal when it is asked for.  The account is
+       the name of the ledger the row was loaded from, when several are
+       loaded together (see federation.py), otherwise None.
+
+       Rows are immutable and have no per instance dict, so one row can be
+       shared by any number of reports, threads and caches.  A report that
+       wants to show the rows under different names uses a label function
+       when grouping them (see RowSet.group_by()) instead of changing them
+    """
+    __slots__ = ()
 
     def __new__(cls, value, date, comment):
-        value = decimal.Decimal(value)
-        date = datetime.datetime.strptime(date.strip(), "%Y-%m-%d").date()
+        cents, exponent = parse_value(value)
+        if not isinstance(date, datetime.date):
+            date = date.strip()
+            if DATE_RE.match(date):
+                # much quicker than strptime, for the common case
+                date = datetime.date(int(date[0:4]), int(date[5:7]),
+                                     int(date[8:10]))
+            else:
+                date = datetime.datetime.strptime(date, "%Y-%m-%d").date()
+
+        return cls.from_cents(cents, date, comment, exponent)
+
+    @classmethod
+    def from_cents(cls, cents, date, comment, exponent=0, hashtag=False,
+                   account=None):
+        """Construct a Row directly from its internal representation.
+           If the hashtag is already known, it can be passed in to avoid
+           parsing the comment again
+        """
+        # Look at the comment for this row and extract any hashtags found
+        # hashtags are used to tag the category of each transaction
+        if hashtag is False:
+            hashtag = cls._comment_tag('#', comment)
 
-        obj = super(cls, Row).__new__(cls, value, date, comment)
+        return super(Row, cls).__new__(cls, cents, date, comment, exponent,
+                                       hashtag, account)
 
-        # Look at the comment for this row and extract any hashtags found
-        # hashtags are used to tag the category of each transaction and
-        # might be overwritten later to decorate them nicely
-        obj.hashtag = obj._xtag('#')
+    def __reduce__(self):
+        # the fields are not the args of __new__, so pickle (and copy) need
+        # to be told how to make the row again
+        return (Row.from_cents, tuple(self))
 
-        return obj
+    @property
+    def value(self):
+        return from_cents(self.cents, self.exponent)
 
     def __add__(self, value):
         if isinstance(value, Row):
@@ -42,7 +170,7 @@ class Row(namedtuple('Row', ('value', 'date', 'comment'))):
 
     @property
     def direction(self):
-        if self.value < 0:
+        if self.cents < 0:
             return "outgoing"
         else:
             return "incoming"
@@ -57,8 +185,15 @@ class Row(namedtuple('Row', ('value', 'date', 'comment'))):
 
     @property
     def rel_months(self):
+        return self._rel_months(self.date)
+
+    @staticmethod
+    def _rel_months(date):
+        """Given a date object, return the approximate number of months
+           between it and the current month
+        """
         now = datetime.datetime.now().date()
-        month_this = self.date.replace(day=1)
+        month_this = date.replace(day=1)
         month_now = now.replace(day=1)
         rel_days = (month_this - month_now).days
 
@@ -70,8 +205,12 @@ class Row(namedtuple('Row', ('value', 'date', 'comment'))):
     def _xtag(self, x):
         """Generically extract tags with a given prefix
         """
+        return self._comment_tag(x, self.comment)
+
+    @staticmethod
+    def _comment_tag(x, comment):
         p = re.compile(x+r'([a-zA-Z]\S*)')
-        all_tags = p.findall(self.comment)
+        all_tags = p.findall(comment)
 
         # FIXME - enforce known case on all tags
 
@@ -167,9 +306,11 @@ class Row(namedtuple('Row', ('value', 'date', 'comment'))):
                 'would divide by zero, splitting children from {}'.format(
                     self.date))
 
-        each_value = self.value / count_children
-        # (avoid numbers that cannot be represented with cash by using int())
-        each_value = int(each_value)
+        # (avoid numbers that cannot be represented with cash by only
+        # giving each child a whole number of dollars)
+        each_value = abs(self.cents) // (100 * count_children) * 100
+        if self.cents < 0:
+            each_value = -each_value
 
         rows = []
 
@@ -183,13 +324,17 @@ class Row(namedtuple('Row', ('value', 'date', 'comment'))):
                 return [self]
 
             # the remainder is any money lost due to rounding
-            remainder = self.value - each_value * count_children
+            remainder = self.cents - each_value * count_children
 
+            # only the first child, with the remainder, keeps the precision
+            # that the original value was written with
+            exponent = self.exponent
             for date in dates:
-                datestr = date.isoformat()
-                this_value = each_value + remainder
+                rows.append(Row.from_cents(each_value + remainder, date,
+                                           comment, exponent, self.hashtag,
+                                           self.account))
                 remainder = 0  # only add the remainder to the first child
-                rows.append(Row(this_value, datestr, comment))
+                exponent = 0
 
         # elif method == 'proportional':
         #   # The 'proportional' splitting attempts to pro-rata the transaction
@@ -284,44 +429,9 @@ class Row(namedtuple('Row', ('value', 'date', 'comment'))):
         """Using the given human readable filter, check if this row matches
            and if so, return it, or None
         """
-
-        # its not a real tokeniser, its just a RE. so, now I have two problems
-        m = re.match("([a-z0-9_]+)([=!<>~]{1,2})(.*)", string, re.I)
-        if not m:
-            raise ValueError('filters must be <key><op><value>')
-
-        field = m.group(1)
-        op = m.group(2)
-        value_match = m.group(3)
-        value_now = self._getvalue_simple(field)
-
-        # coerce our value to match into a number, if that looks possible
-        try:
-            value_match = float(value_match)
-        except ValueError:
-            pass
-
-        if op == '==':
-            if value_now == value_match:
-                return self
-        elif op == '!=':
-            if value_now != value_match:
-                return self
-        elif op == '>':
-            if value_now > value_match:
-                return self
-        elif op == '<':
-            if value_now < value_match:
-                return self
-        elif op == '=~':
-            if re.search(value_match, value_now, re.I):
-                return self
-        elif op == '!~':
-            if not re.search(value_match, value_now, re.I):
-                return self
-        else:
-            raise ValueError('Unknown filter operation "{}"'.format(op))
-
+        field, op, value_match = parse_filter(string)
+        if filter_match(self._getvalue_simple(field), op, value_match):
+            return self
         return None
 
     def __str__(self):
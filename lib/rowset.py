@@ -1,10 +1,19 @@
 #!/usr/bin/env python
 # Licensed under GPLv3
-import decimal
 import re
 
 
-from row import Row
+from row import Row, from_cents, parse_value
+
+
+def value_of(cents, exponent):
+    """Return the Decimal value of a sum of cents, where exponent is the
+       smallest exponent of the values summed.  Values that have some digits
+       of significance return to being simple integers when possible
+    """
+    if cents % 100 == 0:
+        return from_cents(cents)
+    return from_cents(cents, min(exponent, 0))
 
 
 class RowSet(object):
@@ -13,7 +22,12 @@ class RowSet(object):
 
     def __init__(self):
         self.rows = []
-        self.balance = decimal.Decimal(0)
+        # the running balance is kept as an integer number of cents, along
+        # with the most decimal places used by any value in the set
+        self.cents = 0
+        self.exponent = 0
+        # set by load_file() from a "#balance" before the first row
+        self.opening_balance = None
 
     def __getitem__(self, i):
         return self.rows[i]
@@ -23,28 +37,26 @@ class RowSet(object):
 
     @property
     def value(self):
-        sum = decimal.Decimal(0)
+        sum = 0
         for row in self:
             if isinstance(row, (Row, RowSet)):
-                sum += row.value
+                sum += row.cents
             else:
                 raise ValueError("unexpected type")
 
-        if self.balance != sum:
-            raise ValueError("here {} {}".format(self.balance, sum))
-
-        # ensure that values that have been promoted to have some digits
-        # of significance return to being simple integers when possible.
-        if int(sum) == sum:
-            sum = sum.to_integral_exact()
+        if self.cents != sum:
+            raise ValueError("here {} {}".format(self.cents, sum))
 
-        return sum
+        # Only convert to a Decimal at the last moment
+        return value_of(sum, self.exponent)
 
     def _add_one_value(self, item):
         """Given an object that looks like a Row, add its data to our current set
         """
         self.rows.append(item)
-        self.balance += item.value
+        self.cents += item.cents
+        if item.exponent < self.exponent:
+            self.exponent = item.exponent
         # TODO
         # - since we are recording cash values, it doesnt make sense for the
         #   balance to ever fall below zero.  Consider making that an fatal
@@ -53,13 +65,22 @@ class RowSet(object):
     # TODO
     # - implement a "merge two RowSets" and ensure that it checks the
     #   closing/opening balances for compatibility with each other.
-    #   Then use this function in the parse_dir() instead of manually
+    #   Then use this function in LedgerDir.rows() instead of manually
     #   itterating the entries. (Remember, this will force data load
     #   ordering requirements too)
 
+    def freeze(self):
+        """Stop any more rows being added, so that the RowSet can be shared
+           between threads.  Returns the RowSet
+        """
+        self.rows = tuple(self.rows)
+        return self
+
     def append(self, item):
         """Given an object append it opaquely to our data as a single Row
         """
+        if isinstance(self.rows, tuple):
+            raise ValueError('cannot append to a frozen RowSet')
         if isinstance(item, (Row, RowSet)):
             self._add_one_value(item)
         elif isinstance(item, list):
@@ -69,14 +90,18 @@ class RowSet(object):
             raise ValueError('dont know how to append {}'.format(item))
 
     def load_file(self, stream):
-        """Given an open file handle, read Row lines into this RowSet
+        """Given an open file handle, read Row lines into this RowSet.  A
+           filename can be given instead, which may be a compressed file
+           (see ledgerfiles.py)
         """
         if isinstance(stream, str):
+            from ledgerfiles import open_text
             filename = stream
-            stream = open(filename, 'r')
-        else:
-            filename = '(stream)'
+            with open_text(filename) as f:
+                return self._load_stream(f, filename)
+        return self._load_stream(stream, '(stream)')
 
+    def _load_stream(self, stream, filename):
         if len(self) > 0:
             raise ValueError(
                 '{}: can only load files into an empty RowSet'.format(filename)
@@ -99,12 +124,13 @@ class RowSet(object):
                 #   round-triping
                 match = re.match(r'^#balance ([-0-9.]+)', row)
                 if match:
-                    given_balance = decimal.Decimal(match.group(1))
-                    current_balance = opening_balance+self.balance
+                    given_balance = parse_value(match.group(1))[0]
+                    current_balance = opening_balance+self.cents
                     if len(self.rows) == 0:
                         # if the balance pragma is before any transaction
                         # data then it sets the opening balance for the set
                         opening_balance = given_balance
+                        self.opening_balance = given_balance
                         continue
                     elif given_balance != current_balance:
                         raise ValueError(
@@ -113,8 +139,8 @@ class RowSet(object):
                             format(
                                 filename,
                                 line_number,
-                                given_balance,
-                                current_balance
+                                from_cents(given_balance),
+                                from_cents(current_balance)
                             )
                         )
                 # - in future there might be additional meta/pragmas
@@ -165,12 +191,16 @@ class RowSet(object):
         return result
 
     def group_by(self, field):
-        """Group the rowset by the given row field and return groups as a dict
+        """Group the rowset by the given row field and return groups as a dict.
+           The field can also be a label function, returning the group of
+           each row it is given
         """
         # This could be cached for performance, but for clarity it is not
         result = {}
         for row in self:
-            if field == 'month':
+            if callable(field):
+                key = field(row)
+            elif field == 'month':
                 # FIXME - Hack!
                 # - the "month" attribute of the row is intended for string
                 #   pattern matching, but the rowset wants to keep the original
@@ -0,0 +1,195 @@
+# Licensed under GPLv3
+import datetime
+import hashlib
+import sys
+
+try:
+    # python 2
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qsl
+except ImportError:
+    # python 3
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qsl
+
+
+# Each request is handled in its own thread.  The request refreshes the
+# ledger and then takes the current snapshot of it, which it uses for both
+# the ETag and the report - so a reload by another request part way through
+# can never mix two versions of the ledger in one response
+
+
+def query_to_argv(cmd, query):
+    """Convert the query parameters of a request into the commandline args
+       for the given sub-command.  "filter" and "nosplit" are the global
+       options, anything else is passed to the sub-command
+    """
+    argv = []
+    cmd_argv = []
+    for key, value in query:
+        if key == 'filter':
+            argv += ['--filter', value]
+        elif key == 'nosplit':
+            argv += ['--nosplit']
+        elif value == '':
+            cmd_argv += ['--' + key]
+        else:
+            cmd_argv += ['--' + key, value]
+
+    return argv + [cmd] + cmd_argv
+
+
+class ReportServer(ThreadingMixIn, HTTPServer):
+    """Serve the output of the sub-commands from a ledger kept in memory.
+
+       ledger is a LedgerDir (or a SharedLedgerReader), commands is a dict
+       mapping the sub-command name to its function and content type, and
+       parse_args turns a list of commandline args into the args object the
+       functions expect
+    """
+    daemon_threads = True
+
+    def __init__(self, address, ledger, commands, parse_args):
+        HTTPServer.__init__(self, address, ReportHandler)
+        self.ledger = ledger
+        self.commands = commands
+        self.parse_args = parse_args
+
+    def etag(self, path, snapshot):
+        """The ETag of a response depends on the whole ledger contents, the
+           request and the current date (rel_months looks at "now")
+        """
+        h = hashlib.sha256()
+        h.update(snapshot.digest.encode('utf-8'))
+        h.update(path.encode('utf-8'))
+        h.update(datetime.date.today().isoformat().encode('utf-8'))
+        return '"{}"'.format(h.hexdigest()[:32])
+
+    def run(self, cmd, query, snapshot):
+        """Run the named sub-command with the given query against the
+           ledger snapshot, and return its output
+        """
+        args = self.parse_args(query_to_argv(cmd, query))
+
+        # the snapshot of a shared ledger has the columns of the rows, which
+        # the sub-commands marked for it can add up without building any
+        # Row objects
+        columns = getattr(snapshot, 'ledger', None)
+        if columns is not None and self.commands[cmd].get('pushdown'):
+            from ledger import Ledger
+            args.ledger = Ledger.from_columns(columns, args.engine)
+            return self.commands[cmd]['func'](args)
+
+        # the rows are immutable, so every request can share them
+        args.rows = snapshot.rows(args.split, args.filter)
+
+        return self.commands[cmd]['func'](args)
+
+
+class ReportHandler(BaseHTTPRequestHandler):
+
+    def _send(self, code, body=None, content_type='text/plain', etag=None):
+        self.send_response(code)
+        if etag is not None:
+            self.send_header('ETag', etag)
+        if body is not None:
+            body = body.encode('utf-8')
+            self.send_header('Content-Type',
+                             '{}; charset=utf-8'.format(content_type))
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body is not None:
+            self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        cmd = url.path.strip('/')
+
+        if cmd not in self.server.commands:
+            self._send(404, 'Unknown report "{}"\n'.format(cmd))
+            return
+
+        try:
+            self.server.ledger.refresh()
+        except ValueError as e:
+            # the text files are being edited and are not valid right now
+            self._send(503, '{}\n'.format(e))
+            return
+
+        snapshot = self.server.ledger.snapshot
+        etag = self.server.etag(self.path, snapshot)
+        if self.headers.get('If-None-Match') == etag:
+            self._send(304, etag=etag)
+            return
+
+        query = parse_qsl(url.query, keep_blank_values=True)
+        try:
+            body = self.server.run(cmd, query, snapshot)
+        except SystemExit:
+            # argparse did not like the query
+            self._send(400, 'Bad query parameters\n')
+            return
+        except ValueError as e:
+            self._send(500, '{}\n'.format(e))
+            return
+
+        content_type = self.server.commands[cmd].get('mime', 'text/plain')
+        self._send(200, body + "\n", content_type, etag)
+
+    def log_message(self, format, *args):
+        sys.stderr.write("{} {}\n".format(self.address_string(),
+                                          format % args))
+
+
+def serve_workers(server, ledger, workers, interval=1.0):  # pragma: no cover
+    """Answer the requests to the server from the given number of forked
+       worker processes.  This process publishes the LedgerDir into shared
+       memory for the workers to attach to, and is then the only one
+       reading the files - checking them for changes every interval seconds
+    """
+    import signal
+    import time
+    import os
+    from sharedledger import SharedLedger, SharedLedgerReader
+
+    def terminate(signum, frame):
+        # make sure the segments are unlinked, and the workers stopped
+        sys.exit(0)
+    signal.signal(signal.SIGTERM, terminate)
+
+    shared = SharedLedger()
+    shared.publish(ledger.rows(split=False), ledger.digest)
+
+    pids = []
+    try:
+        for _ in range(workers):
+            pid = os.fork()
+            if pid == 0:
+                try:
+                    server.ledger = SharedLedgerReader(shared.name)
+                    server.serve_forever()
+                finally:
+                    os._exit(0)
+            pids.append(pid)
+
+        while True:
+            time.sleep(interval)
+            try:
+                changed = ledger.refresh()
+            except ValueError as e:
+                # the text files are being edited and are not valid right
+                # now, the workers carry on with the last good version
+                sys.stderr.write('{}\n'.format(e))
+                continue
+            if changed:
+                shared.publish(ledger.rows(split=False), ledger.digest)
+    finally:
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+                os.waitpid(pid, 0)
+            except OSError:
+                pass
+        shared.close()
@@ -0,0 +1,188 @@
+# Licensed under GPLv3
+import threading
+import struct
+
+import binledger
+
+# This module uses multiprocessing.shared_memory and so needs python 3.8
+from multiprocessing import shared_memory
+
+
+# Publish a ledger in shared memory, so that any number of worker processes
+# can report on a single copy of it.
+#
+# Each version of the ledger is encoded in the binledger format and copied
+# into a new shared memory segment.  A small control segment holds the
+# current version number, the name of the segment with that version and the
+# digest of the files it was made from.  A worker attaches to the control
+# segment once, and then to the segment of each version it finds there - the
+# columns are read straight out of the shared pages, nothing is copied into
+# the worker until a report builds the Row objects it needs.
+#
+# Only the publisher writes to the control segment.  Its sequence number is
+# odd while it is being written, so a reader can tell that it has seen a
+# half written update and try again.
+#
+# A segment is never changed once published.  When a new version replaces
+# it, it is only unlinked as the version after that is published, giving a
+# reader that found its name just before the switch time to attach to it.
+# Unlinking does not affect any reader already attached, which keeps its
+# mapping until it moves on to a newer version.
+#
+# The readers must be started from the publishing process (forked, or with
+# multiprocessing) so that, before python 3.13, they share its resource
+# tracker - otherwise each reader would unlink the segments when it exits.
+
+CONTROL = struct.Struct('<QQ64s64s')
+SEQ = struct.Struct('<Q')
+
+
+def _attach(name):
+    try:
+        # python 3.13 can leave the cleanup to the publisher
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name)
+
+
+class SharedLedger(object):
+    """Publish versions of a ledger into shared memory for any number of
+       SharedLedgerReader to attach to by name
+    """
+
+    def __init__(self):
+        self.control = shared_memory.SharedMemory(create=True,
+                                                  size=CONTROL.size)
+        self.control.buf[:CONTROL.size] = bytes(CONTROL.size)
+        self.name = self.control.name
+        self.version = 0
+        self.segments = []
+
+    def publish(self, rows, digest=''):
+        """Copy an unsplit RowSet (and its split children) into a new segment
+           and make it the current version.  Returns the version number
+        """
+        data = binledger.encode(rows)
+        segment = shared_memory.SharedMemory(create=True, size=len(data))
+        segment.buf[:len(data)] = data
+
+        self.version += 1
+        buf = self.control.buf
+        seq = SEQ.unpack_from(buf)[0]
+        SEQ.pack_into(buf, 0, seq + 1)
+        CONTROL.pack_into(buf, 0, seq + 1, self.version,
+                          segment.name.encode('utf-8'),
+                          digest.encode('utf-8'))
+        SEQ.pack_into(buf, 0, seq + 2)
+
+        self.segments.append(segment)
+        # keep the current and the previous version
+        while len(self.segments) > 2:
+            self._retire(self.segments.pop(0))
+        return self.version
+
+    @staticmethod
+    def _retire(segment):
+        segment.close()
+        segment.unlink()
+
+    def close(self):
+        """Unlink all the segments.  Any attached readers can carry on with
+           the version they have, but will not find any newer one
+        """
+        for segment in self.segments:
+            self._retire(segment)
+        self.segments = []
+        self._retire(self.control)
+
+
+class SharedSnapshot(object):
+    """One published version of a shared ledger, as seen by a reader.  The
+       filters are run on the shared columns, and only the matching rows are
+       built as Row objects
+    """
+
+    def __init__(self, version, segment, digest):
+        self.version = version
+        self.digest = digest
+        self.segment = segment
+        self.ledger = binledger.BinLedger.from_buffer(segment.buf,
+                                                      segment.name)
+
+    def rows(self, split=True, filters=None):
+        return self.ledger.rowset(split, filters)
+
+    def close(self):
+        if self.ledger is None:
+            return
+        # the views of the buffer must be released before the segment
+        self.ledger.close()
+        self.ledger = None
+        self.segment.close()
+
+    def __del__(self):
+        self.close()
+
+
+class SharedLedgerReader(object):
+    """Attach to the ledger published by a SharedLedger.  This has the same
+       interface as a LedgerDir: refresh() moves on to the newest published
+       version, which is then found in the snapshot attribute.  A reader
+       wanting several things from one version should take the snapshot
+       once and use that
+    """
+
+    def __init__(self, name):
+        self.control = _attach(name)
+        self.snapshot = None
+        self._lock = threading.Lock()
+        if not self.refresh():
+            raise ValueError('{}: no ledger has been published'.format(name))
+
+    @property
+    def version(self):
+        return self.snapshot.version
+
+    @property
+    def digest(self):
+        return self.snapshot.digest
+
+    def rows(self, split=True, filters=None):
+        return self.snapshot.rows(split, filters)
+
+    def _read_control(self):
+        buf = self.control.buf
+        while True:
+            seq, version, name, digest = CONTROL.unpack_from(buf)
+            if seq % 2 == 0 and SEQ.unpack_from(buf)[0] == seq:
+                break
+        return (version, name.rstrip(b'\0').decode('utf-8'),
+                digest.rstrip(b'\0').decode('utf-8'))
+
+    def refresh(self):
+        """Attach to the newest version, if it is not the one already
+           attached.  Returns True if the version changed
+        """
+        with self._lock:
+            while True:
+                version, name, digest = self._read_control()
+                if version == 0:
+                    return False
+                if self.snapshot is not None and \
+                        version == self.snapshot.version:
+                    return False
+                try:
+                    segment = _attach(name)
+                    break
+                except FileNotFoundError:
+                    # it was retired since reading the control segment
+                    continue
+
+            # any request still using the old snapshot keeps it alive, and
+            # it lets go of the segment once the last one has finished
+            self.snapshot = SharedSnapshot(version, segment, digest)
+            return True
+
+    def close(self):
+        self.snapshot = None
+        self.control.close()
@@ -0,0 +1,349 @@
+# Licensed under GPLv3
+import datetime
+import decimal
+import hashlib
+import os
+import re
+import sqlite3
+
+from row import Row
+from rowset import RowSet, value_of
+import ledgerfiles
+
+
+# TODO
+# - the rel_months filter is evaluated with a python function registered
+#   in the database, so it cannot use an index.  It could be rewritten as
+#   a date range once the "now" is passed in explicitly
+
+# Bump this whenever the schema changes - any database with a different
+# version is simply thrown away and rebuilt from the text files
+SCHEMA_VERSION = 2
+
+SCHEMA = (
+    '''CREATE TABLE files (
+        name TEXT PRIMARY KEY,
+        digest TEXT NOT NULL
+    )''',
+    '''CREATE TABLE rows (
+        id INTEGER PRIMARY KEY,
+        file TEXT NOT NULL,
+        seq INTEGER NOT NULL,
+        subseq INTEGER NOT NULL,
+        parent INTEGER,
+        children INTEGER NOT NULL,
+        value TEXT NOT NULL,
+        cents INTEGER NOT NULL,
+        exponent INTEGER NOT NULL,
+        date TEXT NOT NULL,
+        month TEXT NOT NULL,
+        comment TEXT NOT NULL,
+        hashtag TEXT,
+        tagprefix TEXT,
+        direction TEXT NOT NULL
+    )''',
+    'CREATE INDEX rows_file ON rows (file, seq, subseq)',
+    'CREATE INDEX rows_date ON rows (date)',
+    'CREATE INDEX rows_month ON rows (month)',
+    'CREATE INDEX rows_cents ON rows (cents)',
+    'CREATE INDEX rows_hashtag ON rows (hashtag)',
+    'CREATE INDEX rows_tagprefix ON rows (tagprefix)',
+    'CREATE INDEX rows_direction ON rows (direction)',
+    'CREATE INDEX rows_parent ON rows (parent)',
+)
+
+# Which rows make up each of the two possible views of the ledger
+VIEW_NOSPLIT = 'parent IS NULL'
+VIEW_SPLIT = '(parent IS NOT NULL OR children = 0)'
+
+# The row fields that map directly onto a text column.  Note that a missing
+# hashtag is rendered as the string "None" by Row._getvalue_simple()
+TEXT_FIELDS = {
+    'date': 'date',
+    'month': 'month',
+    'comment': 'comment',
+    'direction': 'direction',
+    'hashtag': "COALESCE(hashtag, 'None')",
+}
+
+SQL_OPS = {
+    '==': '=',
+    '!=': '!=',
+    '>': '>',
+    '<': '<',
+}
+
+
+def _sql_regexp(pattern, value):
+    if value is None:
+        return False
+    return re.search(pattern, value, re.I) is not None
+
+
+def _sql_rel_months(date):
+    date = datetime.datetime.strptime(date, "%Y-%m-%d").date()
+    return Row._rel_months(date)
+
+
+def _value_clause(op, value):
+    # Row.filter() compares the Decimal value of a row with the float value
+    # to match exactly, so "value==7.2" matches nothing, as the float is
+    # really 7.2000000000000001776...  The cents are whole numbers, so the
+    # same comparisons can be made against whole numbers of cents
+    with decimal.localcontext() as ctx:
+        ctx.prec = 400
+        cents = decimal.Decimal(value) * 100
+    floor = int(cents.to_integral_value(decimal.ROUND_FLOOR))
+    ceiling = int(cents.to_integral_value(decimal.ROUND_CEILING))
+    if max(abs(floor), abs(ceiling)) >= 2 ** 63:
+        # too big for an SQLite integer
+        return None
+
+    if op == '<':
+        return 'cents < ?', [ceiling]
+    if op == '>':
+        return 'cents > ?', [floor]
+    if floor != ceiling:
+        # no whole number of cents is equal to the value
+        return ('0' if op == '==' else '1'), []
+    return 'cents {} ?'.format(SQL_OPS[op]), [floor]
+
+
+def compile_filter(string):
+    """Convert one human readable filter into an SQL expression and its
+       parameters.  Returns None if the filter cannot be expressed in SQL
+       with exactly the same result as Row.filter()
+    """
+    m = re.match("([a-z0-9_]+)([=!<>~]{1,2})(.*)", string, re.I)
+    if not m:
+        return None
+
+    field = m.group(1)
+    op = m.group(2)
+    value_match = m.group(3)
+
+    # Row.filter() coerces the value to match into a number when it can
+    try:
+        number = decimal.Decimal(repr(float(value_match)))
+    except ValueError:
+        number = None
+    if number is not None and not number.is_finite():
+        return None
+
+    if op in ('=~', '!~'):
+        # A regex against a number is a type error in Row.filter()
+        if field not in TEXT_FIELDS or number is not None:
+            return None
+        expr = 'regexp(?, {})'.format(TEXT_FIELDS[field])
+        if op == '!~':
+            expr = 'NOT ' + expr
+        return expr, [value_match]
+
+    if op not in SQL_OPS:
+        return None
+
+    if field == 'value' and number is not None:
+        return _value_clause(op, float(value_match))
+
+    if field == 'rel_months' and number is not None:
+        return 'rel_months(date) {} ?'.format(SQL_OPS[op]), [float(number)]
+
+    if field in TEXT_FIELDS and number is None:
+        return '{} {} ?'.format(TEXT_FIELDS[field], SQL_OPS[op]), \
+            [value_match]
+
+    return None
+
+
+def compile_filters(filter_strings):
+    """Split a list of filters into an SQL where clause and the list of
+       filters that still need to be applied by Row.filter()
+    """
+    clauses = []
+    params = []
+    remaining = []
+    for s in filter_strings or []:
+        compiled = compile_filter(s)
+        if compiled is None:
+            remaining.append(s)
+            continue
+        clauses.append(compiled[0])
+        params.extend(compiled[1])
+
+    return clauses, params, remaining
+
+
+class SqlStore(object):
+    """Mirror the text ledger files into a SQLite database, allowing
+       filters and aggregations to be pushed down into indexed queries.
+
+       The text files are always the source of truth, the database can be
+       deleted at any time and will be rebuilt on the next refresh()
+    """
+
+    def __init__(self, filename=':memory:'):
+        self.db = sqlite3.connect(filename)
+        self.db.create_function('regexp', 2, _sql_regexp)
+        self.db.create_function('rel_months', 1, _sql_rel_months)
+
+        version = self.db.execute('PRAGMA user_version').fetchone()[0]
+        if version != SCHEMA_VERSION:
+            self._create()
+
+    def _create(self):
+        with self.db:
+            for table in ('rows', 'files'):
+                self.db.execute('DROP TABLE IF EXISTS {}'.format(table))
+            for statement in SCHEMA:
+                self.db.execute(statement)
+            self.db.execute('PRAGMA user_version = {}'.format(SCHEMA_VERSION))
+
+    @staticmethod
+    def _digest(filename):
+        with open(filename, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+
+    def _insert_row(self, name, seq, subseq, parent, children, row):
+        hashtag = row.hashtag
+        tagprefix = None
+        if hashtag is not None:
+            tagprefix = hashtag.split(':')[0]
+
+        cursor = self.db.execute(
+            'INSERT INTO rows (file, seq, subseq, parent, children, value, '
+            'cents, exponent, date, month, comment, hashtag, tagprefix, '
+            'direction) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (name, seq, subseq, parent, children, str(row.value),
+             row.cents, row.exponent, row.date.isoformat(), row.month,
+             row.comment, hashtag, tagprefix, row.direction)
+        )
+        return cursor.lastrowid
+
+    def _load(self, name, filename):
+        """Replace all the rows from one file with its current contents
+        """
+        rows = RowSet()
+        rows.load_file(filename)
+
+        self.db.execute('DELETE FROM rows WHERE file = ?', (name,))
+        for seq, row in enumerate(rows):
+            children = row.autosplit()
+            if len(children) == 1 and children[0] is row:
+                children = []
+
+            parent = self._insert_row(name, seq, 0, None, len(children), row)
+            for subseq, child in enumerate(children, 1):
+                self._insert_row(name, seq, subseq, parent, 0, child)
+
+    def refresh(self, dirname):
+        """Bring the database in line with the text files in dirname, only
+           reloading the files whose contents have changed.
+           Returns the list of file names that were reloaded
+        """
+        known = dict(self.db.execute('SELECT name, digest FROM files'))
+
+        changed = []
+        with self.db:
+            for filename in ledgerfiles.find(dirname):
+                name = os.path.basename(filename)
+                digest = self._digest(filename)
+                if known.pop(name, None) == digest:
+                    continue
+
+                self._load(name, filename)
+                self.db.execute(
+                    'INSERT OR REPLACE INTO files (name, digest) '
+                    'VALUES (?, ?)',
+                    (name, digest)
+                )
+                changed.append(name)
+
+            # anything left over has been deleted from the directory
+            for name in known:
+                self.db.execute('DELETE FROM rows WHERE file = ?', (name,))
+                self.db.execute('DELETE FROM files WHERE name = ?', (name,))
+                changed.append(name)
+
+        return changed
+
+    @staticmethod
+    def _where(split, filter_strings):
+        clauses, params, remaining = compile_filters(filter_strings)
+        clauses.insert(0, VIEW_SPLIT if split else VIEW_NOSPLIT)
+        return ' AND '.join(clauses), params, remaining
+
+    def rowset(self, split=True, filter_strings=None):
+        """Return a RowSet containing the rows matching the filters
+        """
+        where, params, remaining = self._where(split, filter_strings)
+        query = 'SELECT value, date, comment FROM rows WHERE {} ' \
+            'ORDER BY file, seq, subseq'.format(where)
+
+        result = RowSet()
+        for value, date, comment in self.db.execute(query, params):
+            result.append(Row(value, date, comment))
+
+        if remaining:
+            result = result.filter(remaining)
+        return result
+
+    def value(self, split=True, filter_strings=None):
+        """Return the sum of the values of the rows matching the filters
+        """
+        where, params, remaining = self._where(split, filter_strings)
+        if remaining:
+            return self.rowset(split, filter_strings).value
+
+        # the SUM() of no rows at all is NULL
+        query = 'SELECT COALESCE(SUM(cents), 0), COALESCE(MIN(exponent), 0) ' \
+            'FROM rows WHERE {}'.format(where)
+        return value_of(*self.db.execute(query, params).fetchone())
+
+    def group_value(self, field, split=True, filter_strings=None):
+        """Return a dict of the summed values for the rows matching the
+           filters, grouped by the given field.  The keys match those
+           returned by RowSet.group_by().  Given a tuple of fields, the rows
+           are grouped by all of them and each key is a tuple
+        """
+        columns = {
+            'month': 'month',
+            'hashtag': 'hashtag',
+            'direction': 'direction',
+            'date': 'date',
+        }
+        fields = field if isinstance(field, tuple) else (field,)
+
+        where, params, remaining = self._where(split, filter_strings)
+        if remaining or any(x not in columns for x in fields):
+            result = {}
+            groups = [((), self.rowset(split, filter_strings))]
+            for name in fields:
+                groups = [
+                    (key + (k,), v)
+                    for key, rows in groups
+                    for k, v in rows.group_by(name).items()
+                ]
+            for key, rows in groups:
+                result[key if isinstance(field, tuple) else key[0]] = \
+                    rows.value
+            return result
+
+        names = ', '.join(columns[x] for x in fields)
+        query = 'SELECT {0}, SUM(cents), MIN(exponent) FROM rows ' \
+            'WHERE {1} GROUP BY {0}'.format(names, where)
+
+        result = {}
+        for found in self.db.execute(query, params):
+            key = []
+            for name, value in zip(fields, found):
+                if value is None:
+                    value = 'unknown'
+                elif name == 'month':
+                    value = datetime.datetime.strptime(value, '%Y-%m').date()
+                elif name == 'date':
+                    value = datetime.datetime.strptime(
+                        value, '%Y-%m-%d').date()
+                key.append(value)
+            key = tuple(key) if isinstance(field, tuple) else key[0]
+            result[key] = value_of(*found[len(fields):])
+        return result
@@ -0,0 +1,153 @@
+""" Perform tests on the binledger.py
+"""
+
+import unittest
+import datetime
+import tempfile
+import sys
+import os
+
+try:
+    # python 2
+    from StringIO import StringIO
+except ImportError:
+    # python 3
+    from io import StringIO
+
+# Ensure that we look for any modules in our local lib dir.  This allows simple
+# testing and development use.  It also does not break the case where the lib
+# has been installed properly on the normal sys.path
+sys.path.insert(0,
+                os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lib')
+                )
+# I would use site.addsitedir, but it does an append, not insert
+
+import binledger # noqa
+from rowset import RowSet # noqa
+
+
+class TestBinLedger(unittest.TestCase):
+    def setUp(self):
+        f = StringIO("""
+-10 1970-02-06 comment4
+10 1970-01-05 comment1
+-10 1970-01-10 comment2 #rent
+-10 1970-01-01 comment3 #water
+-10.00 1970-03-01 comment5 #rent
+-15 1970-01-11 comment6 #water !months:3
+-0.5 1970-03-12 comment7
+""")
+        self.rows = RowSet()
+        self.rows.load_file(f)
+
+        fd, self.filename = tempfile.mkstemp()
+        os.close(fd)
+        binledger.write_file(self.filename, self.rows)
+        self.ledger = binledger.BinLedger(self.filename)
+
+    def tearDown(self):
+        self.ledger.close()
+        os.unlink(self.filename)
+
+    def test_len(self):
+        # the 7 original rows plus 3 split children
+        self.assertEqual(len(self.ledger), 10)
+        self.assertEqual(len(self.ledger.indexes(split=False)), 7)
+        self.assertEqual(len(self.ledger.indexes(split=True)), 9)
+
+    def test_columns(self):
+        self.assertEqual(self.ledger.cents[0], -1000)
+        self.assertEqual(self.ledger.dates[0],
+                         datetime.date(1970, 2, 6).toordinal())
+        self.assertEqual(list(self.ledger.parents[5:9]), [-1, 5, 5, 5])
+        self.assertEqual(self.ledger.tag(0), None)
+        self.assertEqual(self.ledger.tag(2), 'rent')
+
+    def test_roundtrip(self):
+        for split, rows in ((False, self.rows), (True, self.rows.autosplit())):
+            self.assertEqual(
+                [str(x) for x in self.ledger.rowset(split)],
+                [str(x) for x in rows]
+            )
+
+    def test_value(self):
+        # with the same decimal places as RowSet.value
+        self.assertEqual(str(self.rows.value), '-45.50')
+        self.assertEqual(str(self.ledger.value(False)), '-45.50')
+        self.assertEqual(str(self.ledger.value(True)), '-45.50')
+        self.assertEqual(str(self.ledger.value(True, ['value>0'])), '10')
+
+    def test_group_value(self):
+        self.assertEqual(
+            self.ledger.group_value('month'),
+            {
+                datetime.date(1970, 1, 1): -15,
+                datetime.date(1970, 2, 1): -15,
+                datetime.date(1970, 3, 1): -15.5,
+            }
+        )
+        self.assertEqual(
+            self.ledger.group_value('hashtag', False),
+            {
+                'rent': -20,
+                'water': -25,
+                'unknown': -0.5,
+            }
+        )
+        self.assertEqual(
+            self.ledger.group_value(('hashtag', 'month'), False,
+                                    ['hashtag==rent']),
+            {
+                ('rent', datetime.date(1970, 1, 1)): -10,
+                ('rent', datetime.date(1970, 3, 1)): -10,
+            }
+        )
+        self.assertEqual(
+            str(self.ledger.group_value('hashtag', False)['unknown']),
+            '-0.5')
+        with self.assertRaises(ValueError):
+            self.ledger.group_value('comment')
+        with self.assertRaises(ValueError):
+            self.ledger.group_value(('month', 'comment'))
+
+    def test_bad_file(self):
+        with open(self.filename, 'wb') as f:
+            f.write(b'not a ledger at all')
+        with self.assertRaises(ValueError):
+            binledger.BinLedger(self.filename)
+
+    def test_filters(self):
+        filters = (
+            ['hashtag=~^wat'],
+            ['hashtag==None'],
+            ['value<-5', 'month==1970-01'],
+            ['direction==incoming'],
+            ['rel_months<0'],
+            ['comment!~[12]'],
+            ['date==1970-01-11'],
+            # not taken from the columns, so checked on each Row
+            ['exponent<0'],
+        )
+        for split, rows in ((False, self.rows), (True, self.rows.autosplit())):
+            for f in filters:
+                self.assertEqual(
+                    [str(x) for x in self.ledger.rowset(split, f)],
+                    [str(x) for x in rows.filter(f)]
+                )
+
+        self.assertEqual(self.ledger.value(True, ['hashtag==rent']), -20)
+        self.assertEqual(
+            self.ledger.group_value('hashtag', True, ['month==1970-03']),
+            {'rent': -10, 'water': -5, 'unknown': -0.5}
+        )
+        with self.assertRaises(ValueError):
+            self.ledger.indexes(True, ['nonsense'])
+
+    def test_from_buffer(self):
+        buf = binledger.encode(self.rows) + bytearray(100)
+        ledger = binledger.BinLedger.from_buffer(buf)
+        self.assertEqual(len(ledger), 10)
+        self.assertEqual(str(ledger.value()), '-45.50')
+        ledger.close()
+        # once the views are released, the buffer can be changed again
+        buf += b'x'
@@ -0,0 +1,118 @@
+""" Perform tests on the cohorts.py
+"""
+
+import unittest
+import datetime
+import tempfile
+import shutil
+import sys
+import os
+
+# Ensure that we look for any modules in our local lib dir.  This allows simple
+# testing and development use.  It also does not break the case where the lib
+# has been installed properly on the normal sys.path
+sys.path.insert(0,
+                os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lib')
+                )
+# I would use site.addsitedir, but it does an append, not insert
+
+import cohorts # noqa
+from row import Row # noqa
+
+
+class TestCohorts(unittest.TestCase):
+    def test_month_index(self):
+        index = cohorts.month_index(datetime.date(1990, 1, 31))
+        self.assertEqual(index, 1990 * 12)
+        self.assertEqual(cohorts.month_str(index), '1990-01')
+        self.assertEqual(cohorts.month_str(index - 1), '1989-12')
+
+    def test_presence(self):
+        jan = cohorts.month_index(datetime.date(1990, 1, 1))
+        rows = [
+            Row('10', '1990-03-05', 'dues #dues:test1'),
+            Row('10', '1990-01-05', 'dues #dues:test1'),
+            Row('10', '1990-01-25', 'more dues #dues:test1'),
+            Row('0', '1990-02-01', 'owed money instead #dues:test2'),
+            Row('-10', '1990-01-01', 'refund #dues:test3'),
+            Row('-100', '1990-01-01', 'rent #rent'),
+        ]
+        self.assertEqual(cohorts.presence(rows), {
+            'test1': (jan, 0b101),
+            'test2': (jan + 1, 0b1),
+        })
+
+    def test_merge(self):
+        result = {'test1': (10, 0b11), 'test2': (5, 0b1)}
+        cohorts.merge(result, {'test1': (8, 0b101), 'test3': (1, 0b1)})
+        self.assertEqual(result, {
+            'test1': (8, 0b1101),
+            'test2': (5, 0b1),
+            'test3': (1, 0b1),
+        })
+        self.assertEqual(cohorts.last_month(*result['test1']), 11)
+
+    def test_matrix(self):
+        members = {
+            'test1': (10, 0b1011),
+            'test2': (10, 0b11),
+            'test3': (12, 0b1),
+        }
+        self.assertEqual(cohorts.matrix(members), [
+            (10, [2, 2, 0, 1]),
+            (12, [1, 0]),
+        ])
+        self.assertEqual(cohorts.matrix({}), [])
+
+    def test_table(self):
+        header, lines = cohorts.table({
+            'test1': (1990 * 12, 0b101),
+            'test2': (1990 * 12 + 1, 0b1),
+        })
+        self.assertEqual(header, ['cohort', 'members', '1', '2'])
+        self.assertEqual(lines, [
+            ['1990-01', 1, 0, 1],
+            ['1990-02', 1, 0, ''],
+        ])
+        self.assertEqual(cohorts.table({}), (['cohort', 'members'], []))
+
+
+class TestCohortState(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.state = os.path.join(self.dir, 'state.json')
+        self.ledger = os.path.join(self.dir, 'ledger')
+        os.mkdir(self.ledger)
+        self._write('1990-01.txt', "10 1990-01-05 #dues:test1 !months:3\n")
+        self._write('1990-02.txt', "10 1990-02-05 #dues:test2\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _write(self, name, data):
+        with open(os.path.join(self.ledger, name), 'w') as f:
+            f.write(data)
+
+    def test_refresh(self):
+        jan = 1990 * 12
+        state = cohorts.CohortState(self.state)
+        self.assertEqual(state.refresh(self.ledger),
+                         ['1990-01.txt', '1990-02.txt'])
+        self.assertEqual(state.members(), {
+            'test1': (jan, 0b111),
+            'test2': (jan + 1, 0b1),
+        })
+
+        # only the changed file is looked at again
+        self._write('1990-03.txt', "10 1990-03-05 #dues:test2\n")
+        state = cohorts.CohortState(self.state)
+        self.assertEqual(state.refresh(self.ledger), ['1990-03.txt'])
+        self.assertEqual(state.members(), {
+            'test1': (jan, 0b111),
+            'test2': (jan + 1, 0b11),
+        })
+        self.assertEqual(state.refresh(self.ledger), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
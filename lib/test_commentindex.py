@@ -0,0 +1,113 @@
+""" Perform tests on the commentindex.py
+"""
+
+import unittest
+import shutil
+import tempfile
+import sys
+import os
+
+# Ensure that we look for any modules in our local lib dir.  This allows simple
+# testing and development use.  It also does not break the case where the lib
+# has been installed properly on the normal sys.path
+sys.path.insert(0,
+                os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lib')
+                )
+# I would use site.addsitedir, but it does an append, not insert
+
+import commentindex # noqa
+
+
+class TestLiterals(unittest.TestCase):
+    def test_literals(self):
+        literals = commentindex.literals
+        self.assertEqual(literals('PayPal'), [['paypal']])
+        self.assertEqual(literals('^dues:(alice|bob)$'), [['dues:']])
+        self.assertEqual(literals('rent|water'), [['rent'], ['water']])
+        self.assertEqual(literals('from.*PayPal'), [['from', 'paypal']])
+        self.assertEqual(literals('(?:abcd)+x?'), [['abcd']])
+
+        # nothing long enough is needed for every match
+        self.assertEqual(literals('bills|xy'), None)
+        self.assertEqual(literals('(abcd)?'), None)
+        self.assertEqual(literals('.'), None)
+
+
+class TestCommentIndex(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dir, 'index.json')
+        self._write('1990-04.txt',
+                    "500 1990-04-03 Alice from PayPal #dues:alice\n"
+                    "-30 1990-04-05 #bills:water !months:3\n")
+        self._write('1990-05.txt',
+                    "500 1990-05-02 Bob by transfer #dues:bob\n"
+                    "-2 1990-05-03 PayPal fees #fees:paypal\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _write(self, name, data):
+        with open(os.path.join(self.dir, name), 'w') as f:
+            f.write(data)
+
+    def test_refresh(self):
+        index = commentindex.CommentIndex(self.filename)
+        self.assertEqual(index.refresh(self.dir),
+                         ['1990-04.txt', '1990-05.txt'])
+        self.assertEqual(index.files['1990-04.txt']['comments'], [
+            'Alice from PayPal #dues:alice',
+            '#bills:water !months:3',
+            '#bills:water !months:3 !child',
+        ])
+
+        # only the changed files are indexed again
+        index = commentindex.CommentIndex(self.filename)
+        self.assertEqual(index.refresh(self.dir), [])
+        self._write('1990-05.txt', "500 1990-05-02 Bob #dues:bob\n")
+        os.unlink(os.path.join(self.dir, '1990-04.txt'))
+        self.assertEqual(index.refresh(self.dir),
+                         ['1990-05.txt', '1990-04.txt'])
+        self.assertEqual(sorted(index.files), ['1990-05.txt'])
+
+    def test_prefilter(self):
+        index = commentindex.CommentIndex()
+        index.refresh(self.dir)
+        prefilter = index.prefilter
+        self.assertEqual(prefilter(['comment=~paypal']),
+                         set(['1990-04.txt', '1990-05.txt']))
+        self.assertEqual(prefilter(['comment=~paypal', 'hashtag=~^dues:a']),
+                         set(['1990-04.txt']))
+        self.assertEqual(prefilter(['hashtag=~water|bob']),
+                         set(['1990-04.txt', '1990-05.txt']))
+        self.assertEqual(prefilter(['comment=~xyzzy']), set())
+
+        # the index cannot help with these
+        self.assertEqual(prefilter(['value>0', 'comment!~paypal']), None)
+        self.assertEqual(prefilter(['hashtag=~non']), None)
+
+        # any comment outside ascii could match in other ways
+        self._write('1990-06.txt', "5 1990-06-01 café\n")
+        index.refresh(self.dir)
+        self.assertIn('1990-06.txt', prefilter(['comment=~xyzzy']))
+
+    def test_search(self):
+        index = commentindex.CommentIndex()
+        index.refresh(self.dir)
+        search = index.search
+        self.assertEqual(search(['paypal']), (
+            set(['1990-04.txt', '1990-05.txt']),
+            set(['Alice from PayPal #dues:alice', 'PayPal fees #fees:paypal']),
+        ))
+        self.assertEqual(search(['paypal', '-fees'])[1],
+                         set(['Alice from PayPal #dues:alice']))
+        self.assertEqual(search(['NOT', 'paypal', 'OR', 'alice'])[1], set([
+            'Alice from PayPal #dues:alice',
+            '#bills:water !months:3',
+            '#bills:water !months:3 !child',
+            'Bob by transfer #dues:bob',
+        ]))
+        self.assertEqual(search(['wa']), (
+            set(['1990-04.txt']),
+            set(['#bills:water !months:3', '#bills:water !months:3 !child']),
+        ))
@@ -0,0 +1,57 @@
+""" Perform tests on the dupes.py
+"""
+
+import unittest
+import sys
+import os
+
+# Ensure that we look for any modules in our local lib dir.  This allows simple
+# testing and development use.  It also does not break the case where the lib
+# has been installed properly on the normal sys.path
+sys.path.insert(0,
+                os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lib')
+                )
+# I would use site.addsitedir, but it does an append, not insert
+
+import dupes # noqa
+from row import Row # noqa
+
+
+class TestDupes(unittest.TestCase):
+    def test_fingerprint(self):
+        row = Row('-12.5', '1990-04-03', 'PayPal fees #fees:PayPal')
+        self.assertEqual(dupes.fingerprint(row),
+                         (-1250, 'fees:paypal', ('fees', 'paypal')))
+        self.assertEqual(
+            dupes.fingerprint(Row('5', '1990-04-03', 'b a  B')),
+            dupes.fingerprint(Row('5', '1990-04-04', 'A, b')))
+
+    def test_find(self):
+        items = [
+            ('1990-04.txt', Row('500', '1990-04-03', '#dues:test1')),
+            ('1990-04.txt', Row('500', '1990-04-30', '#dues:test1 Paid')),
+            ('1990-05.txt', Row('500', '1990-05-01', '#dues:test1 paid')),
+            ('1990-05.txt', Row('500', '1990-05-03', '#dues:test1')),
+            ('1990-05.txt', Row('-10', '1990-05-03', '#bills:misc')),
+            ('1990-05.txt', Row('-10', '1990-05-04', '#bills:misc')),
+            ('1990-05.txt', Row('-10', '1990-05-05', '#bills:misc')),
+            ('1990-05.txt', Row('-10', '1990-05-07', '#bills:misc')),
+        ]
+        groups = dupes.find(items)
+        self.assertEqual(
+            [[(source, str(row.date)) for source, row in x] for x in groups],
+            [
+                [('1990-04.txt', '1990-04-30'),
+                 ('1990-05.txt', '1990-05-01')],
+                [('1990-05.txt', '1990-05-03'),
+                 ('1990-05.txt', '1990-05-04'),
+                 ('1990-05.txt', '1990-05-05')],
+            ])
+
+        self.assertEqual(len(dupes.find(items, days=0)), 0)
+        self.assertEqual(len(dupes.find(items, days=30)), 3)
+
+        self.assertEqual(dupes.render(groups[:1]), "\n".join([
+            "1990-04.txt: 500 1990-04-30 #dues:test1 Paid",
+            "1990-05.txt: 500 1990-05-01 #dues:test1 paid",
+        ]))
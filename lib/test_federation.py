@@ -0,0 +1,101 @@
+""" Perform tests on the federation.py
+"""
+
+import unittest
+import datetime
+import shutil
+import tempfile
+import sys
+import os
+
+# Ensure that we look for any modules in our local lib dir.  This allows simple
+# testing and development use.  It also does not break the case where the lib
+# has been installed properly on the normal sys.path
+sys.path.insert(0,
+                os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lib')
+                )
+# I would use site.addsitedir, but it does an append, not insert
+
+import federation # noqa
+from ledger import Ledger # noqa
+
+
+class TestFederation(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.accounts = [
+            ('bank', os.path.join(self.dir, 'bank')),
+            ('petty', os.path.join(self.dir, 'petty')),
+        ]
+        self._write('bank', '1990-04.txt',
+                    "#balance 0\n"
+                    "1000 1990-04-01 #dues:test1\n"
+                    "-200 1990-04-03 to petty cash\n"
+                    "#balance 800\n")
+        self._write('bank', '1990-05.txt',
+                    "#balance 800\n"
+                    "-50 1990-05-02 #bills:water !months:2\n")
+        self._write('petty', '1990-04.txt',
+                    "200 1990-04-04 from the bank\n"
+                    "-20 1990-04-04 #bills:misc\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _write(self, account, name, data):
+        dirname = os.path.join(self.dir, account)
+        if not os.path.exists(dirname):
+            os.makedirs(dirname)
+        with open(os.path.join(dirname, name), 'w') as f:
+            f.write(data)
+
+    def test_parse_accounts(self):
+        self.assertEqual(federation.parse_accounts(['a=x', 'b=y=z']),
+                         [('a', 'x'), ('b', 'y=z')])
+        with self.assertRaises(ValueError):
+            federation.parse_accounts(['a'])
+        with self.assertRaises(ValueError):
+            federation.parse_accounts(['a=x', 'a=y'])
+
+    def test_load(self):
+        for jobs in (1, 2):
+            rows, gaps = federation.load(self.accounts, True, jobs)
+            self.assertEqual(gaps, [])
+            self.assertEqual(
+                [(str(x.date), x.account) for x in rows],
+                [('1990-04-01', 'bank'), ('1990-04-03', 'bank'),
+                 ('1990-04-04', 'petty'), ('1990-04-04', 'petty'),
+                 ('1990-05-02', 'bank'), ('1990-06-02', 'bank')])
+
+        rows, _ = federation.load(self.accounts, False)
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(str(rows.filter(['account==petty']).value), '180')
+
+    def test_gaps(self):
+        self._write('bank', '1990-05.txt', "#balance 700\n")
+        rows, gaps = federation.load(self.accounts, False)
+        self.assertEqual(len(gaps), 1)
+        self.assertIn('bank: ', gaps[0])
+        self.assertIn('opens with balance 700 but the files before it '
+                      'close with 800', gaps[0])
+
+    def test_grid(self):
+        rows, _ = federation.load(self.accounts, True)
+        grid = Ledger.from_rows(rows).grid(by_account=True)
+        self.assertEqual(grid['tags'], ['bank', 'petty'])
+        self.assertEqual(
+            str(grid['grid']['bank'][datetime.date(1990, 4, 1)]['sum']),
+            '800')
+
+        grid = Ledger.from_rows(rows).grid(by_account=True,
+                                           separate_inout=True)
+        self.assertEqual(grid['tags'],
+                         ['bank in', 'bank out', 'petty in', 'petty out'])
+
+    def test_transfers(self):
+        rows, _ = federation.load(self.accounts, False)
+        pairs = federation.transfers(rows)
+        self.assertEqual([(str(a), str(b)) for a, b in pairs], [
+            ('-200 1990-04-03 to petty cash', '200 1990-04-04 from the bank'),
+        ])
+        self.assertEqual(federation.transfers(rows, 0), [])
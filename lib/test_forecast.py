@@ -0,0 +1,175 @@
+""" Perform tests on the forecast.py
+"""
+
+import unittest
+import random
+import sys
+import os
+
+# Ensure that we look for any modules in our local lib dir.  This allows simple
+# testing and development use.  It also does not break the case where the lib
+# has been installed properly on the normal sys.path
+sys.path.insert(0,
+                os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lib')
+                )
+# I would use site.addsitedir, but it does an append, not insert
+
+import forecast # noqa
+from row import Row # noqa
+from rowset import RowSet # noqa
+
+# the month_index() of 1990-05
+MAY = 1990 * 12 + 4
+
+
+class TestForecast(unittest.TestCase):
+    def setUp(self):
+        rows = RowSet()
+        rows.append([
+            Row('-100', '1990-01-01', 'rent #bills:rent'),
+            Row('-100', '1990-02-01', 'rent #bills:rent'),
+            Row('-110', '1990-03-01', 'rent #bills:rent'),
+            Row('-100', '1990-04-01', 'rent #bills:rent'),
+            Row('-30', '1990-01-10', 'power #bills:power'),
+            Row('-30', '1990-04-10', 'power #bills:power'),
+            Row('-60', '1990-01-15', 'insurance #bills:insurance !months:6'),
+            Row('-90', '1990-01-20', 'quarter #bills:alarm !months:3'),
+            Row('-90', '1990-04-20', 'quarter #bills:alarm !months:3'),
+            Row('-5', '1990-02-01', 'old #bills:old'),
+            Row('-5', '1990-03-01', 'old #bills:old'),
+            Row('-50', '1990-03-01', 'once #bills:once'),
+            Row('-50', '1990-03-01', 'not a bill #rent'),
+            Row('20', '1990-02-01', 'dues #dues:test1'),
+            Row('20', '1990-03-01', 'dues #dues:test1'),
+            Row('20', '1990-04-01', 'dues #dues:test1'),
+            Row('10', '1990-03-01', 'dues #dues:test2'),
+            Row('20', '1990-04-01', 'dues #dues:test3'),
+            Row('10', '1990-04-01', 'donation #donation'),
+        ])
+        self.nosplit = rows
+        self.rows = rows.autosplit()
+
+    def test_recurring_bills(self):
+        self.assertEqual(forecast.recurring_bills(self.nosplit, MAY, 4), [
+            # a quarterly bill paid for three months at a time
+            forecast.Bill('bills:alarm', -9000, 3, MAY - 1),
+            # and a single payment for six months
+            forecast.Bill('bills:insurance', -6000, 6, MAY - 4),
+            forecast.Bill('bills:power', -3000, 3, MAY - 1),
+            forecast.Bill('bills:rent', -10000, 1, MAY - 1),
+        ])
+        # only one power and alarm payment is in the history
+        self.assertEqual(
+            [x.tag for x in forecast.recurring_bills(self.nosplit, MAY, 2)],
+            ['bills:alarm', 'bills:rent'])
+
+    def test_costs(self):
+        bills = [
+            forecast.Bill('bills:rent', -100, 1, MAY - 1),
+            forecast.Bill('bills:power', -30, 3, MAY - 2),
+        ]
+        self.assertEqual(forecast.costs(bills, MAY, 5),
+                         [-100, -130, -100, -100, -130])
+
+    def test_membership(self):
+        self.assertEqual(forecast.membership(self.rows, MAY, 3), {
+            'members': 2,
+            'left': 1,
+            'stayed': 2,
+            'joins': 1.0,
+            'arpm': [2000, 1500, 2000],
+        })
+
+    def test_binomial(self):
+        rng = random.Random(1)
+        self.assertEqual(forecast._binomial(rng, 10, 0), 0)
+        self.assertEqual(forecast._binomial(rng, 10, 1), 10)
+        counts = [forecast._binomial(rng, 10, 0.5) for _ in range(100)]
+        self.assertTrue(all(0 <= x <= 10 for x in counts))
+        self.assertTrue(300 < sum(counts) < 700)
+
+    def test_poisson(self):
+        rng = random.Random(1)
+        self.assertEqual(forecast._poisson(rng, 0), 0)
+        counts = [forecast._poisson(rng, 2) for _ in range(100)]
+        self.assertTrue(100 < sum(counts) < 300)
+
+    def test_percentile(self):
+        values = [5, 1, 4, 2, 3]
+        self.assertEqual(forecast.percentile(values, 0), 1)
+        self.assertEqual(forecast.percentile(values, 50), 3)
+        self.assertEqual(forecast.percentile(values, 100), 5)
+
+    def test_render(self):
+        members = {'members': 1, 'left': 1, 'stayed': 3, 'joins': 0.5,
+                   'arpm': [500]}
+        bills = [forecast.Bill('bills:rent', -400, 1, MAY - 1)]
+        self.assertEqual(
+            forecast.render(MAY, 100, bills, members, [0, 2], [
+                [-100, 50],
+                [-200, 150],
+            ], 2),
+            "\n".join([
+                "running balance 1 at the start of 1990-05",
+                "recurring bills",
+                "  bills:rent                       -4 every 1 months, "
+                "next 1990-05",
+                "members 1, joining 0.5 and leaving 25.0% a month",
+                "runway in months, over 2 scenarios",
+                "   10% 0",
+                "   50% 2+",
+                "   90% 2+",
+                "balance",
+                "  month          10%        50%        90%",
+                "  1990-05         -1        0.5        0.5",
+                "  1990-06         -2        1.5        1.5",
+            ]))
+
+
+class TestSimulate(unittest.TestCase):
+    use_numpy = False
+
+    def test_fixed(self):
+        # with nobody leaving or joining and one rate of dues, every
+        # scenario is the same
+        members = {'members': 2, 'left': 0, 'stayed': 10 ** 9, 'joins': 0,
+                   'arpm': [500]}
+        runway, balances = forecast.simulate(
+            1000, [-1500, -1500, -1000, -1500], members, 10, 1,
+            self.use_numpy)
+        self.assertEqual(runway, [3] * 10)
+        self.assertEqual(balances, [
+            [500] * 10,
+            [0] * 10,
+            [0] * 10,
+            [-500] * 10,
+        ])
+
+        runway, balances = forecast.simulate(
+            1000, [0, 0], members, 3, 1, self.use_numpy)
+        self.assertEqual(runway, [2] * 3)
+
+    def test_random(self):
+        members = {'members': 20, 'left': 10, 'stayed': 90, 'joins': 1.0,
+                   'arpm': [400, 500, 600]}
+        runway, balances = forecast.simulate(
+            0, [-8000] * 12, members, 1000, 1, self.use_numpy)
+        self.assertEqual(len(runway), 1000)
+        self.assertEqual([len(x) for x in balances], [1000] * 12)
+        self.assertTrue(all(0 <= x <= 12 for x in runway))
+        # the members are leaving faster than they join, so most scenarios
+        # run out of money
+        self.assertLess(forecast.percentile(runway, 50), 12)
+        self.assertEqual(
+            forecast.simulate(0, [-8000] * 12, members, 1000, 1,
+                              self.use_numpy),
+            (runway, balances))
+
+
+@unittest.skipIf(forecast.numpy is None, 'numpy is not installed')
+class TestSimulateNumpy(TestSimulate):
+    use_numpy = True
+
+
+if __name__ == '__main__':
+    unittest.main()
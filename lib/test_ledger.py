@@ -0,0 +1,296 @@
+""" Perform tests on the ledger.py
+"""
+
+import unittest
+import datetime
+import shutil
+import threading
+import tempfile
+import time
+import sys
+import os
+
+# Ensure that we look for any modules in our local lib dir.  This allows simple
+# testing and development use.  It also does not break the case where the lib
+# has been installed properly on the normal sys.path
+sys.path.insert(0,
+                os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lib')
+                )
+# I would use site.addsitedir, but it does an append, not insert
+
+if sys.version_info[0] == 2:  # pragma: no cover
+    import mock
+else:
+    from unittest import mock  # pragma: no cover
+
+import binledger # noqa
+import ledger # noqa
+import render # noqa
+
+
+class fakedatetime(datetime.datetime):
+
+    @classmethod
+    def now(cls):
+        return cls(1990, 6, 10, 12, 0, 0)
+
+
+class TestLedger(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self._write('1990-04.txt',
+                    "500 1990-04-03 #dues:test1\n"
+                    "-12500 1990-04-15 #bills:rent\n"
+                    "20000 1990-04-27 balance books\n")
+        self._write('1990-05.txt',
+                    "700 1990-05-02 #dues:test2\n"
+                    "-300 1990-05-15 #bills:water !months:2\n")
+        self._write('1990-06.txt', "500 1990-06-02 #dues:test1\n")
+        self.ledger = ledger.Ledger(self.dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _write(self, name, data):
+        filename = os.path.join(self.dir, name)
+        with open(filename, 'w') as f:
+            f.write(data)
+        mtime = time.time() + len(data)
+        os.utime(filename, (mtime, mtime))
+
+    def test_rows(self):
+        self.assertEqual(len(self.ledger.rows(split=False)), 6)
+        self.assertEqual(len(self.ledger.rows(split=True)), 7)
+        self.assertEqual(len(self.ledger.rows(filters=['value>0'])), 4)
+
+    def test_sum(self):
+        self.assertEqual(self.ledger.sum(), 8900)
+        self.assertEqual(self.ledger.sum(filters=['hashtag=~^dues:']), 1700)
+
+    def test_grid(self):
+        got = self.ledger.grid()
+        april = datetime.date(1990, 4, 1)
+        june = datetime.date(1990, 6, 1)
+        self.assertEqual(got['months'],
+                         [april, datetime.date(1990, 5, 1), june])
+        self.assertEqual(got['tags'], [
+            'bills:rent', 'bills:water', 'dues:test1', 'dues:test2',
+            'unknown',
+        ])
+        self.assertEqual(got['grid']['bills:water'][june]['sum'], -150)
+        self.assertEqual(got['totals']['total'], 8900)
+        self.assertEqual(got['running_totals'][june], 8900)
+
+        got = self.ledger.grid(separate_inout=True)
+        self.assertEqual(got['tags'], [
+            'bills:rent out', 'bills:water out', 'dues:test1 in',
+            'dues:test2 in', 'unknown in',
+        ])
+
+        # the rows of the ledger are not changed by the labels
+        self.assertEqual(self.ledger.rows()[2].hashtag, None)
+
+        # and the vectorised engine uses the same labels
+        self.ledger.engine = 'numpy'
+        self.assertEqual(self.ledger.grid(separate_inout=True), got)
+
+    def test_topay(self):
+        got = self.ledger.topay(split=False)
+        self.assertEqual(got['tags'], ['bills:rent', 'bills:water'])
+        self.assertEqual(got['cells'][datetime.date(1990, 5, 1)], {
+            'bills:water': (-300, datetime.date(1990, 5, 15)),
+        })
+
+    def test_payments(self):
+        self.assertEqual(self.ledger.payments(), {
+            'dues:test1': datetime.date(1990, 6, 2),
+            'dues:test2': datetime.date(1990, 5, 2),
+            'unknown': datetime.date(1990, 4, 27),
+        })
+
+    def test_stats(self):
+        result, months = self.ledger.stats()
+        self.assertEqual(months[-3:], ['Average', 'MonthTD', 'Total'])
+        self.assertEqual(result['Total']['members'], 2)
+        self.assertEqual(result['Total']['subtotal'], 8900)
+
+        # the months are cached for the unfiltered view
+        snapshot = self.ledger.snapshot()
+        cache = snapshot._source.month_cache('stats')
+        self.assertEqual(len(cache), 3)
+        april = cache[datetime.date(1990, 4, 1)]
+        self.ledger.stats(filters=['value>0'])
+        self.assertTrue(cache[datetime.date(1990, 4, 1)] is april)
+
+        # and the next version of the ledger keeps all the months not
+        # touched by the changed file
+        self._write('1990-05.txt', "700 1990-05-02 #dues:test2\n")
+        self.assertEqual(self.ledger.refresh(), ['1990-05.txt'])
+        self.assertEqual(len(cache), 3)
+        cache = self.ledger.snapshot()._source.month_cache('stats')
+        self.assertEqual(list(cache.keys()), [datetime.date(1990, 4, 1)])
+        self.assertTrue(cache[datetime.date(1990, 4, 1)] is april)
+
+        # while the old snapshot still sees the old version
+        self.assertEqual(snapshot.stats()[0]['Total']['subtotal'], 8900)
+
+        result, months = self.ledger.stats()
+        self.assertEqual(result['Total']['subtotal'], 9200)
+
+    def test_stats_nosplit(self):
+        # the row is in May, but its split rows are all in later months
+        self._write('1990-05.txt', "300 1990-05-10 #dues:b !months:1:3\n")
+        self.assertEqual(self.ledger.refresh(), ['1990-05.txt'])
+        may = datetime.date(1990, 5, 1)
+        result, months = self.ledger.stats(split=False)
+        self.assertEqual(result[may]['dues'].value, 300)
+
+        self._write('1990-05.txt', "900 1990-05-10 #dues:b !months:1:3\n")
+        self.assertEqual(self.ledger.refresh(), ['1990-05.txt'])
+        result, months = self.ledger.stats(split=False)
+        self.assertEqual(result[may]['dues'].value, 900)
+        self.assertEqual(result['Total']['dues'].value, 1900)
+
+    @mock.patch('ledger.datetime.datetime', fakedatetime)
+    def test_balance(self):
+        got = self.ledger.balance()
+        self.assertEqual(got['balance_sum'], 8900)
+        self.assertEqual(got['rent_due'], datetime.date(1990, 4, 23))
+        self.assertEqual(got['grid']['tags'], ['Test1', 'Test2'])
+        self.assertEqual(got['grid']['totals']['total'], 1700)
+
+        got = self.ledger.balance_html('$rent_due $balance_sum\n$grid')
+        self.assertEqual(got.split('\n'), [
+            '1990-04-23 8900',
+            'Test1       500               500',
+            'Test2                700         ',
+            '',
+        ])
+
+    def test_from_rows(self):
+        rows = self.ledger.rows(filters=['hashtag=~^dues:'])
+        cache = {}
+        other = ledger.Ledger.from_rows(rows, stats_cache=cache)
+        self.assertTrue(other.rows() is rows)
+        self.assertEqual(other.sum(), 1700)
+        self.assertEqual(other.refresh(), [])
+
+        other.stats()
+        self.assertEqual(len(cache), 3)
+
+    def test_sqlite(self):
+        db = ledger.Ledger(self.dir, sqlite=':memory:')
+        self.assertEqual(db.sum(), 8900)
+        self.assertEqual(db.sum(filters=['hashtag=~^dues:']), 1700)
+        self.assertEqual(db.grid(), self.ledger.grid())
+
+        # the values are added up by the database, without any rows
+        with mock.patch.object(db._source, 'rowset') as rowset:
+            self.assertEqual(db.sum(filters=['month==1990-05']), 550)
+            self.assertEqual(db.grid(filters=['value<0']),
+                             self.ledger.grid(filters=['value<0']))
+        self.assertFalse(rowset.called)
+
+        db.stats()
+        self._write('1990-05.txt', "700 1990-05-02 #dues:test2\n")
+        self.assertEqual(db.refresh(), ['1990-05.txt'])
+        self.assertEqual(db._stats_caches, {})
+        self.assertEqual(db.refresh(), [])
+
+    def test_binary(self):
+        filename = os.path.join(self.dir, 'ledger.bin')
+        binledger.write_file(filename, self.ledger.rows(split=False))
+
+        binary = ledger.Ledger(load_binary=filename)
+        self.assertEqual(binary.sum(), 8900)
+        self.assertEqual(len(binary.rows(split=False)), 6)
+        self.assertEqual(render.statstsv_render(*binary.stats()),
+                         render.statstsv_render(*self.ledger.stats()))
+        self.assertEqual(binary.refresh(), [])
+        binary._source.close()
+
+
+class TestConcurrent(unittest.TestCase):
+    """Many threads run reports while another one keeps changing and
+       reloading the ledger.  Each version of the ledger balances to zero
+       and all of its rows are tagged with the version number, so a report
+       mixing two versions is easy to spot
+    """
+    readers = 8
+    versions = 20
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self._write_version(0)
+        self.ledger = ledger.Ledger(self.dir)
+        self.interval = sys.getswitchinterval()
+        # switch threads far more often than usual
+        sys.setswitchinterval(1e-5)
+
+    def tearDown(self):
+        sys.setswitchinterval(self.interval)
+        shutil.rmtree(self.dir)
+
+    def _write_version(self, version):
+        for name, sign in (('1990-04.txt', ''), ('1990-05.txt', '-')):
+            filename = os.path.join(self.dir, name)
+            with open(filename, 'w') as f:
+                f.write("{}{} {}-01 #dues:v{} !months:3\n".format(
+                    sign, version + 1, name[:7], version))
+            # the size might not change, so make sure that the mtime does
+            os.utime(filename, (1000000 + version, 1000000 + version))
+
+    def _read(self, stop, seen, errors):
+        last = -1
+        while not stop.is_set():
+            snapshot = self.ledger.snapshot()
+            version = snapshot._source.version
+            if version < last:
+                errors.append('went back from {} to {}'.format(last, version))
+            last = version
+
+            tags = set(row.hashtag for row in snapshot.rows(False))
+            tags |= set(snapshot.grid()['tags'])
+            if len(tags) != 1:
+                errors.append('mixed versions {}'.format(tags))
+            if snapshot.sum() != 0 or snapshot.sum(split=False) != 0:
+                errors.append('version {} does not balance'.format(version))
+
+            # the reports pin their own snapshot
+            grid = self.ledger.grid()
+            if grid['totals']['total'] != 0 or len(grid['tags']) != 1:
+                errors.append('grid mixed versions {}'.format(grid['tags']))
+
+            # as do the stats, along with the months they cache
+            result, months = self.ledger.stats()
+            incoming = sum(result[x]['incoming'].value for x in months[:-3])
+            if incoming != result['Total']['incoming'].value:
+                errors.append('stats mixed versions')
+            seen.add(version)
+
+    def test_readers_and_reloader(self):
+        stop = threading.Event()
+        seen = set()
+        errors = []
+        threads = [
+            threading.Thread(target=self._read, args=(stop, seen, errors))
+            for _ in range(self.readers)
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            for version in range(1, self.versions + 1):
+                self._write_version(version)
+                self.assertEqual(self.ledger.refresh(),
+                                 ['1990-04.txt', '1990-05.txt'])
+                time.sleep(0.001)
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(self.ledger.snapshot()._source.version,
+                         self.versions + 1)
+        # the readers saw more than just the first and last versions
+        self.assertTrue(len(seen) > 2)
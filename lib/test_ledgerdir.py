@@ -0,0 +1,161 @@
+""" Perform tests on the ledgerdir.py
+"""
+
+import unittest
+import datetime
+import shutil
+import tempfile
+import time
+import sys
+import os
+
+# Ensure that we look for any modules in our local lib dir.  This allows simple
+# testing and development use.  It also does not break the case where the lib
+# has been installed properly on the normal sys.path
+sys.path.insert(0,
+                os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lib')
+                )
+# I would use site.addsitedir, but it does an append, not insert
+
+if sys.version_info[0] == 2:  # pragma: no cover
+    import mock
+else:
+    from unittest import mock  # pragma: no cover
+
+import ledgerdir # noqa
+
+
+class TestLedgerDir(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self._write('1970-01.txt', "10 1970-01-05 comment1\n")
+        self._write('1970-02.txt', "-15 1970-02-11 #water !months:3\n")
+        self.ledger = ledgerdir.LedgerDir(self.dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _write(self, name, data, mtime=None):
+        filename = os.path.join(self.dir, name)
+        with open(filename, 'w') as f:
+            f.write(data)
+        if mtime is None:
+            mtime = time.time() + len(data)
+        os.utime(filename, (mtime, mtime))
+
+    def test_rows(self):
+        self.assertEqual(len(self.ledger.rows(split=False)), 2)
+        self.assertEqual(len(self.ledger.rows(split=True)), 4)
+        self.assertEqual(self.ledger.rows().value, -5)
+
+    def test_refresh(self):
+        digest = self.ledger.digest
+        self.assertEqual(self.ledger.refresh(), [])
+
+        # unchanged files are not loaded again
+        before = self.ledger.files['1970-01.txt']
+        self._write('1970-02.txt', "-15 1970-02-11 #water\n")
+        self.assertEqual(self.ledger.refresh(), ['1970-02.txt'])
+        self.assertTrue(self.ledger.files['1970-01.txt'] is before)
+        self.assertNotEqual(self.ledger.digest, digest)
+        self.assertEqual(len(self.ledger.rows(split=True)), 2)
+
+        # touching the file without changing it is not a change
+        self._write('1970-02.txt', "-15 1970-02-11 #water\n", time.time())
+        self.assertEqual(self.ledger.refresh(), [])
+
+        os.unlink(os.path.join(self.dir, '1970-01.txt'))
+        self.assertEqual(self.ledger.refresh(), ['1970-01.txt'])
+        self.assertEqual(self.ledger.rows().value, -15)
+
+    def test_snapshot(self):
+        old = self.ledger.snapshot
+        rows = old.rows()
+        self.assertTrue(self.ledger.rows() is rows)
+        cache = old.month_cache('test')
+        cache.update({
+            datetime.date(1970, 1, 1): 1,
+            datetime.date(1970, 3, 1): 2,
+        })
+
+        # a touched file is not a new version
+        stat = old.files['1970-01.txt'].stat
+        self._write('1970-01.txt', "10 1970-01-05 comment1\n", time.time())
+        self.assertEqual(self.ledger.refresh(), [])
+        self.assertTrue(self.ledger.snapshot is old)
+        # and its entry in the snapshot is left as it was, while the new
+        # mtime still saves reading it again
+        self.assertEqual(old.files['1970-01.txt'].stat, stat)
+        with mock.patch.object(ledgerdir, 'LedgerFile') as loaded:
+            self.assertEqual(self.ledger.refresh(), [])
+        self.assertFalse(loaded.called)
+
+        self._write('1970-02.txt', "-15 1970-02-11 #water !months:2\n")
+        self.assertEqual(self.ledger.refresh(), ['1970-02.txt'])
+        self.assertEqual(self.ledger.version, old.version + 1)
+
+        # the old snapshot is unchanged
+        self.assertTrue(old.rows() is rows)
+        self.assertEqual(len(old.rows()), 4)
+        self.assertEqual(len(cache), 2)
+
+        # and the new one only keeps the months not touched by the file
+        self.assertEqual(len(self.ledger.rows()), 3)
+        self.assertEqual(self.ledger.snapshot.month_cache('test'),
+                         {datetime.date(1970, 1, 1): 1})
+
+        # the rows cannot be changed
+        with self.assertRaises(ValueError):
+            self.ledger.rows().append(rows[0])
+
+    def test_snapshot_nosplit(self):
+        january = datetime.date(1970, 1, 1)
+        february = datetime.date(1970, 2, 1)
+        march = datetime.date(1970, 3, 1)
+        for split in (True, False):
+            self.ledger.snapshot.month_cache('test', split).update({
+                january: 1,
+                february: 2,
+                march: 3,
+            })
+
+        self._write('1970-02.txt', "-15 1970-02-11 #water !months:2\n")
+        self.assertEqual(self.ledger.refresh(), ['1970-02.txt'])
+
+        # the nosplit row is only in February, while the split rows were in
+        # February to April
+        snapshot = self.ledger.snapshot
+        self.assertEqual(snapshot.month_cache('test', True), {january: 1})
+        self.assertEqual(snapshot.month_cache('test', False),
+                         {january: 1, march: 3})
+
+        self._write('1970-03.txt', "-15 1970-03-11 #water !months:-1:2\n")
+        self.assertEqual(self.ledger.refresh(), ['1970-03.txt'])
+        snapshot = self.ledger.snapshot
+        self.assertEqual(snapshot.month_cache('test', True), {january: 1})
+        self.assertEqual(snapshot.month_cache('test', False), {january: 1})
+
+    def test_file_index(self):
+        def entry(filename):
+            loaded.append(os.path.basename(filename))
+            found = ledgerdir.LedgerFile(filename)
+            return {'digest': found.digest, 'rows': len(found.rows)}
+
+        loaded = []
+        filename = os.path.join(self.dir, 'index.json')
+        index = ledgerdir.FileIndex(entry, 1, filename)
+        self.assertEqual(index.refresh(self.dir),
+                         ['1970-01.txt', '1970-02.txt'])
+        self.assertEqual(index.files['1970-02.txt']['rows'], 1)
+
+        # a new index reads the saved entries back
+        loaded = []
+        index = ledgerdir.FileIndex(entry, 1, filename)
+        self.assertEqual(index.refresh(self.dir), [])
+        self.assertEqual(loaded, [])
+
+        # but not those of another version
+        index = ledgerdir.FileIndex(entry, 2, filename)
+        self.assertEqual(index.refresh(self.dir),
+                         ['1970-01.txt', '1970-02.txt'])
+        self.assertEqual(loaded, ['1970-01.txt', '1970-02.txt'])
@@ -0,0 +1,142 @@
+""" Perform tests on the ledgerfiles.py
+"""
+
+import unittest
+import shutil
+import tempfile
+import sys
+import os
+
+# Ensure that we look for any modules in our local lib dir.  This allows simple
+# testing and development use.  It also does not break the case where the lib
+# has been installed properly on the normal sys.path
+sys.path.insert(0,
+                os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lib')
+                )
+# I would use site.addsitedir, but it does an append, not insert
+
+import ledgerfiles # noqa
+from ledgerdir import LedgerDir # noqa
+from rowset import RowSet # noqa
+
+
+class TestLedgerFiles(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self._write('1990-04.txt', "500 1990-04-03 #dues:test1\n")
+        self._write('1990-05.txt', "-300 1990-05-15 #bills:water\n")
+        self._write('1990-06.txt', "700 1990-06-02 #dues:test2\n")
+        self._write('notes.md', "not a ledger\n")
+        self.loaded = []
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _write(self, name, data):
+        with open(os.path.join(self.dir, name), 'w') as f:
+            f.write(data)
+
+    def _names(self):
+        return [os.path.basename(x) for x in ledgerfiles.find(self.dir)]
+
+    def _load(self, filename):
+        self.loaded.append(os.path.basename(filename))
+        rows = RowSet()
+        rows.load_file(filename)
+        return {
+            'total': rows.cents,
+            'opening_balance': rows.opening_balance,
+            'problems': [],
+        }
+
+    def test_compressed(self):
+        for suffix in ('.gz', '.bz2', '.xz'):
+            filename = os.path.join(self.dir, '1990-05.txt')
+            filename = ledgerfiles.compress(filename, suffix)
+            self.assertEqual(self._names(),
+                             ['1990-04.txt', '1990-05.txt' + suffix,
+                              '1990-06.txt'])
+
+            rows = RowSet()
+            rows.load_file(filename)
+            self.assertEqual(rows.cents, -30000)
+
+            with ledgerfiles.open_text(filename) as f:
+                self._write('1990-05.txt', f.read())
+            os.unlink(filename)
+
+    def test_find(self):
+        self.assertEqual(self._names(),
+                         ['1990-04.txt', '1990-05.txt', '1990-06.txt'])
+
+        # a month that is in the middle of being archived has both files
+        self._write('1990-04.txt.gz', 'half written')
+        self._write('1990-05.txt.zip', 'unknown')
+        self.assertEqual(self._names(),
+                         ['1990-04.txt', '1990-05.txt', '1990-06.txt'])
+        self.assertEqual(ledgerfiles.find(os.path.join(self.dir, 'nope')), [])
+
+    def test_archive(self):
+        got = ledgerfiles.archive(self.dir, (1990, 6), '.gz', self._load)
+        self.assertEqual(got, [
+            ('archived', '1990-04.txt.gz'),
+            ('archived', '1990-05.txt.gz'),
+        ])
+        self.assertEqual(self._names(),
+                         ['1990-04.txt.gz', '1990-05.txt.gz', '1990-06.txt'])
+
+        index = ledgerfiles.load_index(self.dir)
+        self.assertEqual(sorted(index), ['1990-04.txt.gz', '1990-05.txt.gz'])
+        self.assertEqual(index['1990-05.txt.gz']['total'], -30000)
+        self.assertEqual(index['1990-05.txt.gz']['closing_balance'], 20000)
+
+        # the archived files are not decompressed again while their digest
+        # is unchanged
+        self.loaded = []
+        self.assertEqual(
+            ledgerfiles.archive(self.dir, (1990, 6), '.gz', self._load), [])
+        self.assertEqual(self.loaded, ['1990-06.txt'])
+
+        filename = os.path.join(self.dir, '1990-04.txt.gz')
+        os.unlink(filename)
+        self._write('1990-04.txt', "400 1990-04-03 #dues:test1\n")
+        ledgerfiles.compress(os.path.join(self.dir, '1990-04.txt'))
+        self.assertEqual(
+            ledgerfiles.archive(self.dir, (1990, 6), '.gz', self._load),
+            [('changed', '1990-04.txt.gz')])
+        index = ledgerfiles.load_index(self.dir)
+        self.assertEqual(index['1990-05.txt.gz']['closing_balance'], 10000)
+
+    def test_archive_balance(self):
+        # the ledger starts from a balance carried over from elsewhere
+        self._write('1990-04.txt', "#balance 1000 opening balance\n"
+                                   "500 1990-04-03 #dues:test1\n"
+                                   "#balance 1500\n")
+        ledgerfiles.archive(self.dir, (1990, 6), '.gz', self._load)
+        index = ledgerfiles.load_index(self.dir)
+        self.assertEqual(index['1990-04.txt.gz']['opening_balance'], 100000)
+        self.assertEqual(index['1990-04.txt.gz']['closing_balance'], 150000)
+        self.assertEqual(index['1990-05.txt.gz']['opening_balance'], None)
+        self.assertEqual(index['1990-05.txt.gz']['closing_balance'], 120000)
+
+        # an index from before the opening balances were recorded has
+        # them filled in, without the files being shown as changed
+        for entry in index.values():
+            del entry['opening_balance']
+            entry['closing_balance'] = 0
+        ledgerfiles.save_index(self.dir, index)
+        self.assertEqual(
+            ledgerfiles.archive(self.dir, (1990, 6), '.gz', self._load), [])
+        index = ledgerfiles.load_index(self.dir)
+        self.assertEqual(index['1990-04.txt.gz']['opening_balance'], 100000)
+        self.assertEqual(index['1990-05.txt.gz']['closing_balance'], 120000)
+
+    def test_ledgerdir(self):
+        ledger = LedgerDir(self.dir)
+        self.assertEqual(ledger.rows().cents, 90000)
+
+        ledgerfiles.archive(self.dir, (1990, 6), '.xz', self._load)
+        self.assertEqual(ledger.refresh(), [
+            '1990-04.txt.xz', '1990-05.txt.xz', '1990-04.txt', '1990-05.txt',
+        ])
+        self.assertEqual(ledger.rows().cents, 90000)
@@ -0,0 +1,88 @@
+""" Perform tests on the ledgergen.py
+"""
+
+import unittest
+import datetime
+import shutil
+import tempfile
+import glob
+import sys
+import os
+
+# Ensure that we look for any modules in our local lib dir.  This allows simple
+# testing and development use.  It also does not break the case where the lib
+# has been installed properly on the normal sys.path
+sys.path.insert(0,
+                os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lib')
+                )
+# I would use site.addsitedir, but it does an append, not insert
+
+import ledgergen # noqa
+from rowset import RowSet # noqa
+
+
+class TestLedgerGen(unittest.TestCase):
+    def setUp(self):
+        self.gen = ledgergen.LedgerGenerator(
+            years=1,
+            rows_per_month=50,
+            tags=20,
+            months_fraction=0.2,
+            end=datetime.date(1990, 5, 4),
+        )
+
+    def test_render_cents(self):
+        self.assertEqual(ledgergen.render_cents(500), '5')
+        self.assertEqual(ledgergen.render_cents(-705), '-7.05')
+        self.assertEqual(ledgergen.render_cents(-5), '-0.05')
+
+    def test_month_range(self):
+        months = ledgergen.month_range(datetime.date(1990, 2, 4), 3)
+        self.assertEqual(months, [
+            datetime.date(1989, 12, 1),
+            datetime.date(1990, 1, 1),
+            datetime.date(1990, 2, 1),
+        ])
+
+    def test_deterministic(self):
+        files = list(self.gen.files())
+        self.assertEqual(list(self.gen.files()), files)
+        self.assertEqual(len(files), 12)
+        self.assertEqual(files[0][0], '1989-06.txt')
+        self.assertEqual(files[-1][0], '1990-05.txt')
+
+        self.gen.seed = 2
+        self.assertNotEqual(list(self.gen.files()), files)
+
+        # without an end, the ledger does not depend on today's date
+        gen = ledgergen.LedgerGenerator(years=1, rows_per_month=2)
+        self.assertEqual(next(gen.files())[0], '2024-01.txt')
+
+    def test_write(self):
+        dirname = tempfile.mkdtemp()
+        try:
+            self.assertEqual(self.gen.write(dirname), 600)
+
+            # each file must load, which also checks the balance pragmas
+            rows = RowSet()
+            for filename in sorted(glob.glob(os.path.join(dirname, '*'))):
+                this = RowSet()
+                this.load_file(filename)
+                rows.append(list(this))
+        finally:
+            shutil.rmtree(dirname)
+
+        self.assertEqual(len(rows), 600)
+        self.assertTrue(len(rows.group_by('hashtag')) <= 21)
+
+        bangs = len([x for x in rows if '!months' in x.comment])
+        self.assertTrue(60 < bangs < 180)
+
+        for month in rows.group_by('month').values():
+            self.assertTrue(month.filter(['hashtag==bills:rent']))
+            self.assertTrue(month.filter(['hashtag=~^dues:']))
+
+        # the splits never reach before the first month
+        split = rows.autosplit()
+        self.assertEqual(min(split.group_by('month')),
+                         datetime.date(1989, 6, 1))
@@ -0,0 +1,123 @@
+""" Perform tests on the lint.py
+"""
+
+import unittest
+import shutil
+import tempfile
+import sys
+import os
+
+# Ensure that we look for any modules in our local lib dir.  This allows simple
+# testing and development use.  It also does not break the case where the lib
+# has been installed properly on the normal sys.path
+sys.path.insert(0,
+                os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lib')
+                )
+# I would use site.addsitedir, but it does an append, not insert
+
+if sys.version_info[0] == 2:  # pragma: no cover
+    import mock
+else:
+    from unittest import mock  # pragma: no cover
+
+import lint # noqa
+import ledgerfiles # noqa
+
+
+class TestLint(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _write(self, name, data):
+        filename = os.path.join(self.dir, name)
+        with open(filename, 'w') as f:
+            f.write(data)
+        return filename
+
+    def _check(self, line):
+        try:
+            lint.check_row(line)
+        except ValueError as e:
+            return str(e)
+        return None
+
+    def test_check_row(self):
+        self.assertEqual(self._check('-1.50 1990-04-03 #bills:misc'), None)
+        self.assertEqual(self._check('5 1990-04-03 x !months:-1:2'), None)
+        self.assertEqual(self._check('5 1990-04-03 x !months:3'), None)
+
+        self.assertEqual(self._check('5 1990-04-03'),
+                         'expected a value, a date and a comment')
+        self.assertEqual(self._check('5.001 1990-04-03 x'),
+                         'bad value "5.001"')
+        self.assertEqual(self._check('5 1990-13-03 x'),
+                         'bad date "1990-13-03"')
+        self.assertEqual(self._check('5 1990-04-03 #a #b'),
+                         'more than one hashtag: #a #b')
+        self.assertEqual(self._check('5 1990-04-03 !months:1 !child'),
+                         'more than one bangtag: !months:1 !child')
+        self.assertEqual(self._check('5 1990-04-03 !child'),
+                         'unknown bangtag "!child"')
+        self.assertEqual(self._check('5 1990-04-03 !months:1:x'),
+                         'bangtag "!months:1:x" should be !months:count or '
+                         '!months:start:count')
+        self.assertEqual(self._check('5 1990-04-03 !months:2:0'),
+                         'bangtag "!months:2:0" splits into no months')
+
+    def test_lint(self):
+        good = self._write('1990-04.txt',
+                           "#balance 10 opening\n"
+                           "\n"
+                           "# a comment\n"
+                           "5 1990-04-03 #dues:test1\n"
+                           "#balance 15\n")
+        self.assertEqual(lint.lint_file(good), [])
+
+        bad = self._write('1990-05.txt',
+                          "#balance\n"
+                          "5 1990-05-03 #a #b\n"
+                          "#balance 1.2.3\n"
+                          "#balance 6\n")
+        self.assertEqual(lint.lint_file(bad), [
+            bad + ':1: bad #balance pragma',
+            bad + ':2: more than one hashtag: #a #b',
+            bad + ':3: bad #balance value "1.2.3"',
+            bad + ':4: failed to balance, the rows add up to 0',
+        ])
+
+        for jobs in (1, 2):
+            self.assertEqual(lint.lint(self.dir, jobs),
+                             (2, lint.lint_file(bad)))
+
+    def test_archived(self):
+        self._write('1990-04.txt', "5 1990-04-03 #a #b\n")
+        self._write('1990-05.txt', "5 1990-05-03 #a #b\n")
+
+        def load(filename):
+            return {'total': 500, 'opening_balance': None,
+                    'problems': lint.file_problems(filename)}
+
+        ledgerfiles.archive(self.dir, (1990, 5), '.gz', load)
+        archived = os.path.join(self.dir, '1990-04.txt.gz')
+        expected = [
+            archived + ':1: more than one hashtag: #a #b',
+            os.path.join(self.dir, '1990-05.txt') +
+            ':1: more than one hashtag: #a #b',
+        ]
+
+        # the unchanged archived file is not decompressed again
+        with mock.patch.object(ledgerfiles, 'open_text',
+                               wraps=ledgerfiles.open_text) as opened:
+            self.assertEqual(lint.lint(self.dir, 1), (2, expected))
+            self.assertEqual(
+                [os.path.basename(x[0][0]) for x in opened.call_args_list],
+                ['1990-05.txt'])
+
+        # but a changed one is
+        os.unlink(archived)
+        self._write('1990-04.txt', "5 1990-04-03 #a\n")
+        ledgerfiles.compress(os.path.join(self.dir, '1990-04.txt'))
+        self.assertEqual(lint.lint(self.dir, 1), (2, expected[1:]))
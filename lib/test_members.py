@@ -0,0 +1,107 @@
+""" Perform tests on the members.py
+"""
+
+import unittest
+import datetime
+import decimal
+import sys
+import os
+
+# Ensure that we look for any modules in our local lib dir.  This allows simple
+# testing and development use.  It also does not break the case where the lib
+# has been installed properly on the normal sys.path
+sys.path.insert(0,
+                os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lib')
+                )
+# I would use site.addsitedir, but it does an append, not insert
+
+import members # noqa
+from row import Row # noqa
+
+D = decimal.Decimal
+
+
+class TestMembers(unittest.TestCase):
+    def setUp(self):
+        self.rows = [
+            Row('10', '1990-01-05', 'dues #dues:test1'),
+            Row('10', '1990-02-04', 'dues #dues:test1'),
+            Row('5', '1990-02-20', 'more dues #dues:test1'),
+            Row('10', '1990-04-01', 'dues #dues:test1'),
+            Row('0', '1990-03-01', 'owed money instead #dues:test2'),
+            Row('-10', '1990-04-01', 'refund #dues:test3'),
+            Row('-100', '1990-04-01', 'rent #rent'),
+            Row('20', '1990-04-01', 'no tag'),
+        ]
+
+    def test_handle_key(self):
+        self.assertEqual(members.handle_key(' #dues:Test1'), 'test1')
+        self.assertEqual(members.handle_key('test1'), 'test1')
+
+    def test_matrix(self):
+        self.assertEqual(members.matrix(self.rows), {
+            'test1': {
+                datetime.date(1990, 1, 1): 1000,
+                datetime.date(1990, 2, 1): 1500,
+                datetime.date(1990, 4, 1): 1000,
+            },
+            'test2': {
+                datetime.date(1990, 3, 1): 0,
+            },
+        })
+
+    def test_streak(self):
+        paid = {
+            datetime.date(1989, 12, 1): 1,
+            datetime.date(1990, 1, 1): 1,
+            datetime.date(1990, 3, 1): 1,
+        }
+        self.assertEqual(members.streak(paid, datetime.date(1990, 1, 1)), 2)
+        self.assertEqual(members.streak(paid, datetime.date(1990, 3, 1)), 1)
+        self.assertEqual(members.streak(paid, datetime.date(1990, 2, 1)), 0)
+
+    def test_load_door(self):
+        door = members.load_door([
+            'name,hashtag,last_login',
+            'a,Test1,1990-03-02 10:00:00',
+            'a,test1,1990-01-02 10:00:00',
+            'b,,1990-03-02 10:00:00',
+            'c,dues:test4,',
+        ])
+        self.assertEqual(door, {'test1': '1990-03', 'test4': ''})
+
+        with self.assertRaises(ValueError):
+            members.load_door(['name,hashtag'])
+
+    def test_table(self):
+        header, lines = members.table(self.rows, datetime.date(1990, 4, 10))
+        self.assertEqual(header, [
+            'handle', 'month_last_paid', 'streak', 'status',
+            '1990-01', '1990-02', '1990-03', '1990-04',
+        ])
+        self.assertEqual(lines, [
+            ['test1', '1990-04', 1, 'paid', D('10'), D('15'), '', D('10')],
+            ['test2', '1990-03', 1, 'lapsed', '', '', D('0'), ''],
+        ])
+
+    def test_table_door(self):
+        door = {'test1': '1990-03', 'test4': '1990-02'}
+        header, lines = members.table(
+            self.rows[:3], datetime.date(1990, 4, 10), door)
+        self.assertEqual(header, [
+            'handle', 'month_last_paid', 'streak', 'status', 'last_seen',
+            '1990-01', '1990-02',
+        ])
+        self.assertEqual(lines, [
+            ['test1', '1990-02', 2, 'lapsed', '1990-03', D('10'), D('15')],
+            ['test4', '', 0, 'unpaid', '1990-02', '', ''],
+        ])
+
+    def test_table_empty(self):
+        header, lines = members.table([], datetime.date(1990, 4, 10))
+        self.assertEqual(header[-1], 'status')
+        self.assertEqual(lines, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
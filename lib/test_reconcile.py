@@ -0,0 +1,110 @@
+""" Perform tests on the reconcile.py
+"""
+
+import unittest
+import datetime
+import sys
+import os
+
+try:
+    # python 2
+    from StringIO import StringIO
+except ImportError:
+    # python 3
+    from io import StringIO
+
+# Ensure that we look for any modules in our local lib dir.  This allows simple
+# testing and development use.  It also does not break the case where the lib
+# has been installed properly on the normal sys.path
+sys.path.insert(0,
+                os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lib')
+                )
+# I would use site.addsitedir, but it does an append, not insert
+
+import reconcile # noqa
+from row import Row # noqa
+
+
+def _line(cents, date, line):
+    return reconcile.StatementLine(
+        cents, datetime.date(*date), 'line{}'.format(line), line)
+
+
+class TestReconcile(unittest.TestCase):
+    def test_parse_amount(self):
+        self.assertEqual(reconcile.parse_amount('12.50'), 1250)
+        self.assertEqual(reconcile.parse_amount(' -7 '), -700)
+        self.assertEqual(reconcile.parse_amount('$1,234.56'), 123456)
+        self.assertEqual(reconcile.parse_amount('(20.00)'), -2000)
+
+    def test_load_statement(self):
+        lines = reconcile.load_statement(StringIO(
+            "Date,Description,Amount\n"
+            "2018-11-01,From Alice,500\n"
+            "2018-11-02,\"Fee, monthly\",-1.50\n"
+        ))
+        self.assertEqual(lines, [
+            (50000, datetime.date(2018, 11, 1), 'From Alice', 2),
+            (-150, datetime.date(2018, 11, 2), 'Fee, monthly', 3),
+        ])
+
+        lines = reconcile.load_statement(
+            StringIO("When,What\n02/11/2018,10\n"),
+            date_column='When', amount_column='What',
+            date_format='%d/%m/%Y')
+        self.assertEqual(lines[0].date, datetime.date(2018, 11, 2))
+        self.assertEqual(lines[0].description, '')
+
+        with self.assertRaises(ValueError):
+            reconcile.load_statement(StringIO("Date,Value\n"))
+        with self.assertRaises(ValueError):
+            reconcile.load_statement(StringIO("Date,Amount\nsoon,1\n"))
+
+    def test_reconcile(self):
+        rows = [
+            Row('500', '2018-11-01', 'Alice'),
+            Row('500', '2018-11-20', 'Bob'),
+            Row('-12', '2018-11-03', 'only in the ledger'),
+            Row('700', '2018-11-10', 'Carol'),
+            Row('700', '2018-11-11', 'Dave'),
+            Row('700', '2018-11-12', 'Erin'),
+        ]
+        lines = [
+            _line(50000, (2018, 11, 3), 2),
+            _line(50000, (2018, 11, 19), 3),
+            _line(70000, (2018, 11, 11), 4),
+            _line(70000, (2018, 11, 12), 5),
+            _line(99, (2018, 11, 1), 6),
+            _line(-1200, (2018, 11, 9), 7),
+        ]
+        result = reconcile.reconcile(rows, lines, days=3)
+        self.assertEqual(
+            [(str(a), b.line) for a, b in result['matched']],
+            [('500 2018-11-01 Alice', 2), ('500 2018-11-20 Bob', 3)])
+        self.assertEqual([str(x) for x in result['unmatched_rows']],
+                         ['-12 2018-11-03 only in the ledger'])
+        self.assertEqual([x.line for x in result['unmatched_lines']], [6, 7])
+        self.assertEqual(len(result['ambiguous_rows']), 3)
+        self.assertEqual([x.line for x in result['ambiguous_lines']], [4, 5])
+
+        # a wider window reaches the ledger only row
+        result = reconcile.reconcile(rows, lines, days=6)
+        self.assertEqual(result['unmatched_rows'], [])
+        self.assertEqual(len(result['matched']), 3)
+
+    def test_chain(self):
+        # each row only reaches its neighbouring lines, but they all end up
+        # in one group, which pairs up in date order
+        rows = [Row('5', '2018-11-{:02}'.format(x), 'r') for x in (1, 5, 9)]
+        lines = [_line(500, (2018, 11, x), x) for x in (3, 7, 11)]
+        result = reconcile.reconcile(rows, lines, days=2)
+        self.assertEqual(
+            [(a.date.day, b.line) for a, b in result['matched']],
+            [(1, 3), (5, 7), (9, 11)])
+
+        # here the first row reaches no line, which leaves it unmatched on
+        # its own without upsetting the pairs after it
+        lines = [_line(500, (2018, 11, x), x) for x in (6, 10)]
+        result = reconcile.reconcile(rows, lines, days=2)
+        self.assertEqual([x.date.day for x in result['unmatched_rows']], [1])
+        self.assertEqual(len(result['matched']), 2)
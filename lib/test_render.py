@@ -0,0 +1,47 @@
+""" Perform tests on the render.py
+"""
+
+import unittest
+import datetime
+import sys
+import os
+
+# Ensure that we look for any modules in our local lib dir.  This allows simple
+# testing and development use.  It also does not break the case where the lib
+# has been installed properly on the normal sys.path
+sys.path.insert(0,
+                os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lib')
+                )
+# I would use site.addsitedir, but it does an append, not insert
+
+import render # noqa
+
+
+class TestRender(unittest.TestCase):
+    def test_render_month(self):
+        self.assertEqual(render.render_month(datetime.date(1990, 4, 3)),
+                         '1990-04')
+        self.assertEqual(render.render_month('Total'), 'Total')
+
+    def test_topay_render(self):
+        april = datetime.date(1990, 4, 1)
+        strings = {
+            'header': '{date}',
+            'table_start': '<',
+            'table_end': '>',
+            'table_row': '{hashtag} {price} {date}',
+        }
+        got = render.topay_render(
+            ['bills:rent', 'bills:water'],
+            [april],
+            {april: {'bills:rent': (-100, datetime.date(1990, 4, 15))}},
+            strings,
+        )
+        self.assertEqual(got.split('\n'), [
+            '1990-04',
+            '<',
+            'Bills:rent -100 1990-04-15',
+            'Bills:water $0 Not Yet',
+            '>',
+            '',
+        ])
@@ -0,0 +1,70 @@
+""" Perform tests on the resultcache.py
+"""
+
+import unittest
+import shutil
+import tempfile
+import sys
+import os
+
+# Ensure that we look for any modules in our local lib dir.  This allows simple
+# testing and development use.  It also does not break the case where the lib
+# has been installed properly on the normal sys.path
+sys.path.insert(0,
+                os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lib')
+                )
+# I would use site.addsitedir, but it does an append, not insert
+
+import resultcache # noqa
+
+
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cache = resultcache.ResultCache(
+            os.path.join(self.dir, 'cache'), max_size=10)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _age(self, key, mtime):
+        os.utime(self.cache._filename(key), (mtime, mtime))
+
+    def test_get_put(self):
+        self.assertEqual(self.cache.get('a'), None)
+        self.cache.put('a', u'hello')
+        self.assertEqual(self.cache.get('a'), u'hello')
+
+        # too big to ever fit
+        self.cache.put('b', u'x' * 11)
+        self.assertEqual(self.cache.get('b'), None)
+
+    def test_evict(self):
+        self.cache.put('a', u'1234')
+        self._age('a', 1000)
+        self.cache.put('b', u'1234')
+        self._age('b', 2000)
+
+        # using an entry makes it the most recently used
+        self.cache.get('a')
+
+        self.cache.put('c', u'1234')
+        self.assertEqual(self.cache.get('b'), None)
+        self.assertEqual(self.cache.get('a'), u'1234')
+        self.assertEqual(self.cache.get('c'), u'1234')
+
+    def test_hash_files(self):
+        names = []
+        for name, data in (('a.txt', 'one'), ('b.txt', 'two')):
+            names.append(os.path.join(self.dir, name))
+            with open(names[-1], 'w') as f:
+                f.write(data)
+
+        before = resultcache.hash_files(names)
+        stats = resultcache.hash_stats(names)
+        self.assertEqual(resultcache.hash_files(names), before)
+
+        with open(names[1], 'w') as f:
+            f.write('three')
+        self.assertNotEqual(resultcache.hash_files(names), before)
+        self.assertNotEqual(resultcache.hash_stats(names), stats)
@@ -0,0 +1,129 @@
+""" Perform tests on the rollup.py
+"""
+
+import unittest
+import datetime
+import shutil
+import tempfile
+import sys
+import os
+
+# Ensure that we look for any modules in our local lib dir.  This allows simple
+# testing and development use.  It also does not break the case where the lib
+# has been installed properly on the normal sys.path
+sys.path.insert(0,
+                os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lib')
+                )
+# I would use site.addsitedir, but it does an append, not insert
+
+import rollup # noqa
+import render # noqa
+from ledger import Ledger # noqa
+
+
+class TestRollup(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.rollups = os.path.join(self.dir, 'rollups')
+        self._write('1989-12.txt',
+                    "20000 1989-12-01 opening balance\n"
+                    "500 1989-12-03 #dues:test1\n"
+                    "500.50 1989-12-04 #dues:test2\n"
+                    "-12500 1989-12-15 #bills:rent\n"
+                    "0.00 1989-12-15 #bills:water\n"
+                    "-300 1989-12-20 #bills:water !months:3\n")
+        self._write('1990-01.txt',
+                    "700 1990-01-02 #dues:test2\n"
+                    "-12500 1990-01-15 #bills:rent\n")
+        self._write('1990-02.txt', "500 1990-02-03 #dues:test1\n")
+        self._write('extra.txt', "-1.20 1990-02-10 #bills:misc\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _write(self, name, data):
+        with open(os.path.join(self.dir, name), 'w') as f:
+            f.write(data)
+
+    def test_cells(self):
+        ledger = Ledger(self.dir)
+        cells = rollup.cells(ledger.rows(split=False))
+        self.assertEqual(cells[:3], [
+            [None, 2000000, 1, 0, '1989-12-01'],
+            ['dues:test1', 50000, 1, 0, '1989-12-03'],
+            ['dues:test2', 50050, 1, -2, '1989-12-04'],
+        ])
+        # the zero and negative values of a tag are kept apart
+        self.assertEqual(cells[4:6], [
+            ['bills:water', 0, 1, -2, '1989-12-15'],
+            ['bills:water', -30000, 1, 0, '1989-12-20'],
+        ])
+
+    def test_update(self):
+        self.assertEqual(rollup.update(self.dir, self.rollups, 1991),
+                         [('wrote', 1989), ('wrote', 1990)])
+        self.assertEqual(rollup.update(self.dir, self.rollups, 1991),
+                         [('unchanged', 1989), ('unchanged', 1990)])
+
+        got = rollup.load(self.rollups, 1990)
+        self.assertEqual(sorted(got['files']), ['1990-01.txt', '1990-02.txt'])
+        self.assertEqual(got['total'], -1130000)
+        self.assertEqual(got['closing_balance'], -309950)
+
+        # the closing balances follow a change to an earlier year
+        self._write('1989-12.txt', "30000 1989-12-01 opening balance\n")
+        self.assertEqual(rollup.update(self.dir, self.rollups, 1990),
+                         [('wrote', 1989)])
+        self.assertEqual(rollup.update(self.dir, self.rollups, 1991),
+                         [('unchanged', 1989), ('wrote', 1990)])
+        got = rollup.load(self.rollups, 1990)
+        self.assertEqual(got['closing_balance'], 1870000)
+
+    def test_update_balance(self):
+        # after a gap in the files, 1990 starts again from its own balance
+        self._write('1990-01.txt',
+                    "#balance 1000 opening balance\n"
+                    "700 1990-01-02 #dues:test2\n"
+                    "#balance 1700\n")
+        self.assertEqual(rollup.update(self.dir, self.rollups, 1991),
+                         [('wrote', 1989), ('wrote', 1990)])
+        got = rollup.load(self.rollups, 1990)
+        self.assertEqual(got['total'], 120000)
+        self.assertEqual(got['closing_balance'], 220000)
+
+        # and so does not follow a change to an earlier year
+        self._write('1989-12.txt', "30000 1989-12-01 opening balance\n")
+        self.assertEqual(rollup.update(self.dir, self.rollups, 1991),
+                         [('wrote', 1989), ('unchanged', 1990)])
+
+    def test_reports(self):
+        rollup.update(self.dir, self.rollups, 1991)
+        ledger = Ledger(self.dir)
+
+        for split in (True, False):
+            rows = rollup.rows(self.dir, self.rollups, split)
+            # the raw rows of the file not named after a month remain
+            self.assertEqual(len(rows), 12 if split else 10)
+            self.assertEqual(rows[-1].comment, '#bills:misc')
+
+            for engine in ('python', 'numpy'):
+                cells = Ledger.from_rows(rows, engine)
+                self.assertEqual(cells.sum(), ledger.sum(split))
+                self.assertEqual(cells.grid(separate_inout=True),
+                                 ledger.grid(split, separate_inout=True))
+                self.assertEqual(cells.topay(), ledger.topay(split))
+                self.assertEqual(list(cells.payments().items()),
+                                 list(ledger.payments(split).items()))
+                self.assertEqual(
+                    render.statstsv_render(*cells.stats()),
+                    render.statstsv_render(*ledger.stats(split)))
+
+    def test_changed(self):
+        rollup.update(self.dir, self.rollups, 1991)
+        self.assertEqual(len(rollup.rows(self.dir, self.rollups)), 12)
+
+        # a year with a changed file is loaded from its files again
+        self._write('1990-03.txt', "500 1990-03-03 #dues:test1\n")
+        rows = rollup.rows(self.dir, self.rollups)
+        self.assertEqual(len(rows), 13)
+        self.assertEqual(rows[-2].date, datetime.date(1990, 3, 3))
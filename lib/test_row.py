@@ -4,6 +4,8 @@
 
 import unittest
 import datetime
+import decimal
+import pickle
 import sys
 import os
 if sys.version_info[0] == 2:  # pragma: no cover
@@ -60,6 +62,33 @@ class TestRowClass(unittest.TestCase):
         self.assertEqual(obj.value, -100)
         self.assertEqual(obj.direction, 'outgoing')
 
+    def test_cents(self):
+        self.assertEqual(self.rows[1].cents, -10000)
+        self.assertEqual(balance.Row("-7.20", "1970-01-01", "").cents, -720)
+        self.assertEqual(balance.Row("0.5", "1970-01-01", "").cents, 50)
+        self.assertEqual(balance.Row("1e2", "1970-01-01", "").cents, 10000)
+
+        # the value is rendered the same way it was written
+        self.assertEqual(str(balance.Row("-7.20", "1970-01-01", "").value),
+                         '-7.20')
+        self.assertEqual(str(balance.Row("10.00", "1970-01-01", "").value),
+                         '10.00')
+        self.assertEqual(str(balance.Row(".5", "1970-01-01", "").value),
+                         '0.5')
+
+        # there is no cash smaller than a cent
+        with self.assertRaises(ValueError):
+            balance.Row("0.001", "1970-01-01", "")
+        with self.assertRaises(decimal.InvalidOperation):
+            balance.Row("ten", "1970-01-01", "")
+
+    def test_from_cents(self):
+        self.assertEqual(str(balance.from_cents(-720)), '-7.2')
+        self.assertEqual(str(balance.from_cents(-720, -2)), '-7.20')
+        self.assertEqual(str(balance.from_cents(-700, -2)), '-7.00')
+        self.assertEqual(str(balance.from_cents(-700)), '-7')
+        self.assertEqual(str(balance.from_cents(-750, 0)), '-7.5')
+
     def test_addnum(self):
         self.assertEqual(self.rows[0]+10, 110)
 
@@ -80,6 +109,24 @@ class TestRowClass(unittest.TestCase):
         with self.assertRaises(ValueError):
             balance.Row("100", "1970-01-01", "#two #hashtags")
 
+    def test_immutable(self):
+        row = self.rows[3]
+        with self.assertRaises(AttributeError):
+            row.hashtag = 'other'
+        self.assertFalse(hasattr(row, '__dict__'))
+
+        # a changed row is a new row
+        other = row._replace(hashtag='other')
+        self.assertEqual(other.hashtag, 'other')
+        self.assertEqual(row.hashtag, 'hashtag')
+
+    def test_pickle(self):
+        row = balance.Row("-7.20", "1970-01-01", "a #hashtag")
+        got = pickle.loads(pickle.dumps(row))
+        self.assertEqual(got, row)
+        self.assertEqual(str(got.value), '-7.20')
+        self.assertEqual(got.hashtag, 'hashtag')
+
     def test_bangtag(self):
         self.assertEqual(self.rows[0].bangtag(), None)
 
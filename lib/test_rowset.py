@@ -138,6 +138,11 @@ class TestRowSet(unittest.TestCase):
             ]
         )
 
+        # a label function can be used instead of a field
+        groups = self.rows.group_by(lambda row: row.direction)
+        self.assertEqual(sorted(groups.keys()), ['incoming', 'outgoing'])
+        self.assertEqual(groups['incoming'].value, 10)
+
     def test_save_file(self):
         expect = [
             '-10 1970-02-06 comment4',
@@ -0,0 +1,148 @@
+""" Perform tests on the server.py
+"""
+
+import unittest
+import argparse
+import threading
+import shutil
+import tempfile
+import sys
+import os
+
+try:
+    # python 2
+    from urllib2 import urlopen, Request, HTTPError
+except ImportError:
+    # python 3
+    from urllib.request import urlopen, Request
+    from urllib.error import HTTPError
+
+# Ensure that we look for any modules in our local lib dir.  This allows simple
+# testing and development use.  It also does not break the case where the lib
+# has been installed properly on the normal sys.path
+sys.path.insert(0,
+                os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lib')
+                )
+# I would use site.addsitedir, but it does an append, not insert
+
+import server # noqa
+import ledgerdir # noqa
+import binledger # noqa
+
+
+def subp_sum(args):
+    return str(args.rows.value)
+
+
+def subp_total(args):
+    # a sub-command run on the columns, like the real sum sub-command
+    return str(args.ledger.sum(args.split, args.filter))
+
+
+def subp_tags(args):
+    # label the rows, like the real grid sub-command does
+    return ' '.join(sorted(
+        '{} {}'.format(row.hashtag, args.suffix) for row in args.rows
+    ))
+
+
+def parse_args(argv):
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument('--filter', action='append')
+    argparser.add_argument('--nosplit', dest='split', action='store_false')
+    argparser.add_argument('--engine', default='python')
+    subp = argparser.add_subparsers(dest='cmd')
+    subp.add_parser('sum')
+    subp.add_parser('total')
+    tags = subp.add_parser('tags')
+    tags.add_argument('--suffix', default='x')
+    return argparser.parse_args(argv)
+
+
+class TestServer(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        with open(os.path.join(self.dir, '1970-01.txt'), 'w') as f:
+            f.write("10 1970-01-05 #a\n-3 1970-01-06 #b !months:3\n")
+
+        commands = {
+            'sum': {'func': subp_sum},
+            'tags': {'func': subp_tags},
+            'total': {'func': subp_total, 'pushdown': True},
+        }
+        self.server = server.ReportServer(
+            ('127.0.0.1', 0), ledgerdir.LedgerDir(self.dir), commands,
+            parse_args
+        )
+        self.url = 'http://127.0.0.1:{}'.format(self.server.server_port)
+
+    def tearDown(self):
+        self.server.server_close()
+        shutil.rmtree(self.dir)
+
+    def _get(self, path, headers={}):
+        thread = threading.Thread(target=self.server.handle_request)
+        thread.start()
+        try:
+            f = urlopen(Request(self.url + path, headers=headers))
+            result = (f.getcode(), f.read().decode('utf-8'),
+                      f.info().get('ETag'))
+        except HTTPError as e:
+            result = (e.code, None, None)
+        thread.join()
+        return result
+
+    def test_query_to_argv(self):
+        self.assertEqual(
+            server.query_to_argv('grid', [
+                ('filter', 'value>0'),
+                ('separate_inout', ''),
+                ('nosplit', ''),
+                ('filter_hack', '410'),
+            ]),
+            ['--filter', 'value>0', '--nosplit', 'grid',
+             '--separate_inout', '--filter_hack', '410']
+        )
+
+    def test_get(self):
+        self.assertEqual(self._get('/sum')[:2], (200, "7\n"))
+        self.assertEqual(self._get('/sum?filter=value<0')[:2], (200, "-3\n"))
+        self.assertEqual(self._get('/nothere')[0], 404)
+        self.assertEqual(self._get('/sum?bad=arg')[0], 400)
+
+    def test_etag(self):
+        code, body, etag = self._get('/sum')
+        self.assertEqual(self._get('/sum', {'If-None-Match': etag})[0], 304)
+
+        # a different request has a different etag
+        self.assertNotEqual(self._get('/sum?nosplit')[2], etag)
+
+        # as does the same request after the ledger changes
+        with open(os.path.join(self.dir, '1970-02.txt'), 'w') as f:
+            f.write("1 1970-02-05 #a\n")
+        code, body, etag2 = self._get('/sum', {'If-None-Match': etag})
+        self.assertEqual((code, body), (200, "8\n"))
+        self.assertNotEqual(etag, etag2)
+
+    def test_cmd_args(self):
+        self.assertEqual(self._get('/tags?nosplit')[1], "a x b x\n")
+        self.assertEqual(self._get('/tags?nosplit&suffix=y')[1], "a y b y\n")
+
+    def test_pushdown(self):
+        class ColumnSnapshot(object):
+            # like a SharedSnapshot, but with no rows to give
+            def __init__(self, rows):
+                self.ledger = binledger.BinLedger.from_buffer(
+                    binledger.encode(rows) + bytearray(100))
+
+            def rows(self, split=True, filters=None):
+                raise AssertionError('rows built')
+
+        self.server.ledger.refresh()
+        snapshot = ColumnSnapshot(self.server.ledger.snapshot.rows(False))
+        self.assertEqual(self.server.run('total', [], snapshot), '7')
+        self.assertEqual(self.server.run(
+            'total', [('filter', 'value<0'), ('nosplit', '')], snapshot), '-3')
+        with self.assertRaises(AssertionError):
+            self.server.run('sum', [], snapshot)
+        snapshot.ledger.close()
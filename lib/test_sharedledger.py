@@ -0,0 +1,115 @@
+""" Perform tests on the sharedledger.py
+"""
+
+import multiprocessing
+import unittest
+import sys
+import os
+
+try:
+    # python 2
+    from StringIO import StringIO
+except ImportError:
+    # python 3
+    from io import StringIO
+
+# Ensure that we look for any modules in our local lib dir.  This allows simple
+# testing and development use.  It also does not break the case where the lib
+# has been installed properly on the normal sys.path
+sys.path.insert(0,
+                os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lib')
+                )
+# I would use site.addsitedir, but it does an append, not insert
+
+from rowset import RowSet # noqa
+
+try:
+    import sharedledger
+except ImportError:  # pragma: no cover
+    sharedledger = None
+
+
+def _load(data):
+    rows = RowSet()
+    rows.load_file(StringIO(data))
+    return rows
+
+
+def _worker(name, queue):
+    reader = sharedledger.SharedLedgerReader(name)
+    snapshot = reader.snapshot
+    queue.put((
+        snapshot.version,
+        str(snapshot.ledger.value()),
+        [str(x) for x in snapshot.rows(True, ['hashtag=~^water'])],
+    ))
+    snapshot.close()
+    reader.close()
+
+
+@unittest.skipIf(sharedledger is None, 'needs multiprocessing.shared_memory')
+class TestSharedLedger(unittest.TestCase):
+    def setUp(self):
+        self.rows = _load("""
+10 1970-01-05 comment1
+-10 1970-01-10 comment2 #rent
+-15 1970-01-11 comment6 #water !months:3
+""")
+        self.shared = sharedledger.SharedLedger()
+
+    def tearDown(self):
+        self.shared.close()
+
+    def test_no_version(self):
+        with self.assertRaises(ValueError):
+            sharedledger.SharedLedgerReader(self.shared.name)
+
+    def test_reader(self):
+        self.assertEqual(self.shared.publish(self.rows, 'abc'), 1)
+        reader = sharedledger.SharedLedgerReader(self.shared.name)
+        self.assertEqual(reader.version, 1)
+        self.assertEqual(reader.digest, 'abc')
+        self.assertEqual(reader.refresh(), False)
+        self.assertEqual([str(x) for x in reader.rows(False)],
+                         [str(x) for x in self.rows])
+        self.assertEqual(len(reader.rows(True, ['hashtag==water'])), 3)
+
+        # each new version replaces the snapshot, while anyone still holding
+        # the old one can carry on using it
+        old = reader.snapshot
+        self.shared.publish(_load("5 1970-02-01 #dues:test1\n"), 'def')
+        self.assertEqual(reader.refresh(), True)
+        self.assertEqual(reader.digest, 'def')
+        self.assertEqual(reader.rows(False)[0].hashtag, 'dues:test1')
+        self.assertEqual(str(old.ledger.value()), '-15')
+
+        # the segment of the first version is unlinked by the third, but
+        # is still mapped by the old snapshot
+        name = old.segment.name
+        self.shared.publish(self.rows)
+        with self.assertRaises(OSError):
+            sharedledger._attach(name)
+        self.assertEqual(len(old.rows(False)), 3)
+
+        self.assertEqual(reader.refresh(), True)
+        self.assertEqual(reader.version, 3)
+        old.close()
+        reader.close()
+
+    def test_worker(self):
+        self.shared.publish(self.rows)
+        queue = multiprocessing.Queue()
+        worker = multiprocessing.Process(
+            target=_worker, args=(self.shared.name, queue))
+        worker.start()
+        version, value, rows = queue.get(timeout=30)
+        worker.join()
+
+        self.assertEqual(worker.exitcode, 0)
+        self.assertEqual(version, 1)
+        self.assertEqual(value, '-15')
+        self.assertEqual(rows, [
+            '-5 1970-01-11 comment6 #water !months:3 !child',
+            '-5 1970-02-11 comment6 #water !months:3 !child',
+            '-5 1970-03-11 comment6 #water !months:3 !child',
+        ])
@@ -0,0 +1,199 @@
+""" Perform tests on the sqlstore.py
+"""
+
+import unittest
+import datetime
+import shutil
+import tempfile
+import sys
+import os
+
+# Ensure that we look for any modules in our local lib dir.  This allows simple
+# testing and development use.  It also does not break the case where the lib
+# has been installed properly on the normal sys.path
+sys.path.insert(0,
+                os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lib')
+                )
+# I would use site.addsitedir, but it does an append, not insert
+
+import sqlstore # noqa
+
+
+FILE1 = """
+#balance 0
+-10 1970-02-06 comment4
+10 1970-01-05 comment1
+-10 1970-01-10 comment2 #rent
+-10 1970-01-01 comment3 #water
+-10 1970-03-01 comment5 #rent
+-15 1970-01-11 comment6 #water !months:3
+#balance -45 A comment
+"""
+
+FILE2 = """
+100 1970-04-01 #dues:test1
+-0.5 1970-04-02 comment7
+"""
+
+
+class TestSqlStore(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self._write('1970-01.txt', FILE1)
+        self._write('1970-04.txt', FILE2)
+
+        self.store = sqlstore.SqlStore()
+        self.changed = self.store.refresh(self.dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+        self.store = None
+
+    def _write(self, name, data):
+        with open(os.path.join(self.dir, name), 'w') as f:
+            f.write(data)
+
+    def test_refresh(self):
+        self.assertEqual(self.changed, ['1970-01.txt', '1970-04.txt'])
+
+        # nothing has changed, so nothing is reloaded
+        self.assertEqual(self.store.refresh(self.dir), [])
+
+        self._write('1970-04.txt', FILE2 + "1 1970-04-03 comment8\n")
+        self.assertEqual(self.store.refresh(self.dir), ['1970-04.txt'])
+        self.assertEqual(str(self.store.value()), '55.5')
+
+        os.unlink(os.path.join(self.dir, '1970-04.txt'))
+        self.assertEqual(self.store.refresh(self.dir), ['1970-04.txt'])
+        self.assertEqual(self.store.value(), -45)
+
+    def test_rowset(self):
+        rows = self.store.rowset(split=False)
+        self.assertEqual(len(rows), 8)
+        self.assertEqual(str(rows[0]), '-10 1970-02-06 comment4')
+
+        rows = self.store.rowset(split=True)
+        self.assertEqual(len(rows), 10)
+        self.assertEqual(
+            [str(row) for row in rows[5:8]],
+            [
+                '-5 1970-01-11 comment6 #water !months:3 !child',
+                '-5 1970-02-11 comment6 #water !months:3 !child',
+                '-5 1970-03-11 comment6 #water !months:3 !child',
+            ]
+        )
+
+    def test_compile_filter(self):
+        self.assertEqual(
+            sqlstore.compile_filter('value>-10'),
+            ('cents > ?', [-1000.0])
+        )
+        self.assertEqual(
+            sqlstore.compile_filter('hashtag=~^dues:'),
+            ("regexp(?, COALESCE(hashtag, 'None'))", ['^dues:'])
+        )
+        self.assertEqual(
+            sqlstore.compile_filter('month!=1970-01'),
+            ('month != ?', ['1970-01'])
+        )
+
+        # things that cannot be exactly represented are left for python
+        self.assertEqual(sqlstore.compile_filter('comment=~10'), None)
+        self.assertEqual(sqlstore.compile_filter('bangtag==foo'), None)
+        self.assertEqual(sqlstore.compile_filter('value<=10'), None)
+
+    def test_filter(self):
+        filters = [
+            ['hashtag==None'],
+            ['value<0', 'month==1970-01'],
+            ['hashtag=~^w', 'comment!~t6'],
+            ['direction==incoming'],
+            ['date>1970-01-09', 'date<1970-03-01'],
+            ['hashtag!=5'],
+            ['rel_months<0'],
+        ]
+        for split in (True, False):
+            rows = self.store.rowset(split)
+            for f in filters:
+                self.assertEqual(
+                    [str(x) for x in self.store.rowset(split, f)],
+                    [str(x) for x in rows.filter(f)],
+                )
+                # including the number of decimal places
+                self.assertEqual(
+                    str(self.store.value(split, f)),
+                    str(rows.filter(f).value),
+                )
+
+    def test_filter_value(self):
+        # 7.2 is not exactly a float, but 0.5 is
+        self._write('1970-05.txt', "7.20 1970-05-01 a #fraction\n"
+                                   "0.5 1970-05-02 b #fraction\n"
+                                   "-7.2 1970-05-03 c #fraction\n")
+        self.store.refresh(self.dir)
+        rows = self.store.rowset()
+        for op in ('==', '!=', '<', '>'):
+            for value in ('7.2', '7.20', '0.5', '-7.2', '10', '1e400'):
+                f = ['value{}{}'.format(op, value)]
+                self.assertEqual(
+                    [str(x) for x in self.store.rowset(True, f)],
+                    [str(x) for x in rows.filter(f)],
+                    f,
+                )
+        self.assertEqual(len(self.store.rowset(True, ['value==0.5'])), 1)
+        self.assertEqual(len(self.store.rowset(True, ['value==7.2'])), 0)
+
+    def test_group_value_fields(self):
+        rows = self.store.rowset()
+        got = self.store.group_value(('hashtag', 'month'))
+        want = {}
+        for tag, tag_rows in rows.group_by('hashtag').items():
+            for month, month_rows in tag_rows.group_by('month').items():
+                want[tag, month] = month_rows.value
+        self.assertEqual(got, want)
+        self.assertEqual(str(got['unknown', datetime.date(1970, 4, 1)]),
+                         '-0.5')
+        self.assertEqual(got['rent', datetime.date(1970, 1, 1)], -10)
+
+        # fields without an SQL column still work
+        self.assertEqual(
+            self.store.group_value(('bangtag', 'hashtag'), False,
+                                   ['value<0']),
+            {
+                ('months:3', 'water'): -15,
+                ('unknown', 'water'): -10,
+                ('unknown', 'rent'): -20,
+                ('unknown', 'unknown'): -10.5,
+            }
+        )
+
+    def test_value_empty(self):
+        for split in (True, False):
+            self.assertEqual(self.store.value(split, ['hashtag==nothing']), 0)
+
+    def test_group_value(self):
+        self.assertEqual(
+            self.store.group_value('month'),
+            {
+                datetime.date(1970, 1, 1): -15,
+                datetime.date(1970, 2, 1): -15,
+                datetime.date(1970, 3, 1): -15,
+                datetime.date(1970, 4, 1): 99.5,
+            }
+        )
+        self.assertEqual(
+            self.store.group_value('hashtag', False, ['value<0']),
+            {
+                'rent': -20,
+                'water': -25,
+                'unknown': -10.5,
+            }
+        )
+        # fields without an SQL column still work
+        self.assertEqual(
+            self.store.group_value('bangtag', False),
+            {
+                'months:3': -15,
+                'unknown': 69.5,
+            }
+        )
@@ -0,0 +1,64 @@
+""" Perform tests on the timings.py
+"""
+
+import unittest
+import json
+import sys
+import os
+
+# Ensure that we look for any modules in our local lib dir.  This allows simple
+# testing and development use.  It also does not break the case where the lib
+# has been installed properly on the normal sys.path
+sys.path.insert(0,
+                os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lib')
+                )
+# I would use site.addsitedir, but it does an append, not insert
+
+import timings # noqa
+
+
+class TestTimings(unittest.TestCase):
+    def tearDown(self):
+        timings.disable()
+
+    def test_disabled(self):
+        with timings.phase('parse', 10) as t:
+            t['rows_out'] = 5
+        self.assertEqual(timings.phases(), [])
+
+    def test_phases(self):
+        timings.enable()
+        with timings.phase('outer'):
+            with timings.phase('inner', 10) as t:
+                data = [x for x in range(100000)]
+                t['rows_out'] = len(data)
+            del data
+
+        phases = timings.phases()
+        self.assertEqual([x['phase'] for x in phases], ['outer', 'inner'])
+        self.assertEqual([x['depth'] for x in phases], [0, 1])
+        outer, inner = phases
+        self.assertEqual(inner['rows_in'], 10)
+        self.assertEqual(inner['rows_out'], 100000)
+        self.assertTrue(outer['seconds'] >= inner['seconds'])
+
+        if timings.tracemalloc is not None:
+            # the inner list was freed again, but the outer phase still
+            # saw its peak
+            self.assertTrue(inner['allocated_kb'] > 100)
+            self.assertTrue(outer['peak_kb'] >= inner['peak_kb'])
+            self.assertTrue(outer['allocated_kb'] < inner['allocated_kb'])
+
+        data = json.loads(timings.report(cmd='sum'))
+        self.assertEqual(data['cmd'], 'sum')
+        self.assertEqual(data['phases'], phases)
+
+    def test_no_memory(self):
+        timings.enable(memory=False)
+        with timings.phase('parse'):
+            pass
+        self.assertFalse('peak_kb' in timings.phases()[0])
+
+        # enabling again starts a fresh run
+        timings.enable(memory=False)
+        self.assertEqual(timings.phases(), [])
@@ -0,0 +1,100 @@
+""" Perform tests on the vectorized.py
+"""
+
+import unittest
+import datetime
+import decimal
+import sys
+import os
+
+try:
+    # python 2
+    from StringIO import StringIO
+except ImportError:
+    # python 3
+    from io import StringIO
+
+# Ensure that we look for any modules in our local lib dir.  This allows simple
+# testing and development use.  It also does not break the case where the lib
+# has been installed properly on the normal sys.path
+sys.path.insert(0,
+                os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lib')
+                )
+# I would use site.addsitedir, but it does an append, not insert
+
+import vectorized # noqa
+from rowset import RowSet # noqa
+
+
+class TestVectorized(unittest.TestCase):
+    use_numpy = False
+
+    def setUp(self):
+        f = StringIO("""
+-10 1970-02-06 comment4
+10 1970-01-05 comment1
+-10 1970-01-10 comment2 #rent
+-10.00 1970-01-01 comment3 #water
+-10 1970-03-01 comment5 #rent
+-7.20 1970-01-11 comment6 #water
+-0.5 1970-03-12 comment7
+""")
+        self.rows = RowSet()
+        self.rows.load_file(f)
+        self.cols = vectorized.Columns(self.rows, self.use_numpy)
+
+    def test_normalise(self):
+        self.assertEqual(str(vectorized._normalise(
+            vectorized.from_cents(-1700, -2))), '-17')
+        self.assertEqual(str(vectorized._normalise(
+            vectorized.from_cents(-1720, -2))), '-17.20')
+
+    def test_columns(self):
+        self.assertEqual(self.cols.tags, ['unknown', 'rent', 'water'])
+        self.assertEqual(self.cols.months, [
+            datetime.date(1970, 1, 1),
+            datetime.date(1970, 2, 1),
+            datetime.date(1970, 3, 1),
+        ])
+        self.assertEqual(list(self.cols.cents),
+                         [-1000, 1000, -1000, -1000, -1000, -720, -50])
+        self.assertEqual(list(self.cols.month_ids), [1, 0, 0, 0, 2, 0, 2])
+
+    def test_sum_by(self):
+        sums, counts, exps, last = self.cols.sum_by(
+            self.cols.month_ids, 3, self.cols.sign_mask(-1))
+        self.assertEqual(sums, [-2720, -1000, -1050])
+        self.assertEqual(counts, [3, 1, 2])
+        self.assertEqual(exps, [-2, 0, -1])
+        self.assertEqual(last[2], datetime.date(1970, 3, 12).toordinal())
+
+    def test_grid_accumulate(self):
+        months, grid, totals, running = vectorized.grid_accumulate(
+            self.rows, self.use_numpy)
+
+        for month, rows in self.rows.group_by('month').items():
+            self.assertEqual(str(totals[month]), str(rows.value))
+            for tag, tagrows in rows.group_by('hashtag').items():
+                self.assertEqual(str(grid[tag][month]['sum']),
+                                 str(tagrows.value))
+
+        self.assertEqual(str(totals['total']), str(self.rows.value))
+        self.assertEqual(
+            [str(running[x]) for x in sorted(months)],
+            ['-17.20', '-27.20', '-37.70']
+        )
+
+    def test_topay_accumulate(self):
+        alltags, months, cells = vectorized.topay_accumulate(
+            self.rows, self.use_numpy)
+        self.assertEqual(alltags, ['rent', 'unknown', 'water'])
+        self.assertEqual(
+            cells[datetime.date(1970, 1, 1)]['water'],
+            (decimal.Decimal('-17.20'), datetime.date(1970, 1, 11))
+        )
+        self.assertFalse('unknown' in cells[datetime.date(1970, 1, 1)])
+
+
+@unittest.skipIf(vectorized.numpy is None, 'numpy is not installed')
+class TestVectorizedNumpy(TestVectorized):
+    use_numpy = True
@@ -0,0 +1,107 @@
+""" Perform tests on the watch.py
+"""
+
+import unittest
+import shutil
+import tempfile
+import datetime
+import time
+import sys
+import os
+
+try:
+    # python 2
+    from StringIO import StringIO
+except ImportError:
+    # python 3
+    from io import StringIO
+
+# Ensure that we look for any modules in our local lib dir.  This allows simple
+# testing and development use.  It also does not break the case where the lib
+# has been installed properly on the normal sys.path
+sys.path.insert(0,
+                os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lib')
+                )
+# I would use site.addsitedir, but it does an append, not insert
+
+import ledgerdir # noqa
+
+try:
+    import asyncio
+    import watch
+except (ImportError, SyntaxError):  # pragma: no cover
+    # watch uses asyncio and "async def", which need python 3
+    watch = None
+
+
+@unittest.skipIf(watch is None, 'needs python 3')
+class TestWatcher(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self._write('1970-01.txt', "10 1970-01-05 comment1\n")
+        self._write('1970-02.txt', "-15 1970-02-11 #water !months:2\n")
+
+        self.rebuilds = []
+        self.log = StringIO()
+        self.watcher = watch.Watcher(
+            ledgerdir.LedgerDir(self.dir),
+            self._rebuild,
+            interval=0,
+            log=self.log,
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _write(self, name, data):
+        filename = os.path.join(self.dir, name)
+        with open(filename, 'w') as f:
+            f.write(data)
+        mtime = time.time() + len(data)
+        os.utime(filename, (mtime, mtime))
+
+    def _rebuild(self, months):
+        self.rebuilds.append(months)
+        return ['out.txt']
+
+    def test_check(self):
+        self.assertEqual(self.watcher.check(), [])
+        self.assertEqual(self.rebuilds, [])
+
+        # the months both before and after the change are affected
+        self._write('1970-02.txt', "-15 1970-04-11 #water\n")
+        self.assertEqual(self.watcher.check(), ['1970-02.txt'])
+        self.assertEqual(self.rebuilds, [set([
+            datetime.date(1970, 2, 1),
+            datetime.date(1970, 3, 1),
+            datetime.date(1970, 4, 1),
+        ])])
+        self.assertTrue(
+            self.log.getvalue().startswith('1970-02.txt: wrote out.txt in ')
+        )
+
+        os.unlink(os.path.join(self.dir, '1970-01.txt'))
+        self.assertEqual(self.watcher.check(), ['1970-01.txt'])
+        self.assertEqual(self.rebuilds[-1], set([datetime.date(1970, 1, 1)]))
+
+    def test_error(self):
+        self._write('1970-01.txt', "10 1970-01-05 comment1\nnonsense\n")
+        self.assertEqual(self.watcher.check(), [])
+        self.assertEqual(self.watcher.check(), [])
+        self.assertEqual(self.rebuilds, [])
+
+        # the error is only reported once
+        self.assertEqual(len(self.log.getvalue().splitlines()), 1)
+
+        self._write('1970-01.txt', "10 1970-01-05 comment1\n"
+                                   "20 1970-01-06 comment2\n")
+        self.assertEqual(self.watcher.check(), ['1970-01.txt'])
+
+    def test_run(self):
+        self._write('1970-01.txt', "20 1970-01-05 comment1\n")
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(self.watcher.run(iterations=2))
+        finally:
+            loop.close()
+        self.assertEqual(self.rebuilds, [set([datetime.date(1970, 1, 1)])])
@@ -0,0 +1,134 @@
+# Licensed under GPLv3
+import time
+
+# Only imported by enable(), as it takes longer to import than most runs of
+# a quick sub-command take
+tracemalloc = None
+
+
+# Record the wall time, row counts and memory use of each phase of a run.
+#
+# This is kept as module state, so that any function can mark a phase with
+# "with timings.phase(...)" without needing to be passed anything.  Until
+# enable() is called, phase() does nothing but hand out a throwaway dict.
+#
+# Phases can be nested, each phase record has its nesting depth and the
+# time of an outer phase includes all of its inner phases.  Note that
+# tracing the memory allocations makes everything noticeably slower.
+
+_enabled = False
+_phases = []
+_stack = []
+
+
+def enable(memory=True):
+    global _enabled, tracemalloc
+    _enabled = True
+    del _phases[:]
+    del _stack[:]
+    if memory:
+        try:
+            import tracemalloc as module
+        except ImportError:
+            # python 2
+            return
+        tracemalloc = module
+        tracemalloc.start()
+
+
+def disable():
+    global _enabled
+    _enabled = False
+    if tracemalloc is not None and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def _memory():
+    """Return the current and peak traced memory, or None if not tracing
+    """
+    if tracemalloc is None or not tracemalloc.is_tracing():
+        return None
+    return tracemalloc.get_traced_memory()
+
+
+def _reset_peak():
+    # reset_peak() only exists from python 3.9, without it the peak is
+    # the highest seen since tracing was started
+    if hasattr(tracemalloc, 'reset_peak'):
+        tracemalloc.reset_peak()
+
+
+class Phase(object):
+    """A context manager timing the body of its with statement.
+
+       (This is a class rather than a contextlib generator, as contextlib
+       is slow to import and this module is imported on every run)
+    """
+
+    def __init__(self, name, rows_in=None):
+        self.record = {'phase': name}
+        if rows_in is not None:
+            self.record['rows_in'] = rows_in
+
+    def __enter__(self):
+        if not _enabled:
+            return self.record
+
+        record = self.record
+        record['depth'] = len(_stack)
+        _phases.append(record)
+
+        self.memory = _memory()
+        if self.memory is not None:
+            if _stack:
+                # remember the peak of the outer phase so far, before the
+                # peak is reset for this phase
+                parent = _stack[-1]
+                parent['_peak'] = max(parent['_peak'], self.memory[1])
+            record['_peak'] = 0
+            _reset_peak()
+
+        _stack.append(record)
+        self.start = time.time()
+        return record
+
+    def __exit__(self, *exc):
+        if not _enabled:
+            return
+
+        record = self.record
+        record['seconds'] = round(time.time() - self.start, 6)
+        _stack.pop()
+
+        end = _memory()
+        if end is not None:
+            peak = max(record.pop('_peak'), end[1])
+            record['peak_kb'] = peak // 1024
+            record['allocated_kb'] = (end[0] - self.memory[0]) // 1024
+            if _stack:
+                parent = _stack[-1]
+                parent['_peak'] = max(parent['_peak'], peak)
+
+
+def phase(name, rows_in=None):
+    """Time the body of the with statement as the named phase.  The body can
+       set 'rows_out' (or anything else) in the dict given by the with
+    """
+    return Phase(name, rows_in)
+
+
+def phases():
+    """Return the finished phases, in the order they were started
+    """
+    return [x for x in _phases if 'seconds' in x]
+
+
+def report(**extra):
+    """Return the recorded phases as a single line of JSON, along with any
+       extra fields given
+    """
+    import json
+
+    data = dict(extra)
+    data['phases'] = phases()
+    return json.dumps(data, sort_keys=True)
@@ -0,0 +1,327 @@
+# Licensed under GPLv3
+import datetime
+import re
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from row import Row, from_cents
+from rowset import RowSet
+
+
+# The aggregations behind the grid, stats and topay reports, done on whole
+# columns of integer cents instead of one Decimal at a time.
+#
+# The results must be identical to the Decimal code, including how each
+# Decimal is rendered (eg: "-7.20" vs "-7.2").  Summing Decimals gives a
+# result with the smallest exponent of all the values, so alongside the
+# sum of the cents, the smallest exponent in each group is tracked too.
+#
+# If numpy is not installed, the same column operations are done with
+# plain python lists.
+
+
+def _normalise(value):
+    """Apply the same normalisation as RowSet.value
+    """
+    if int(value) == value:
+        value = value.to_integral_exact()
+    return value
+
+
+def _month_date(ordinal):
+    return datetime.date(ordinal // 12, ordinal % 12 + 1, 1)
+
+
+class Columns(object):
+    """The rows of a RowSet, pulled apart into columns.  The tag column
+       holds the hashtag of each row, or the result of the label function
+       if one is given
+    """
+
+    def __init__(self, rows, use_numpy=True, label=None):
+        self.numpy = use_numpy and numpy is not None
+
+        tag_index = {}
+        cents = []
+        exponents = []
+        tags = []
+        months = []
+        dates = []
+        for row in rows:
+            tag = row.hashtag if label is None else label(row)
+            if tag is None:
+                tag = 'unknown'
+            if tag not in tag_index:
+                tag_index[tag] = len(tag_index)
+
+            date = row.date
+            cents.append(row.cents)
+            exponents.append(row.exponent)
+            tags.append(tag_index[tag])
+            months.append(date.year * 12 + date.month - 1)
+            dates.append(date.toordinal())
+
+        self.tags = sorted(tag_index, key=tag_index.get)
+
+        # number the months in chronological order
+        month_list = sorted(set(months))
+        month_index = dict((m, i) for i, m in enumerate(month_list))
+        self.months = [_month_date(m) for m in month_list]
+
+        if self.numpy:
+            self.cents = numpy.array(cents, dtype=numpy.int64)
+            self.exponents = numpy.array(exponents, dtype=numpy.int64)
+            self.tag_ids = numpy.array(tags, dtype=numpy.int64)
+            self.month_ids = numpy.array([month_index[m] for m in months],
+                                         dtype=numpy.int64)
+            self.dates = numpy.array(dates, dtype=numpy.int64)
+        else:
+            self.cents = cents
+            self.exponents = exponents
+            self.tag_ids = tags
+            self.month_ids = [month_index[m] for m in months]
+            self.dates = dates
+
+    def month_tag_ids(self):
+        """Return a column combining the month and the tag into one key
+        """
+        ntags = len(self.tags)
+        if self.numpy:
+            return self.month_ids * ntags + self.tag_ids
+        return [m * ntags + t for m, t in zip(self.month_ids, self.tag_ids)]
+
+    def sign_mask(self, sign):
+        """Return a mask selecting the rows with values of the given sign
+        """
+        if self.numpy:
+            return numpy.sign(self.cents) == sign
+        return [(c > 0) - (c < 0) == sign for c in self.cents]
+
+    def tag_mask(self, func):
+        """Return a mask selecting the rows whose tag name passes func
+        """
+        lookup = [bool(func(tag)) for tag in self.tags]
+        if self.numpy:
+            return numpy.array(lookup, dtype=bool)[self.tag_ids]
+        return [lookup[t] for t in self.tag_ids]
+
+    def mask_and(self, *masks):
+        if self.numpy:
+            return numpy.logical_and.reduce(masks)
+        return [all(x) for x in zip(*masks)]
+
+    def sum_by(self, keys, nkeys, mask=None):
+        """Group the rows by the given key column and return a list per key
+           of the summed cents, the count of rows, the smallest exponent and
+           the latest date ordinal
+        """
+        cents = self.cents
+        exponents = self.exponents
+        dates = self.dates
+
+        if self.numpy:
+            if mask is not None:
+                keys = keys[mask]
+                cents = cents[mask]
+                exponents = exponents[mask]
+                dates = dates[mask]
+
+            sums = numpy.zeros(nkeys, dtype=numpy.int64)
+            numpy.add.at(sums, keys, cents)
+            counts = numpy.bincount(keys, minlength=nkeys)
+            minexp = numpy.zeros(nkeys, dtype=numpy.int64)
+            numpy.minimum.at(minexp, keys, exponents)
+            last = numpy.zeros(nkeys, dtype=numpy.int64)
+            numpy.maximum.at(last, keys, dates)
+            return sums.tolist(), counts.tolist(), minexp.tolist(), \
+                last.tolist()
+
+        sums = [0] * nkeys
+        counts = [0] * nkeys
+        minexp = [0] * nkeys
+        last = [0] * nkeys
+        if mask is None:
+            mask = [True] * len(cents)
+        for k, c, e, d, m in zip(keys, cents, exponents, dates, mask):
+            if not m:
+                continue
+            sums[k] += c
+            counts[k] += 1
+            minexp[k] = min(minexp[k], e)
+            last[k] = max(last[k], d)
+        return sums, counts, minexp, last
+
+    def cumulative(self, sums, exponents):
+        """Return the running totals of the given per key sums, as the
+           grid rendering would calculate them
+        """
+        if self.numpy:
+            sums = numpy.array(sums, dtype=numpy.int64)
+            running = numpy.cumsum(sums).tolist()
+            exponents = numpy.minimum.accumulate(
+                numpy.array(exponents, dtype=numpy.int64)).tolist()
+        else:
+            running = []
+            total = 0
+            for c in sums:
+                total += c
+                running.append(total)
+            minexp = 0
+            accumulated = []
+            for e in exponents:
+                minexp = min(minexp, e)
+                accumulated.append(minexp)
+            exponents = accumulated
+
+        return [_normalise(from_cents(c, e))
+                for c, e in zip(running, exponents)]
+
+
+def _normalised_exponent(cents, exponent):
+    """The exponent of a group sum, after RowSet.value has normalised it
+    """
+    if cents % 100 == 0:
+        return 0
+    return exponent
+
+
+def grid_accumulate(rows, use_numpy=True, label=None):
+    """Accumulate the rows into month+tag buckets - returning the same data
+       as ledger.grid_accumulate()
+    """
+    cols = Columns(rows, use_numpy, label)
+    nmonths = len(cols.months)
+    ntags = len(cols.tags)
+
+    sums, counts, exps, _ = cols.sum_by(cols.month_tag_ids(), nmonths * ntags)
+    msums, _, mexps, _ = cols.sum_by(cols.month_ids, nmonths)
+
+    grid = {}
+    totals = {}
+    for i, month in enumerate(cols.months):
+        totals[month] = _normalise(from_cents(msums[i], mexps[i]))
+        for j, tag in enumerate(cols.tags):
+            k = i * ntags + j
+            if not counts[k]:
+                continue
+            if tag not in grid:
+                grid[tag] = {}
+            value = _normalise(from_cents(sums[k], exps[k]))
+            grid[tag][month] = {'sum': value}
+
+    totals['total'] = _normalise(from_cents(sum(msums), min([0] + mexps)))
+
+    running = cols.cumulative(
+        msums,
+        [_normalised_exponent(c, e) for c, e in zip(msums, mexps)]
+    )
+    running_totals = dict(zip(cols.months, running))
+
+    return set(cols.months), grid, totals, running_totals
+
+
+def topay_accumulate(rows, use_numpy=True):
+    """Accumulate the outgoing rows into month+tag buckets - returning the
+       same data as ledger.topay_accumulate()
+    """
+    cols = Columns(rows, use_numpy)
+    nmonths = len(cols.months)
+    ntags = len(cols.tags)
+
+    mask = cols.sign_mask(-1)
+    sums, counts, exps, last = cols.sum_by(
+        cols.month_tag_ids(), nmonths * ntags, mask)
+
+    alltags = set()
+    cells = {}
+    for i, month in enumerate(cols.months):
+        for j, tag in enumerate(cols.tags):
+            k = i * ntags + j
+            if not counts[k]:
+                continue
+            alltags.add(tag)
+            if month not in cells:
+                cells[month] = {}
+            cells[month][tag] = (
+                _normalise(from_cents(sums[k], exps[k])),
+                datetime.date.fromordinal(last[k]),
+            )
+
+    return sorted(alltags), sorted(cells), cells
+
+
+def _fake_rowset(months, sums, counts, exps):
+    """Return a RowSet with one fake row per month holding the sum for that
+       month.  This has the same value as the real rows and the same
+       months present when grouped
+    """
+    result = RowSet()
+    for month, c, n, e in zip(months, sums, counts, exps):
+        if n:
+            result.append(Row.from_cents(c, month, 'fake row', e))
+    return result
+
+
+def stats_accumulate(rows, use_numpy=True):
+    """Calculate the per month stats - returning the same data as
+       ledger.stats_accumulate()
+    """
+    cols = Columns(rows, use_numpy)
+    nmonths = len(cols.months)
+    ntags = len(cols.tags)
+
+    is_dues = cols.tag_mask(lambda tag: re.search('^dues:', tag, re.I))
+    is_not_dues = cols.tag_mask(lambda tag: not re.search('^dues:', tag, re.I))
+    masks = {
+        'incoming': cols.sign_mask(1),
+        'outgoing': cols.sign_mask(-1),
+        'dues': is_dues,
+        'other': cols.mask_and(cols.sign_mask(1), is_not_dues),
+    }
+    sums = {}
+    for name, mask in masks.items():
+        sums[name] = cols.sum_by(cols.month_ids, nmonths, mask)
+
+    # which tags have dues paid in each month
+    _, counts, _, _ = cols.sum_by(cols.month_tag_ids(), nmonths * ntags,
+                                  is_dues)
+    members = [
+        set(j for j in range(ntags) if counts[i * ntags + j])
+        for i in range(nmonths)
+    ]
+
+    rel_months = [Row._rel_months(month) for month in cols.months]
+
+    def stats_months(wanted):
+        r = {}
+        for name in masks:
+            s, n, e, _ = sums[name]
+            r[name] = _fake_rowset(
+                [cols.months[i] for i in wanted],
+                [s[i] for i in wanted],
+                [n[i] for i in wanted],
+                [e[i] for i in wanted],
+            )
+        r['members'] = len(set().union(*[members[i] for i in wanted]))
+        if r['members']:
+            r['ARPM'] = int(r['dues'].value / r['members'])
+        else:
+            r['ARPM'] = -1
+        return r
+
+    result = {}
+    months = []
+    for i, month in enumerate(cols.months):
+        if rel_months[i] < 0:
+            result[month] = stats_months([i])
+            months.append(month)
+
+    result['Total'] = stats_months(
+        [i for i in range(nmonths) if rel_months[i] < 0])
+    result['MonthTD'] = stats_months(
+        [i for i in range(nmonths) if rel_months[i] == 0])
+
+    return result, months
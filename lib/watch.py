@@ -0,0 +1,91 @@
+# Licensed under GPLv3
+import asyncio
+import time
+import sys
+
+
+# Polling the modification times is simple, portable and plenty fast enough
+# for a directory holding a few hundred small text files.  This module uses
+# asyncio and so needs python 3
+
+
+class Watcher(object):
+    """Watch a LedgerDir for changed files and call rebuild() each time the
+       ledger changes.
+
+       rebuild is given the set of months touched by the changed files -
+       both before and after the change, as a split row can move between
+       months - and returns a list of the outputs it wrote
+    """
+
+    def __init__(self, ledger, rebuild, interval=1.0, log=None):
+        self.ledger = ledger
+        self.rebuild = rebuild
+        self.interval = interval
+        self.log = log or sys.stderr
+        self.error = None
+
+        self.months = {}
+        for name, entry in ledger.files.items():
+            self.months[name] = entry.months
+
+    def check(self):
+        """Look for changes once, rebuilding if needed.  Returns the list of
+           changed file names
+        """
+        start = time.time()
+        try:
+            changed = self.ledger.refresh()
+        except Exception as e:
+            # the file is probably being edited right now and could be
+            # broken in any number of ways, so only complain once and wait
+            # for it to change again
+            if str(e) != self.error:
+                self.error = str(e)
+                self.log.write("{}\n".format(e))
+            return []
+        self.error = None
+
+        if not changed:
+            return changed
+
+        months = set()
+        for name in changed:
+            months |= self.months.pop(name, set())
+            entry = self.ledger.files.get(name)
+            if entry is not None:
+                self.months[name] = entry.months
+                months |= self.months[name]
+        loaded = time.time()
+
+        written = self.rebuild(months)
+        done = time.time()
+
+        self.log.write(
+            "{}: wrote {} in {:.1f}ms (load {:.1f}ms, build {:.1f}ms)\n"
+            .format(
+                ' '.join(changed),
+                ' '.join(written) or 'nothing',
+                (done - start) * 1000,
+                (loaded - start) * 1000,
+                (done - loaded) * 1000,
+            )
+        )
+        return changed
+
+    async def run(self, iterations=None):
+        """Poll for changes every interval seconds, forever or for the given
+           number of iterations
+        """
+        while iterations is None or iterations > 0:
+            await asyncio.sleep(self.interval)
+            self.check()
+            if iterations is not None:
+                iterations -= 1
+
+    def run_forever(self):  # pragma: no cover
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(self.run())
+        finally:
+            loop.close()
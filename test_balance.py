@@ -4,14 +4,20 @@
 
 import unittest
 import datetime
+import tempfile
+import shutil
 import sys
 import json
+import os
 if sys.version_info[0] == 2:  # pragma: no cover
     import mock
 else:
     from unittest import mock  # pragma: no cover
 
 import balance # noqa
+import ledger # noqa
+import ledgerdir # noqa
+import render # noqa
 
 
 class fakedatetime(datetime.datetime):
@@ -33,7 +39,7 @@ class TestTime(unittest.TestCase):
 
     def test_iso8601(self):
         self.assertEqual(
-            balance._iso8601_str(fakedatetime.now()),
+            render.iso8601_str(fakedatetime.now()),
             "1990-05-04T20:12:12+08:00"
             )
 
@@ -96,7 +102,7 @@ class TestMisc(unittest.TestCase):
                     datetime.date(1970, 3, 1): -45,
                 }
             )
-        got = balance.grid_accumulate(self.rows)
+        got = ledger.grid_accumulate(self.rows)
 
         self.assertEqual(expected, got)
 
@@ -145,10 +151,10 @@ class TestMisc(unittest.TestCase):
             "TOTAL:       -45",
         ]
 
-        (m, grid, total, runtotals) = balance.grid_accumulate(self.rows)
+        (m, grid, total, runtotals) = ledger.grid_accumulate(self.rows)
         t = self.rows.group_by('hashtag')
 
-        got = balance.grid_render(m, t, grid, total, runtotals).split("\n")
+        got = render.grid_render(m, t, grid, total, runtotals).split("\n")
         self.assertEqual(got, expect)
 
 
@@ -171,6 +177,10 @@ class TestSubp(unittest.TestCase):
 
         self.rows = balance.RowSet()
         self.rows.append(r)
+        self.engine = 'python'
+        self.stats_cache = None
+        self.by_account = False
+        self.ledger = None
 
     def tearDown(self):
         self.rows = None
@@ -398,3 +408,586 @@ class TestSubp(unittest.TestCase):
 
         got = balance.subp_statstsv(self).split("\n")
         self.assertEqual(got, expect)
+
+    @mock.patch('balance.datetime.datetime', fakedatetime)
+    def test_stats_cache(self):
+        expect = balance.subp_statstsv(self)
+
+        self.stats_cache = {}
+        self.assertEqual(balance.subp_statstsv(self), expect)
+        if self.engine != 'python':
+            # the vectorised engine is fast enough to not need the cache
+            self.assertEqual(self.stats_cache, {})
+            return
+        self.assertEqual(list(self.stats_cache.keys()),
+                         [datetime.date(1990, 4, 1)])
+
+        # the cached months are reused as they are
+        self.stats_cache[datetime.date(1990, 4, 1)]['members'] = 99
+        self.assertNotEqual(balance.subp_statstsv(self), expect)
+        self.assertEqual(
+            self.stats_cache[datetime.date(1990, 4, 1)]['members'], 99)
+
+
+class TestWatch(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.dir, 'cash'))
+        self._write('1990-04.txt', "500 1990-04-03 #dues:test1\n"
+                                   "-12500 1990-04-15 #bills:rent\n")
+        self._write('1990-05.txt', "500 1990-05-02 #dues:test1\n")
+
+        self.args = balance.argparser_create().parse_args([
+            '--dir', os.path.join(self.dir, 'cash'),
+            'watch', '--output', os.path.join(self.dir, 'pages'),
+        ])
+        os.mkdir(self.args.output)
+        self.ledger = ledgerdir.LedgerDir(self.args.dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _write(self, name, data):
+        with open(os.path.join(self.dir, 'cash', name), 'w') as f:
+            f.write(data)
+
+    @mock.patch('balance.datetime.datetime', fakedatetime)
+    def test_rebuild(self):
+        self.assertEqual(
+            balance.watch_rebuild(self.args, self.ledger),
+            ['payments.json', 'stats.tsv', 'index.html']
+        )
+        with open(os.path.join(self.args.output, 'payments.json')) as f:
+            self.assertEqual(json.loads(f.read()), {'dues:test1': '1990-05'})
+
+        # nothing changed, so nothing is written
+        self.assertEqual(
+            balance.watch_rebuild(self.args, self.ledger,
+                                  set([datetime.date(1990, 4, 1)])),
+            []
+        )
+
+        self._write('1990-05.txt', "500 1990-05-02 #dues:test1\n"
+                                   "500 1990-06-02 #dues:test2\n")
+        self.assertEqual(self.ledger.refresh(), ['1990-05.txt'])
+
+        # a change only in a future month does not touch the stats
+        stats = self.args.stats_cache[datetime.date(1990, 4, 1)]
+        self.assertEqual(
+            balance.watch_rebuild(self.args, self.ledger,
+                                  set([datetime.date(1990, 6, 1)])),
+            ['payments.json', 'index.html']
+        )
+        self.assertTrue(
+            self.args.stats_cache[datetime.date(1990, 4, 1)] is stats)
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        with open(os.path.join(self.dir, '1990-04.txt'), 'w') as f:
+            f.write("500 1990-04-03 #dues:test1\n"
+                    "-12500 1990-04-15 #bills:rent\n"
+                    "-300 1990-04-15 #bills:water !months:2\n"
+                    "20000 1990-04-27 balance books\n")
+        self.batch = os.path.join(self.dir, 'batch')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _args(self, *argv):
+        return balance.argparser_create().parse_args(
+            ['--dir', self.dir] + list(argv))
+
+    def _run(self, argv):
+        args = self._args(*argv)
+        balance.load_rows(args)
+        return args.func(args)
+
+    def test_batch_argv(self):
+        self.assertEqual(
+            balance.batch_argv("grid --filter 'month>1990-01' --nosplit -x"),
+            ['--filter', 'month>1990-01', '--nosplit', 'grid', '-x']
+        )
+        self.assertEqual(balance.batch_argv('sum --filter=value>0'),
+                         ['--filter=value>0', 'sum'])
+
+    def test_batch(self):
+        lines = [
+            'grid --separate_inout --filter_hack 100000',
+            '# a comment',
+            '',
+            'sum --filter value>0',
+            'grid --filter_hack 100000 --nosplit',
+            'grid --filter_hack 100000',
+            'csv',
+        ]
+        with open(self.batch, 'w') as f:
+            f.write('\n'.join(lines))
+
+        args = self._args('batch', self.batch, '--delimiter', '-- {number}')
+        got = balance.subp_batch(args)
+        self.assertFalse(args.failed)
+
+        want = []
+        for number, line in enumerate(lines, 1):
+            if not line or line.startswith('#'):
+                continue
+            want.append('-- {}'.format(number))
+            want.append(self._run(balance.batch_argv(line)))
+        self.assertEqual(got, '\n'.join(want))
+
+    def test_batch_errors(self):
+        with open(self.batch, 'w') as f:
+            f.write('serve\nsum\nbogus\n')
+
+        args = self._args('batch', self.batch)
+        with mock.patch('sys.stderr'):
+            got = balance.subp_batch(args)
+        self.assertTrue(args.failed)
+        self.assertEqual(
+            got, '==> serve <==\n==> sum <==\n7700\n==> bogus <=='
+        )
+
+
+class TestArchive(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        for name, data in (('1990-04.txt', "500 1990-04-03 #dues:test1\n"),
+                           ('1990-05.txt', "700 1990-05-02 #dues:test2\n")):
+            with open(os.path.join(self.dir, name), 'w') as f:
+                f.write(data)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _args(self, *argv):
+        return balance.argparser_create().parse_args(
+            ['--dir', self.dir] + list(argv))
+
+    def test_archive(self):
+        # archive the months before 1990-05
+        today = datetime.date.today()
+        months = today.year * 12 + today.month - (1990 * 12 + 5)
+        args = self._args('archive', '--months', str(months), '--format',
+                          'bz2')
+        self.assertEqual(balance.subp_archive(args),
+                         'archived 1990-04.txt.bz2')
+        self.assertEqual(balance.subp_archive(args), 'Nothing to archive')
+
+        self.assertEqual(sorted(os.listdir(self.dir)),
+                         ['1990-04.txt.bz2', '1990-05.txt', 'archive.json'])
+
+        args = self._args('sum')
+        balance.load_rows(args)
+        self.assertEqual(balance.subp_sum(args), '1200')
+
+
+class TestRollups(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.rollups = os.path.join(self.dir, 'rollups')
+        with open(os.path.join(self.dir, '1990-04.txt'), 'w') as f:
+            f.write("500 1990-04-03 #dues:test1\n"
+                    "700 1990-04-05 #dues:test1\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _load(self, *argv):
+        args = balance.argparser_create().parse_args(
+            ['--dir', self.dir, '--rollups', self.rollups] + list(argv))
+        balance.load_rows(args)
+        return args
+
+    def test_rollups(self):
+        args = balance.argparser_create().parse_args(
+            ['--dir', self.dir, 'rollup', self.rollups])
+        self.assertEqual(balance.subp_rollup(args), 'wrote 1990')
+
+        args = self._load('sum')
+        self.assertEqual(len(args.rows), 1)
+        self.assertEqual(balance.subp_sum(args), '1200')
+
+        # the sub-commands needing the real rows, or filtering them, ignore
+        # the rollups
+        self.assertEqual(len(self._load('csv').rows), 2)
+        self.assertEqual(len(self._load('--filter', 'value>0', 'sum').rows),
+                         2)
+
+
+class TestSearch(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.index = os.path.join(self.dir, 'index.json')
+        with open(os.path.join(self.dir, '1990-04.txt'), 'w') as f:
+            f.write("500 1990-04-03 Alice from PayPal #dues:alice\n"
+                    "-2 1990-04-03 PayPal fees #fees:paypal\n")
+        with open(os.path.join(self.dir, '1990-05.txt'), 'w') as f:
+            f.write("500 1990-05-02 Bob by transfer #dues:bob\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _args(self, *argv):
+        return balance.argparser_create().parse_args(
+            ['--dir', self.dir, '--comment_index', self.index] + list(argv))
+
+    def test_search(self):
+        args = self._args('search', 'paypal', 'NOT', 'fees', 'OR', 'bob')
+        self.assertEqual(balance.subp_search(args), "\n".join([
+            "500 1990-04-03 Alice from PayPal #dues:alice",
+            "500 1990-05-02 Bob by transfer #dues:bob",
+        ]))
+        self.assertTrue(os.path.exists(self.index))
+
+        args = self._args('--filter', 'value>0', 'search', 'paypal')
+        self.assertEqual(balance.subp_search(args),
+                         "500 1990-04-03 Alice from PayPal #dues:alice")
+
+    def test_load_rows(self):
+        args = self._args('--filter', 'hashtag=~^dues:b', 'csv')
+        balance.load_rows(args)
+        self.assertEqual([str(x) for x in args.rows],
+                         ["500 1990-05-02 Bob by transfer #dues:bob"])
+
+
+class TestAccounts(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        for account, data in (
+                ('bank', "-200 1990-04-03 to petty cash\n"),
+                ('petty', "200 1990-04-04 from the bank\n"
+                          "-20 1990-04-05 #bills:misc\n")):
+            os.makedirs(os.path.join(self.dir, account))
+            with open(os.path.join(self.dir, account, '1990-04.txt'),
+                      'w') as f:
+                f.write(data)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _load(self, *argv):
+        args = balance.argparser_create().parse_args(
+            ['--account', 'bank=' + os.path.join(self.dir, 'bank'),
+             '--account', 'petty=' + os.path.join(self.dir, 'petty')]
+            + list(argv))
+        balance.load_rows(args)
+        return args
+
+    def test_accounts(self):
+        args = self._load('--filter', 'account==petty', 'sum')
+        self.assertEqual(balance.subp_sum(args), '180')
+
+        args = self._load('transfers')
+        self.assertEqual(
+            balance.subp_transfers(args),
+            '1990-04-03 200 bank -> petty 1990-04-04: to petty cash / '
+            'from the bank')
+
+
+class TestReconcile(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        with open(os.path.join(self.dir, '1990-04.txt'), 'w') as f:
+            f.write("500 1990-04-03 #dues:test1\n"
+                    "-300 1990-04-05 #bills:water !months:3\n")
+        self.statement = os.path.join(self.dir, 'statement.csv')
+        with open(self.statement, 'w') as f:
+            f.write("Date,Description,Amount\n"
+                    "1990-04-04,Direct credit,500.00\n"
+                    "1990-04-06,Water,-300.00\n"
+                    "1990-04-30,Bank fee,-2.00\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_reconcile(self):
+        args = balance.argparser_create().parse_args(
+            ['--dir', self.dir, 'reconcile', '--statement', self.statement])
+        self.assertEqual(balance.subp_reconcile(args), "\n".join([
+            "matched 2",
+            "unmatched in statement 1",
+            "  line 4: -2 1990-04-30 Bank fee",
+        ]))
+
+
+class TestPushdown(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        with open(os.path.join(self.dir, '1990-04.txt'), 'w') as f:
+            f.write("500 1990-04-03 #dues:test1\n"
+                    "-7.20 1990-04-30 #bills:water !months:2\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _run(self, *argv):
+        args = balance.argparser_create().parse_args(
+            ['--dir', self.dir] + list(argv))
+        balance.load_rows(args)
+        return args, args.func(args)
+
+    def test_pushdown(self):
+        for argv in (['sum'], ['--filter', 'value<0', 'grid'], ['grid'],
+                     # -4.2 is not exactly a float
+                     ['--filter', 'value==-4.2', 'sum'],
+                     ['--filter', 'value!=-4.2', 'sum'],
+                     ['--filter', 'value<-4.2', 'sum'],
+                     ['--filter', 'value>-4.2', 'sum'],
+                     ['--nosplit', '--filter', 'value==-7.2', 'sum']):
+            args, got = self._run('--sqlite', ':memory:', *argv)
+            # the database added up the values, no rows were loaded
+            self.assertTrue(args.ledger is not None)
+            self.assertFalse(hasattr(args, 'rows'))
+            self.assertEqual(got, self._run(*argv)[1])
+
+        self.assertEqual(self._run('--sqlite', ':memory:', 'sum')[1],
+                         '492.80')
+
+    def test_pushdown_binary(self):
+        filename = os.path.join(self.dir, 'ledger.bin')
+        self._run('export_binary', filename)
+        for argv in (['sum'], ['--filter', 'value<0', 'grid'], ['grid'],
+                     ['--nosplit', 'grid']):
+            args, got = self._run('--load_binary', filename, *argv)
+            # the columns were added up, no rows were loaded
+            self.assertTrue(args.ledger is not None)
+            self.assertFalse(hasattr(args, 'rows'))
+            self.assertEqual(got, self._run(*argv)[1])
+
+
+class TestDupes(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        for name, data in (
+                ('1990-04.txt', "500 1990-04-30 #dues:test1\n"
+                                "-5 1990-04-30 #bills:misc\n"),
+                ('1990-05.txt', "500 1990-04-30 #dues:test1\n")):
+            with open(os.path.join(self.dir, name), 'w') as f:
+                f.write(data)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _args(self, *argv):
+        return balance.argparser_create().parse_args(
+            ['--dir', self.dir] + list(argv))
+
+    def test_dupes(self):
+        self.assertEqual(balance.subp_dupes(self._args('dupes')), "\n".join([
+            "1990-04.txt: 500 1990-04-30 #dues:test1",
+            "1990-05.txt: 500 1990-04-30 #dues:test1",
+        ]))
+        self.assertEqual(
+            balance.subp_dupes(self._args('--filter', 'value<0', 'dupes')),
+            'No duplicates found')
+
+    def test_check_dupes(self):
+        args = self._args('--check_dupes', 'sum')
+        with mock.patch('sys.stderr') as stderr:
+            balance.load_rows(args)
+        self.assertEqual(len(args.rows), 3)
+        stderr.write.assert_called_once_with(
+            'Warning: possible duplicate rows:\n'
+            '1990-04.txt: 500 1990-04-30 #dues:test1\n'
+            '1990-05.txt: 500 1990-04-30 #dues:test1\n')
+
+
+class TestLint(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_lint(self):
+        filename = os.path.join(self.dir, '1990-04.txt')
+        with open(filename, 'w') as f:
+            f.write("500 1990-04-03 #dues:test1\n")
+        args = balance.argparser_create().parse_args(
+            ['--dir', self.dir, 'lint'])
+        self.assertEqual(balance.subp_lint(args),
+                         'No problems found in 1 files')
+        self.assertFalse(args.failed)
+
+        with open(filename, 'a') as f:
+            f.write("500 1990-04-31 #dues:test1\n")
+        self.assertEqual(balance.subp_lint(args),
+                         filename + ':2: bad date "1990-04-31"')
+        self.assertTrue(args.failed)
+
+
+class TestMembers(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        with open(os.path.join(self.dir, '1990-04.txt'), 'w') as f:
+            f.write("500 1990-03-30 #dues:test1\n"
+                    "500 1990-04-03 #dues:test1\n"
+                    "-5 1990-04-30 #bills:misc\n")
+        self.door = os.path.join(self.dir, 'door.csv')
+        with open(self.door, 'w') as f:
+            f.write("name,hashtag,last_login\n"
+                    "a,test1,1990-05-02 10:00:00\n"
+                    "b,test2,1990-04-02 10:00:00\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_members(self):
+        args = balance.argparser_create().parse_args(
+            ['--dir', self.dir, 'members'])
+        self.assertEqual(balance.subp_members(args), "\r\n".join([
+            "handle,month_last_paid,streak,status,1990-03,1990-04",
+            "test1,1990-04,2,lapsed,500,500",
+            "",
+        ]))
+
+    def test_members_door(self):
+        args = balance.argparser_create().parse_args(
+            ['--dir', self.dir, 'members', '--door', self.door])
+        self.assertEqual(balance.subp_members(args), "\r\n".join([
+            "handle,month_last_paid,streak,status,last_seen,1990-03,1990-04",
+            "test1,1990-04,2,lapsed,1990-05,500,500",
+            "test2,,0,unpaid,1990-04,,",
+            "",
+        ]))
+
+
+class TestCohorts(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        with open(os.path.join(self.dir, '1990-03.txt'), 'w') as f:
+            f.write("1000 1990-03-30 #dues:test1 !months:2\n"
+                    "500 1990-04-03 #dues:test2\n"
+                    "-5 1990-04-30 #bills:misc\n")
+        self.state = os.path.join(self.dir, 'state.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_cohorts(self):
+        want = "\r\n".join([
+            "cohort,members,1",
+            "1990-03,1,1",
+            "1990-04,1,",
+            "",
+        ])
+        for argv in (['cohorts'], ['--nosplit', 'cohorts'],
+                     ['cohorts', '--state', self.state]):
+            args = balance.argparser_create().parse_args(
+                ['--dir', self.dir] + argv)
+            self.assertEqual(balance.subp_cohorts(args), want)
+        self.assertTrue(os.path.exists(self.state))
+
+        args = balance.argparser_create().parse_args(
+            ['--dir', self.dir, '--filter', 'hashtag=~test2', 'cohorts',
+             '--state', self.state])
+        self.assertEqual(balance.subp_cohorts(args), "\r\n".join([
+            "cohort,members",
+            "1990-04,1",
+            "",
+        ]))
+
+
+class TestForecast(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        # the two months before this one
+        month = datetime.date.today().replace(day=1)
+        months = [month - datetime.timedelta(1)]
+        months.insert(0, months[0].replace(day=1) - datetime.timedelta(1))
+        with open(os.path.join(self.dir, 'ledger.txt'), 'w') as f:
+            for date in months:
+                f.write("600 {:%Y-%m}-01 #dues:test1\n".format(date))
+                f.write("-500 {:%Y-%m}-01 #bills:rent\n".format(date))
+        self.next = month.strftime('%Y-%m')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_forecast(self):
+        for engine in ('python', 'numpy'):
+            args = balance.argparser_create().parse_args(
+                ['--dir', self.dir, '--engine', engine, 'forecast',
+                 '--months', '2', '--scenarios', '10', '--seed', '1'])
+            lines = balance.subp_forecast(args).split("\n")
+            self.assertEqual(lines[:4], [
+                "running balance 200 at the start of " + self.next,
+                "recurring bills",
+                "  bills:rent                     -500 every 1 months, "
+                "next " + self.next,
+                "members 1, joining 0.1 and leaving 0.0% a month",
+            ])
+            self.assertEqual(len(lines), 12)
+
+
+class TestArgparser(unittest.TestCase):
+    def test_find_cmd(self):
+        find = balance.argparser_find_cmd
+        self.assertEqual(find(['party']), 'party')
+        self.assertEqual(find(['--split', 'grid', '--separate_inout']),
+                         'grid')
+        # option values that look like sub-commands are skipped
+        self.assertEqual(find(['--dir', 'sum', '--filter=party', 'csv']),
+                         'csv')
+        self.assertEqual(find([]), None)
+        self.assertEqual(find(['--help']), None)
+        self.assertEqual(find(['nonsense']), None)
+        self.assertEqual(find(['--engine', 'bad', 'sum']), None)
+
+    def test_create_cmd(self):
+        argv = ['--nosplit', 'grid', '--filter_hack', '5']
+        want = balance.argparser_create().parse_args(argv)
+        got = balance.argparser_create('grid').parse_args(argv)
+        self.assertEqual(vars(got), vars(want))
+
+        with self.assertRaises(SystemExit):
+            with mock.patch('sys.stderr'):
+                balance.argparser_create('grid').parse_args(['sum'])
+
+
+class TestCacheKey(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self._write("500 1990-04-03 #dues:test1\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _write(self, data):
+        with open(os.path.join(self.dir, '1990-04.txt'), 'w') as f:
+            f.write(data)
+
+    def _key(self, *argv):
+        args = balance.argparser_create().parse_args(
+            ['--dir', self.dir, '--cache', '/nonexistent'] + list(argv))
+        return balance.cache_key(args)
+
+    def test_cache_key(self):
+        key = self._key('--split', 'stats')
+        self.assertEqual(self._key('stats'), key)
+        self.assertEqual(self._key('--cache_size', '1', 'stats'), key)
+
+        self.assertNotEqual(self._key('--nosplit', 'stats'), key)
+        self.assertNotEqual(self._key('statstsv'), key)
+        self.assertNotEqual(self._key('--filter', 'month=1990-04', 'stats'),
+                            key)
+        self.assertNotEqual(self._key('grid'),
+                            self._key('grid', '--filter_hack', '410'))
+
+        with mock.patch('balance.datetime.date') as date:
+            date.today.return_value = datetime.date(1990, 5, 4)
+            self.assertNotEqual(self._key('stats'), key)
+
+        self._write("600 1990-04-03 #dues:test1\n")
+        self.assertNotEqual(self._key('stats'), key)
+
+
+class TestSubpNumpy(TestSubp):
+    """Run all the same sub-command tests using the vectorised engine, which
+       must give identical results (with or without numpy installed)
+    """
+    def setUp(self):
+        super(TestSubpNumpy, self).setUp()
+        self.engine = 'numpy'